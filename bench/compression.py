@@ -0,0 +1,110 @@
+"""
+Bytes on the wire and CPU cost of compressing the biggest staff responses.
+
+    python bench/compression.py [--orders 300] [--items 3] [--repeat 20]
+
+Builds a synthetic night of --orders orders and measures, for the orders_json
+payload and the rendered staff.html dashboard:
+  * identity size vs. gzip (levels 1 / 6 / 9) and brotli (qualities 4 / 11,
+    when the `brotli` module is installed)
+  * median compression time per response, i.e. the CPU the single worker
+    spends per request with COMPRESS_RESPONSES on
+  * streamed compression (utils.compression._stream over the template's
+    generate() chunks) vs. compressing the buffered body
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import stream_template
+
+from render_staff import make_app, make_context, render_once
+from themybuttsite.jinjafilters.filters import format_est
+from themybuttsite.utils.compression import _Brotli, _Gzip, _stream, brotli
+
+
+def orders_json(orders):
+    # Same shape as staff_api.orders_json
+    return json.dumps([
+        {
+            "id": o.id,
+            "name": o.users.name,
+            "email": f"{o.users.name.lower().replace(' ', '.')}@yale.edu",
+            "total_price": o.total_price,
+            "status": o.status,
+            "paid": o.paid,
+            "specifications": o.specifications,
+            "timestamp": format_est(o.timestamp),
+            "items": [
+                {
+                    "menu_item_name": it.menu_item_name,
+                    "menu_item_price": it.menu_item_price,
+                    "selected_ingredients": [
+                        {"ingredient_name": ing.ingredient_name, "add_price": ing.add_price}
+                        for ing in it.selected_ingredients
+                    ],
+                }
+                for it in o.order_items
+            ],
+        }
+        for o in orders
+    ]).encode()
+
+
+def encoders():
+    yield "gzip -1", lambda: _Gzip(1)
+    yield "gzip -6", lambda: _Gzip(6)
+    yield "gzip -9", lambda: _Gzip(9)
+    if brotli is not None:
+        yield "br q4", lambda: _Brotli(4)
+        yield "br q11", lambda: _Brotli(11)
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        samples.append(time.perf_counter() - t0)
+    return out, statistics.median(samples) * 1000
+
+
+def report(name, body, repeat):
+    print(f"{name}: {len(body) / 1024:.1f} KiB uncompressed")
+    for label, make in encoders():
+        out, ms = median_ms(lambda: (lambda e: e.compress(body) + e.finish())(make()), repeat)
+        print(f"  {label:<8} {len(out) / 1024:8.1f} KiB  ({len(out) / len(body):6.1%})  {ms:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    context = make_context(args.orders, args.items)
+    app = make_app(bytecode_dir="")
+
+    report(f"orders_json ({args.orders} orders)", orders_json(context["orders"]), args.repeat)
+    html = render_once(app, context).encode()
+    report("staff.html", html, args.repeat)
+
+    def streamed():
+        with app.test_request_context("/staff"):
+            return b"".join(_stream(stream_template("staff/staff.html", **context), _Gzip(6)))
+    out, ms = median_ms(streamed, args.repeat)
+    _, render_ms = median_ms(lambda: render_once(app, context), args.repeat)
+    print(f"staff.html streamed, gzip -6: {len(out) / 1024:.1f} KiB, {ms:.2f} ms "
+          f"(render alone {render_ms:.2f} ms)")
+    if brotli is None:
+        print("(brotli not installed; pip install Brotli for the br rows)")
+
+
+if __name__ == "__main__":
+    main()
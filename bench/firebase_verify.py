@@ -0,0 +1,125 @@
+"""
+Benchmark local Firebase ID-token verification with locally generated keys.
+
+    python bench/firebase_verify.py [iterations]
+
+Signs tokens with a throwaway RSA key, serves its self-signed cert from an
+in-memory fake of Google's cert endpoint, and reports per-verify latency for
+a cold cache (one cert fetch) and a warm cache (no fetch). It also checks that
+expired / wrong-audience / unknown-key tokens are rejected.
+"""
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from themybuttsite.auth.firebase_tokens import FirebaseTokenVerifier, FirebaseTokenError
+
+PROJECT_ID = "bench-project"
+
+
+def make_key_and_cert():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class FakeResponse:
+    def __init__(self, certs):
+        self._certs = certs
+        self.headers = {"Cache-Control": "public, max-age=21600, must-revalidate"}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._certs
+
+
+class FakeCertServer:
+    def __init__(self, certs, latency=0.08):
+        self.certs = certs
+        self.latency = latency  # roughly a TLS round trip to googleapis.com
+        self.fetches = 0
+
+    def get(self, url, timeout=None):
+        self.fetches += 1
+        time.sleep(self.latency)
+        return FakeResponse(self.certs)
+
+
+def make_token(key, kid, **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": "uid-123",
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+        "email": "student@yale.edu",
+        "email_verified": True,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+def expect_rejected(verifier, token, label):
+    try:
+        verifier.verify(token)
+    except FirebaseTokenError:
+        return
+    raise SystemExit(f"FAIL: {label} token was accepted")
+
+
+def main(iterations=2000):
+    key, cert_pem = make_key_and_cert()
+    server = FakeCertServer({"kid-1": cert_pem})
+    verifier = FirebaseTokenVerifier(PROJECT_ID, http=server)
+    token = make_token(key, "kid-1")
+
+    t0 = time.perf_counter()
+    claims = verifier.verify(token)
+    cold_ms = (time.perf_counter() - t0) * 1000
+    assert claims["email"] == "student@yale.edu" and claims["uid"] == "uid-123"
+
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        verifier.verify(token)
+    warm_us = (time.perf_counter() - t0) / iterations * 1e6
+
+    expect_rejected(verifier, make_token(key, "kid-1", exp=int(time.time()) - 3600), "expired")
+    expect_rejected(verifier, make_token(key, "kid-1", aud="other-project"), "wrong audience")
+    expect_rejected(verifier, make_token(key, "kid-1", iss="https://evil.example"), "wrong issuer")
+    other_key, _ = make_key_and_cert()
+    expect_rejected(verifier, make_token(other_key, "kid-1"), "forged signature")
+    fetches_before = server.fetches
+    expect_rejected(verifier, make_token(key, "kid-unknown"), "unknown kid")
+    assert server.fetches == fetches_before + 1, "unknown kid should force exactly one refetch"
+
+    print(f"cold verify (1 cert fetch): {cold_ms:8.2f} ms")
+    print(f"warm verify ({iterations}x):     {warm_us:8.1f} us/token")
+    print(f"cert fetches:               {server.fetches}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
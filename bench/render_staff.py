@@ -0,0 +1,154 @@
+"""
+Micro-benchmark for rendering the staff dashboard (templates/staff/staff.html).
+
+    python bench/render_staff.py [--orders 200] [--items 3] [--iterations 200]
+
+Renders the dashboard for a synthetic night of --orders orders (each with
+--items items and two selected ingredients) plus 40 ingredients, and reports:
+  * cold: first render on a fresh environment, with and without a warm
+    bytecode cache (compile vs. load from disk)
+  * warm: per-render cost once the template is loaded, the number that
+    format_price / format_est / public_image_url inside the loops dominate
+  * per-call cost of the hot filters
+
+No database is needed: the view's query results are stood in for by plain
+objects with the same attributes.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, render_template
+
+from themybuttsite.jinjafilters.filters import register_filters, format_price, format_est
+from themybuttsite.jinjafilters.fragments import init_fragment_cache, init_bytecode_cache
+from themybuttsite.utils.assets import init_assets
+from themybuttsite.auth.routes import bp_auth
+from themybuttsite.staff.api import bp_staff_api
+from themybuttsite.staff.pages import bp_staff_pages
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_app(bytecode_dir):
+    app = Flask(__name__, template_folder=os.path.join(ROOT, "templates"),
+                static_folder=os.path.join(ROOT, "static"))
+    app.config.update(
+        SECRET_KEY="bench",
+        SUPABASE_URL="https://bench.supabase.co/",
+        SUPABASE_BUCKET="images",
+        FRAGMENT_CACHE_SIZE=0,
+        JINJA_BYTECODE_CACHE="True",
+        JINJA_BYTECODE_CACHE_DIR=bytecode_dir,
+    )
+    register_filters(app)
+    init_fragment_cache(app)
+    init_bytecode_cache(app)
+    init_assets(app)
+
+    # The dashboard links to these; the views themselves are never called
+    app.register_blueprint(bp_auth)
+    app.register_blueprint(bp_staff_api)
+    app.register_blueprint(bp_staff_pages)
+    return app
+
+
+def make_context(n_orders, n_items):
+    now = datetime.now(timezone.utc)
+    orders = []
+    for i in range(n_orders):
+        items = [
+            SimpleNamespace(
+                menu_item_name=f"Item {j}",
+                menu_item_price=350 + 25 * j,
+                selected_ingredients=[
+                    SimpleNamespace(ingredient_name="Cheddar", add_price=0),
+                    SimpleNamespace(ingredient_name="Bacon", add_price=75),
+                ],
+            )
+            for j in range(n_items)
+        ]
+        orders.append(SimpleNamespace(
+            id=10_000 + i,
+            users=SimpleNamespace(name=f"Student {i}"),
+            total_price=sum(it.menu_item_price + 75 for it in items),
+            status="done" if i % 3 else "pending",
+            paid=bool(i % 2),
+            timestamp=now - timedelta(seconds=30 * i),
+            order_items=items,
+            specifications="extra crispy" if i % 4 == 0 else "",
+        ))
+    ingredients = [
+        SimpleNamespace(id=i, name=f"Ingredient {i}", in_stock=bool(i % 5), stock_quantity=i or None)
+        for i in range(40)
+    ]
+    settings = SimpleNamespace(grill_open=True, buttery_open=True, announcement="")
+    return {"orders": orders, "ingredients": ingredients, "settings": settings}
+
+
+def render_once(app, context):
+    with app.test_request_context("/staff"):
+        return render_template("staff/staff.html", **context)
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    context = make_context(args.orders, args.items)
+    bytecode_dir = tempfile.mkdtemp(prefix="bench-jinja-")
+    try:
+        t0 = time.perf_counter()
+        html = render_once(make_app(bytecode_dir), context)
+        cold_compile = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        render_once(make_app(bytecode_dir), context)
+        cold_bytecode = time.perf_counter() - t0
+
+        app = make_app(bytecode_dir)
+        render_once(app, context)
+        warm = timed(lambda: render_once(app, context), args.iterations)
+    finally:
+        shutil.rmtree(bytecode_dir, ignore_errors=True)
+
+    print(f"staff.html, {args.orders} orders x {args.items} items, {len(html) / 1024:.0f} KiB of HTML")
+    print(f"  cold render, compiling templates:   {cold_compile * 1000:8.2f} ms")
+    print(f"  cold render, from bytecode cache:   {cold_bytecode * 1000:8.2f} ms")
+    print(f"  warm render: median {statistics.median(warm) * 1000:.2f} ms, "
+          f"p95 {sorted(warm)[int(len(warm) * 0.95) - 1] * 1000:.2f} ms over {args.iterations}")
+
+    n = 100_000
+    ts = datetime.now(timezone.utc)
+    public_image_url = app.jinja_env.filters["public_image_url"]
+    for name, fn in (("format_price", lambda: format_price(1234)),
+                     ("format_est", lambda: format_est(ts)),
+                     ("public_image_url", lambda: public_image_url("img/abc/card.jpg"))):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        print(f"  {name + ':':<20} {(time.perf_counter() - t0) / n * 1e6:6.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
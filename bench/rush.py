@@ -0,0 +1,546 @@
+"""
+Load test for the 10 PM rush, against a scratch Postgres database.
+
+    python bench/rush.py postgresql://localhost/buttery_bench?sslmode=disable \\
+        [--students 60] [--staff 4] [--poll 2] [--think 200] [--external-latency 80] \\
+        [--baseline bench/rush-baseline.json] [--tolerance 0.25] [--save-baseline PATH]
+
+Runs the real app in-process (create_app) and drives it with test clients:
+  * --students students, released together, each: GET /buttery (the first visit
+    creates the user through Yalies), two add_to_cart, GET /cart, checkout_summary,
+    stripe_checkout, then Stripe's checkout.session.completed webhook (signed like
+    the real one), and /buttery + /order_history again
+  * --staff tablets: GET /staff, join the staff Socket.IO room, then poll
+    /staff/orders_json every --poll seconds until the students are done; each
+    must receive a new_order event for every order
+
+Stripe, Yalies, Google's OAuth token endpoint and Supabase storage are served by
+a fake HTTP server on localhost, answering after --external-latency ms; the
+Sheets client is swapped for a fake with the same latency. Logins are set in the
+session directly (no CAS / Firebase round trip).
+
+Reports p50 / p95 / p99 latency and DB queries per request for each endpoint.
+With --baseline the run fails (exit 1) when an endpoint's p95 is more than
+--tolerance above the baseline, when its queries per request grew, when any
+request errored, or when a tablet missed an order. Record a baseline with
+--save-baseline on the machine that will run the comparison (e.g. the CI runner).
+
+.github/workflows/rush.yml runs this in CI against a Postgres service container
+with --baseline bench/rush-baseline.json, and fails while that file is missing; a
+manual run of the workflow with "record baseline" produces it on the CI runner.
+
+Limitations: this is the app in-process, driven by Flask test clients on OS threads
+(Socket.IO in threading mode). Production is `gunicorn --worker-class eventlet -w 1`:
+one process, green threads, real sockets. So the numbers show how the code and its
+queries behave under concurrent load and catch regressions between runs, but the p95s
+are not what the deployed server would show. Only compare them with a baseline
+recorded the same way on the same kind of machine.
+
+Tables are created if missing; the bench's own rows (netids "bench-*", menu
+items and ingredients named "__bench__ *") are deleted afterwards.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from themybuttsite.config import Config
+
+WEBHOOK_SECRET = "whsec_bench"
+NETID_PREFIX = "bench-"
+NAME_PREFIX = "__bench__ "
+QUERY_SLACK = 0.5      # queries/request may drift this much (5th-order Sheets mirror etc.)
+
+
+# ---- fake external services ---------------------------------------------------
+
+class FakeServices(ThreadingHTTPServer):
+    """Stripe checkout sessions, Yalies people search, Google OAuth token, Supabase storage."""
+
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(("127.0.0.1", 0), _FakeHandler)
+        self.latency = latency
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _reply(self, payload, status=200, content_type="application/json"):
+        time.sleep(self.server.latency)
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+        path = urlparse(self.path).path
+        body = self._body()
+
+        if path == "/v1/checkout/sessions":
+            form = parse_qs(body.decode())
+            with server.lock:
+                sid = f"cs_bench_{len(server.sessions) + 1}"
+                server.sessions[sid] = {
+                    "id": sid,
+                    "object": "checkout.session",
+                    "url": f"{server.url}/pay/{sid}",
+                    "status": "open",
+                    "payment_status": "unpaid",
+                    "client_reference_id": form["client_reference_id"][0],
+                    "customer_email": form["customer_email"][0],
+                    "amount_total": int(form["line_items[0][price_data][unit_amount]"][0]),
+                }
+            return self._reply(server.sessions[sid])
+
+        match = re.fullmatch(r"/v1/checkout/sessions/([^/]+)/expire", path)
+        if match and match.group(1) in server.sessions:
+            server.sessions[match.group(1)]["status"] = "expired"
+            return self._reply(server.sessions[match.group(1)])
+
+        if path == "/v2/people":
+            netid = json.loads(body)["filters"].get("netid")
+            return self._reply([{"first_name": "Bench", "netid": netid, "email": f"{netid}@bench.example"}])
+
+        if path == "/token":
+            return self._reply({"access_token": "bench", "expires_in": 3600, "token_type": "Bearer"})
+
+        self._reply({"error": {"message": f"fake services: no POST {path}"}}, status=404)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+        path = urlparse(self.path).path
+
+        match = re.fullmatch(r"/v1/checkout/sessions/([^/]+)", path)
+        if match and match.group(1) in server.sessions:
+            return self._reply(server.sessions[match.group(1)])
+        if path.startswith("/storage/v1/object/public/"):
+            return self._reply(b"\xff\xd8\xff\xd9", content_type="image/jpeg")
+
+        self._reply({"error": {"message": f"fake services: no GET {path}"}}, status=404)
+
+
+class FakeSheets:
+    """Stands in for the googleapiclient Sheets service: any call chain, then execute()."""
+
+    def __init__(self, latency, tab_title):
+        self.latency = latency
+        self.tab_title = tab_title
+        self.calls = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def sheets(self):
+        return self
+
+    def __getattr__(self, name):      # get / append / update / batchUpdate / copyTo
+        return lambda **kwargs: _FakeSheetsRequest(self, kwargs)
+
+
+class _FakeSheetsRequest:
+    def __init__(self, sheets, kwargs):
+        self.sheets = sheets
+        self.kwargs = kwargs
+
+    def execute(self):
+        time.sleep(self.sheets.latency)
+        self.sheets.calls += 1
+        rows = len((self.kwargs.get("body") or {}).get("values") or []) or 1
+        title = self.sheets.tab_title()
+        return {
+            "sheets": [{"properties": {"sheetId": 1, "title": title}}],
+            "updates": {"updatedRange": f"'{title}'!A8:G{7 + rows}", "updatedRows": rows},
+            "sheetId": 1,
+        }
+
+
+# ---- app ----------------------------------------------------------------------
+
+def _service_account(token_uri):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return json.dumps({
+        "type": "service_account", "project_id": "bench", "private_key_id": "bench",
+        "private_key": pem, "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "1", "token_uri": token_uri,
+    })
+
+def make_app(url, fakes, workdir, pool_size):
+    class BenchConfig(Config):
+        DATABASE_URL = url
+        DATABASE_URL_DIRECT = None
+        DATABASE_URL_REPLICA = None
+        DB_POOL_PROFILE = "direct"
+        DB_POOL_SIZE = pool_size
+        DB_MAX_OVERFLOW = 0
+        DB_POOL_TIMEOUT = 30
+        SECRET_KEY = "bench"
+        STRIPE_SECRET_KEY = "sk_test_bench"
+        STRIPE_WEBHOOK_SECRET = WEBHOOK_SECRET
+        YALIES_API_KEY = "bench"
+        CAS_ENABLED = None
+        SUPABASE_URL = fakes.url
+        SUPABASE_BUCKET = "bench"
+        STORAGE_BACKEND = "local"
+        STORAGE_LOCAL_DIR = os.path.join(workdir, "storage")
+        FIREBASE_SERVICE_ACCOUNT = _service_account(f"{fakes.url}/token")
+        BACKGROUND_JOBS_ENABLED = "False"
+        ORDER_ARCHIVE_DIR = os.path.join(workdir, "order-archive")
+        JINJA_BYTECODE_CACHE_DIR = os.path.join(workdir, "jinja")
+        SESSION_FILE_DIR = os.path.join(workdir, "sessions")
+        SESSION_COOKIE_SECURE = False
+
+    stripe.api_base = fakes.url
+    from themybuttsite.yalies_api import yalies_api
+    yalies_api.PEOPLE_URL = f"{fakes.url}/v2/people"
+    # utils.sheets reads these from the environment; the service itself is FakeSheets
+    os.environ.setdefault("SHEETS_SPREADSHEET_ID", "bench")
+    os.environ.setdefault("SHEETS_TEMPLATE_TITLE", "Template")
+
+    from themybuttsite import create_app
+    app = create_app(BenchConfig)
+    logging.getLogger("perf").setLevel(logging.ERROR)   # every rush request is "slow"; the report says how slow
+    return app
+
+def seed(db_session, students):
+    """Settings row (if none), a three-item menu, and nothing else: users come from Yalies."""
+    from models import Ingredients, MenuItemIngredients, MenuItems, Settings
+
+    settings = db_session.query(Settings).first()
+    if settings is None:
+        settings = Settings(announcement="")
+        db_session.add(settings)
+    settings.buttery_open = settings.grill_open = True
+
+    names = ("Bun", "Cheddar", "Swiss", "Bacon")
+    ingredients = [Ingredients(name=NAME_PREFIX + n, in_stock=True) for n in names]
+    ingredients[3].stock_quantity = 10 * students    # one counted ingredient: exercises consume_stock
+    db_session.add_all(ingredients)
+    db_session.flush()
+    bun, cheddar, swiss, bacon = ingredients
+
+    items = []
+    for i, name in enumerate(("Burger", "Melt", "Quesadilla")):
+        item = MenuItems(name=NAME_PREFIX + name, price=400 + 50 * i, description="bench",
+                         object_key="default.png")
+        db_session.add(item)
+        db_session.flush()
+        db_session.add_all([
+            MenuItemIngredients(menu_item_id=item.id, ingredient_id=bun.id, type="required"),
+            MenuItemIngredients(menu_item_id=item.id, ingredient_id=cheddar.id, type="choice"),
+            MenuItemIngredients(menu_item_id=item.id, ingredient_id=swiss.id, type="choice", add_price=50),
+            MenuItemIngredients(menu_item_id=item.id, ingredient_id=bacon.id, type="optional", add_price=100),
+        ])
+        items.append(item.id)
+    db_session.commit()
+    return {"items": items, "choices": [cheddar.id, swiss.id], "optional": bacon.id}
+
+def cleanup(db_session):
+    from models import (Cart, CartItem, CartItemIngredient, Ingredients, MenuItemIngredients, MenuItems,
+                        OrderItemIngredient, OrderItems, Orders, Users)
+
+    bench_user = Users.netid.like(NETID_PREFIX + "%")
+    order_ids = db_session.query(Orders.id).filter(Orders.netid.like(NETID_PREFIX + "%"))
+    item_ids = db_session.query(OrderItems.id).filter(OrderItems.order_id.in_(order_ids))
+    cart_item_ids = db_session.query(CartItem.id).filter(CartItem.cart_netid.like(NETID_PREFIX + "%"))
+    menu_ids = db_session.query(MenuItems.id).filter(MenuItems.name.like(NAME_PREFIX + "%"))
+    ingredient_ids = db_session.query(Ingredients.id).filter(Ingredients.name.like(NAME_PREFIX + "%"))
+
+    for query in (
+        db_session.query(OrderItemIngredient).filter(OrderItemIngredient.order_item_id.in_(item_ids)),
+        db_session.query(OrderItems).filter(OrderItems.order_id.in_(order_ids)),
+        db_session.query(Orders).filter(Orders.netid.like(NETID_PREFIX + "%")),
+        db_session.query(CartItemIngredient).filter(CartItemIngredient.cart_item_id.in_(cart_item_ids)),
+        db_session.query(CartItem).filter(CartItem.cart_netid.like(NETID_PREFIX + "%")),
+        db_session.query(Cart).filter(Cart.netid.like(NETID_PREFIX + "%")),
+        db_session.query(Users).filter(bench_user),
+        db_session.query(MenuItemIngredients).filter(MenuItemIngredients.menu_item_id.in_(menu_ids)),
+        db_session.query(MenuItems).filter(MenuItems.name.like(NAME_PREFIX + "%")),
+        db_session.query(Ingredients).filter(Ingredients.id.in_(ingredient_ids)),
+    ):
+        query.delete(synchronize_session=False)
+    db_session.commit()
+    db_session.remove()
+
+
+# ---- load ---------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}     # endpoint -> [seconds]
+        self.errors = {}      # endpoint -> [status]
+        self.lock = threading.Lock()
+
+    def call(self, endpoint, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        response = fn(*args, **kwargs)
+        dt = time.perf_counter() - t0
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(dt)
+            if response.status_code >= 400:
+                self.errors.setdefault(endpoint, []).append(response.status_code)
+        return response
+
+def signed_webhook(session):
+    event = {
+        "id": f"evt_{session['id']}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": session["id"],
+            "object": "checkout.session",
+            "client_reference_id": session["client_reference_id"],
+            "metadata": {"netid": session["client_reference_id"]},
+            "amount_total": session["amount_total"],
+            "customer_details": {"email": session["customer_email"]},
+        }},
+    }
+    payload = json.dumps(event)
+    ts = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{ts}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return payload, {"Stripe-Signature": f"t={ts},v1={signature}", "Content-Type": "application/json"}
+
+def login(app, netid, role=None):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["netid"] = netid
+        if role:
+            sess["role"] = role
+    return client
+
+def student(app, fakes, menu, n, start, rec, rng, think):
+    netid = f"{NETID_PREFIX}{n:04d}"
+    client = login(app, netid)
+
+    def pause():
+        if think:
+            time.sleep(rng.uniform(0, think))
+
+    start.wait()
+    rec.call("consumer_pages.buttery", client.get, "/buttery")
+    for _ in range(2):
+        pause()
+        form = {"item_id": rng.choice(menu["items"]), "ingredients_choice": rng.choice(menu["choices"])}
+        if rng.random() < 0.5:
+            form["ingredient_ids"] = menu["optional"]
+        rec.call("consumer_api.add_to_cart", client.post, "/add_to_cart", data=form)
+    pause()
+    rec.call("consumer_pages.view_cart", client.get, "/cart")
+    rec.call("consumer_pages.checkout_summary", client.post, "/checkout_summary",
+             data={"cart_specifications": "bench"})
+    response = rec.call("stripe.stripe_checkout", client.post, "/stripe_checkout")
+
+    sid = (response.location or "").rsplit("/", 1)[-1]
+    session = fakes.sessions.get(sid)
+    if session is not None:
+        payload, headers = signed_webhook(session)
+        rec.call("stripe.stripe_webhook", app.test_client().post, "/webhook", data=payload, headers=headers)
+    pause()
+    rec.call("consumer_pages.buttery", client.get, "/buttery")
+    rec.call("consumer_pages.order_history", client.get, "/order_history")
+    return session is not None
+
+def tablet(app, socketio, netid, start, done, rec, poll, received):
+    client = login(app, netid, "staff")
+    sio = socketio.test_client(app, namespace="/staff", flask_test_client=client)
+    sio.emit("join_staff", {}, namespace="/staff")
+    start.wait()
+    rec.call("staff_pages.staff", client.get, "/staff")
+    while not done.wait(poll):
+        rec.call("staff_api.orders_json", client.get, "/staff/orders_json")
+    rec.call("staff_api.orders_json", client.get, "/staff/orders_json")
+    time.sleep(0.5)    # let the last emits land
+    events = sio.get_received("/staff")
+    received[netid] = sum(
+        1 for e in events
+        if e["name"] == "order_update" and (e["args"] or [{}])[0].get("type") == "new_order"
+    )
+    sio.disconnect(namespace="/staff")
+
+
+def run(app, fakes, menu, args):
+    from themybuttsite.extensions import socketio
+    from themybuttsite.utils.telemetry import REQUEST_QUERIES
+
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    start = threading.Barrier(args.students + args.staff + 1)
+    done = threading.Event()
+    received, checked_out = {}, []
+
+    def student_thread(n, seed):
+        if student(app, fakes, menu, n, start, rec, random.Random(seed), args.think / 1000):
+            checked_out.append(n)
+
+    tablets = [
+        threading.Thread(target=tablet, args=(app, socketio, f"{NETID_PREFIX}staff{i}", start, done,
+                                              rec, args.poll, received))
+        for i in range(args.staff)
+    ]
+    students = [threading.Thread(target=student_thread, args=(n, rng.random())) for n in range(args.students)]
+    for t in tablets + students:
+        t.start()
+
+    start.wait()
+    t0 = time.perf_counter()
+    for t in students:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    done.set()
+    for t in tablets:
+        t.join()
+
+    results = {}
+    for endpoint, samples in sorted(rec.samples.items()):
+        count, total = REQUEST_QUERIES.snapshot(endpoint=endpoint)
+        samples.sort()
+        results[endpoint] = {
+            "count": len(samples),
+            "p50_ms": percentile(samples, 0.50) * 1000,
+            "p95_ms": percentile(samples, 0.95) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+            "queries": total / count if count else 0.0,
+            "errors": len(rec.errors.get(endpoint, [])),
+        }
+    return {
+        "endpoints": results,
+        "elapsed": elapsed,
+        "orders": len(checked_out),
+        "events": received,
+    }
+
+def percentile(sorted_samples, q):
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+# ---- report -------------------------------------------------------------------
+
+def report(result, args):
+    print(f"{args.students} students, {args.staff} tablets, external latency {args.external_latency} ms: "
+          f"{result['orders']} orders in {result['elapsed']:.1f}s")
+    print(f"  {'endpoint':<34} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for endpoint, r in result["endpoints"].items():
+        print(f"  {endpoint:<34} {r['count']:>5} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['queries']:>8.1f} {r['errors']:>7}")
+    for netid, n in sorted(result["events"].items()):
+        print(f"  {netid}: {n}/{result['orders']} new_order events")
+
+def regressions(result, baseline, tolerance):
+    """Human-readable reasons this run is worse than `baseline` (empty = pass)."""
+    problems = []
+    for endpoint, r in result["endpoints"].items():
+        if r["errors"]:
+            problems.append(f"{endpoint}: {r['errors']} failed requests")
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base is None:
+            continue
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{endpoint}: p95 {r['p95_ms']:.1f} ms vs baseline {base['p95_ms']:.1f} ms")
+        if r["queries"] > base["queries"] + QUERY_SLACK:
+            problems.append(f"{endpoint}: {r['queries']:.1f} queries/request vs baseline {base['queries']:.1f}")
+    for netid, n in result["events"].items():
+        if n < result["orders"]:
+            problems.append(f"{netid} received {n} of {result['orders']} new_order events")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url", help="scratch Postgres database, e.g. postgresql://localhost/buttery_bench")
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--staff", type=int, default=4)
+    parser.add_argument("--poll", type=float, default=2.0, help="tablet orders_json interval, seconds")
+    parser.add_argument("--think", type=float, default=200, help="max pause between student steps, ms")
+    parser.add_argument("--external-latency", type=float, default=80, help="fake Stripe/Yalies/Sheets, ms")
+    parser.add_argument("--pool", type=int, default=20, help="DB pool size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="JSON from --save-baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth over baseline")
+    parser.add_argument("--save-baseline", help="write this run's numbers here")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-rush-")
+    fakes = FakeServices(args.external_latency / 1000).start()
+    try:
+        app = make_app(args.url, fakes, workdir, args.pool)
+
+        import themybuttsite.extensions as ext
+        from models import Base
+        from themybuttsite.utils import sheets
+        sheets._svc = lambda fake=FakeSheets(args.external_latency / 1000,
+                                             sheets._tab_title_for_service_date): fake
+
+        Base.metadata.create_all(ext.engine)
+        cleanup(ext.db_session)
+        menu = seed(ext.db_session, args.students)
+        ext.db_session.remove()
+        try:
+            result = run(app, fakes, menu, args)
+        finally:
+            cleanup(ext.db_session)
+    finally:
+        fakes.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report(result, args)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.save_baseline}")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = regressions(result, baseline, args.tolerance)
+    for p in problems:
+        print("  REGRESSION", p)
+    print("FAILED" if problems else "OK")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Concurrency check for the atomic stock decrement done by the Stripe webhook.
+
+    python bench/stock_concurrency.py [DATABASE_URL] [--threads 16] [--orders 25] [--start 300]
+
+Creates two scratch ingredients with a counted quantity, then has --threads
+workers each commit --orders orders through utils.inventory.consume_stock (the
+same call the webhook makes), all started together. Every order takes one of
+each ingredient, so concurrent orders contend for the same two rows.
+
+Checks:
+  * final count == start - threads * orders (no lost or doubled decrements)
+  * in_stock flipped to false once the count reached zero
+  * exactly one order reported each zero crossing
+
+Without a URL it uses a throwaway SQLite file (serialized writes, so only a
+smoke test); point it at a staging Postgres to exercise row locking.
+The scratch rows are deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+import themybuttsite.extensions as ext
+from models import Base, Ingredients, Settings
+
+NAMES = ("__bench_stock_a__", "__bench_stock_b__")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url", nargs="?")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--orders", type=int, default=25)
+    parser.add_argument("--start", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.url:
+        engine = create_engine(args.url, pool_size=args.threads, max_overflow=0)
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "stock.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+        Base.metadata.create_all(engine, tables=[Ingredients.__table__, Settings.__table__])
+
+    # consume_stock uses the app's scoped session; point it at this engine
+    ext.db_session = scoped_session(sessionmaker(bind=engine, autoflush=False))
+    from themybuttsite.utils import inventory
+    inventory.update_to_stock = lambda: None      # no Sheets from a bench run
+    inventory.socketio.emit = lambda *a, **kw: None
+
+    session = ext.db_session
+    session.query(Ingredients).filter(Ingredients.name.in_(NAMES)).delete(synchronize_session=False)
+    rows = [Ingredients(name=n, in_stock=True, stock_quantity=args.start) for n in NAMES]
+    session.add_all(rows)
+    session.commit()
+    ids = [r.id for r in rows]
+    session.remove()
+
+    barrier = threading.Barrier(args.threads)
+    crossings, errors = [], []
+    lock = threading.Lock()
+
+    def worker(n):
+        barrier.wait()
+        for i in range(args.orders):
+            try:
+                sold_out = inventory.consume_stock({ids[0]: 1, ids[1]: 1})
+                ext.db_session.commit()
+                with lock:
+                    crossings.extend(r.id for r in sold_out)
+            except Exception as e:
+                ext.db_session.rollback()
+                with lock:
+                    errors.append(repr(e))
+        ext.db_session.remove()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    total = args.threads * args.orders
+    final = {r.id: r for r in session.query(Ingredients).filter(Ingredients.id.in_(ids)).all()}
+    ok = not errors
+    for ing_id in ids:
+        row = final[ing_id]
+        expected = args.start - total
+        print(f"{row.name}: stock_quantity={row.stock_quantity} (expected {expected}) "
+              f"in_stock={row.in_stock} zero crossings reported={crossings.count(ing_id)}")
+        ok &= row.stock_quantity == expected
+        ok &= row.in_stock == (expected > 0)
+        ok &= crossings.count(ing_id) == (1 if expected <= 0 < args.start else 0)
+
+    print(f"{total} orders on {args.threads} threads in {elapsed:.2f}s "
+          f"({total / elapsed:.0f} orders/s), {len(errors)} errors")
+    for e in errors[:5]:
+        print("  ", e)
+
+    session.query(Ingredients).filter(Ingredients.id.in_(ids)).delete(synchronize_session=False)
+    session.commit()
+    session.remove()
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+-- Responsive image variants written by utils.image_processing (thumb/card/full in WebP + JPEG)
+ALTER TABLE menu_items ADD COLUMN IF NOT EXISTS image_variants jsonb;
@@ -0,0 +1,2 @@
+-- Background image uploads: 'pending' until the worker stores the variants, then 'ready' or 'failed'
+ALTER TABLE menu_items ADD COLUMN IF NOT EXISTS image_status text NOT NULL DEFAULT 'ready';
@@ -0,0 +1,38 @@
+-- Per-service-date analytics rollups maintained by utils.analytics (refreshed every few
+-- minutes, rebuilt + finalized at close). `flask rebuild-rollups` backfills history.
+CREATE TABLE IF NOT EXISTS service_day_sales (
+    service_date    date PRIMARY KEY,
+    orders          integer NOT NULL DEFAULT 0,
+    revenue         integer NOT NULL DEFAULT 0,
+    items_sold      integer NOT NULL DEFAULT 0,
+    peak_15m_orders integer NOT NULL DEFAULT 0,
+    peak_15m_start  timestamptz,
+    last_order_id   integer NOT NULL DEFAULT 0,
+    finalized       boolean NOT NULL DEFAULT false,
+    refreshed_at    timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS service_day_items (
+    service_date   date NOT NULL,
+    menu_item_name text NOT NULL,
+    quantity       integer NOT NULL DEFAULT 0,
+    revenue        integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (service_date, menu_item_name)
+);
+
+CREATE TABLE IF NOT EXISTS service_day_ingredients (
+    service_date    date NOT NULL,
+    ingredient_name text NOT NULL,
+    uses            integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (service_date, ingredient_name)
+);
+
+CREATE TABLE IF NOT EXISTS service_day_throughput (
+    service_date date NOT NULL,
+    bucket_start timestamptz NOT NULL,
+    orders       integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (service_date, bucket_start)
+);
+
+-- Finalize / backfill read one night of orders by timestamp range
+CREATE INDEX IF NOT EXISTS orders_timestamp_idx ON orders (timestamp);
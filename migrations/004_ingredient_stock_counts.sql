@@ -0,0 +1,3 @@
+-- Staff-entered starting counts used by utils.forecast; NULL = ingredient not quantity-tracked
+ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS stock_quantity integer;
+ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS stock_counted_at timestamptz;
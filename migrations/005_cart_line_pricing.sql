@@ -0,0 +1,6 @@
+-- Catalog version bumped on every menu / price change (utils.catalog)
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS catalog_version integer NOT NULL DEFAULT 1;
+-- Cart lines store their price at add time; NULLs (older rows) are re-priced on first read
+ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS unit_price integer;
+ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS catalog_version integer;
+ALTER TABLE cart_item_ingredients ADD COLUMN IF NOT EXISTS add_price integer;
@@ -0,0 +1,9 @@
+-- Per-user cart badge (count, subtotal, checkout in progress), see utils.carts.sync_cart_summary
+ALTER TABLE users ADD COLUMN IF NOT EXISTS cart_count integer NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS cart_subtotal integer NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS cart_locked boolean NOT NULL DEFAULT FALSE;
+
+UPDATE users u SET
+    cart_count = (SELECT count(*) FROM cart_items ci WHERE ci.cart_netid = u.netid),
+    cart_subtotal = (SELECT coalesce(sum(ci.unit_price), 0) FROM cart_items ci WHERE ci.cart_netid = u.netid),
+    cart_locked = EXISTS (SELECT 1 FROM carts c WHERE c.netid = u.netid AND c.stripe_session_id IS NOT NULL);
@@ -0,0 +1,2 @@
+-- Per-user order version for conditional GETs on /buttery and /order_history (utils.http_cache)
+ALTER TABLE users ADD COLUMN IF NOT EXISTS order_seq integer NOT NULL DEFAULT 0;
@@ -0,0 +1,2 @@
+-- Display-only menu version (stock, images): keys the menu fragment without re-pricing carts (utils.catalog)
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS menu_version integer NOT NULL DEFAULT 1;
@@ -0,0 +1,2 @@
+-- When a background image upload was queued, so ones lost to a restart can be marked failed
+ALTER TABLE menu_items ADD COLUMN IF NOT EXISTS image_requested_at timestamptz;
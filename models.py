@@ -1,6 +1,6 @@
 from typing import List, Optional
 from sqlalchemy import (
-    Boolean, DateTime, ForeignKey, Integer, Text, text, Enum
+    Boolean, Date, DateTime, ForeignKey, Integer, Text, text, Enum, JSON
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import datetime
@@ -19,6 +19,12 @@ class Users(Base):
     name: Mapped[str] = mapped_column(Text, nullable=False)
     role: Mapped[str] = mapped_column(Text, nullable=False, server_default=text("'consumer'"))
     email: Mapped[str] = mapped_column(Text, nullable=False, unique=True)
+    # Cart badge, kept in step with the cart by utils.carts.sync_cart_summary
+    cart_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    cart_subtotal: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))  # cents
+    cart_locked: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('FALSE'))
+    # Bumped whenever one of the user's orders is created or changes (utils.http_cache)
+    order_seq: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
 
     orders: Mapped[List['Orders']] = relationship('Orders', back_populates='users')
     cart: Mapped[Optional['Cart']] = relationship('Cart', back_populates='user', uselist=False)
@@ -30,6 +36,11 @@ class Settings(Base):
     grill_open: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('TRUE'))
     buttery_open: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('TRUE'))
     announcement: Mapped[str] = mapped_column(Text, nullable=True)
+    # Bumped by price changes (utils/catalog.py): cart lines priced under an older
+    # version get re-priced on read
+    catalog_version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('1'))
+    # Bumped by anything the menu page shows (prices too): keys the cached menu fragment
+    menu_version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('1'))
 
 class Ingredients(Base):
     __tablename__ = 'ingredients'
@@ -38,9 +49,12 @@ class Ingredients(Base):
     name: Mapped[str] = mapped_column(Text, nullable=False, unique=True)
     in_stock: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('TRUE'))
     is_default: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('false'))
+    # Portions staff counted at stock_counted_at; NULL = not quantity-tracked (forecasting skips it)
+    stock_quantity: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    stock_counted_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
     menu_item_ingredients: Mapped[List['MenuItemIngredients']] = relationship(
-        'MenuItemIngredients', back_populates='ingredient'
+        'MenuItemIngredients', back_populates='ingredient', passive_deletes=True
     )
 
 class MenuItems(Base):
@@ -52,6 +66,12 @@ class MenuItems(Base):
     requires_grill: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('FALSE'))
     description: Mapped[str] = mapped_column(Text, nullable=False)
     object_key: Mapped[str] = mapped_column(Text, nullable=False, server_default=text("''"))
+    # {"thumb"|"card"|"full": {"width": int, "webp": key, "jpg": key}}; NULL for legacy single-image rows
+    image_variants: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    # 'pending' while the background upload runs, then 'ready' or 'failed'
+    image_status: Mapped[str] = mapped_column(Text, nullable=False, server_default=text("'ready'"))
+    # When the pending upload was queued; uploads pending too long are marked 'failed'
+    image_requested_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     is_default: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('false'))
     menu_item_ingredients: Mapped[List['MenuItemIngredients']] = relationship(
         'MenuItemIngredients', back_populates='menu_item', cascade='all, delete-orphan', passive_deletes=True
@@ -165,6 +185,9 @@ class CartItem(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     cart_netid: Mapped[str] = mapped_column(ForeignKey('carts.netid'))
     menu_item_id: Mapped[int] = mapped_column(ForeignKey('menu_items.id', ondelete="CASCADE"), nullable=False)
+    # Price of this line (item + add-ons, cents) as of settings.catalog_version = catalog_version
+    unit_price: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    catalog_version: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     cart: Mapped['Cart'] = relationship('Cart', back_populates='items')
     menu_item: Mapped['MenuItems'] = relationship('MenuItems')
@@ -182,8 +205,51 @@ class CartItemIngredient(Base):
     ingredient_id: Mapped[int] = mapped_column(ForeignKey('ingredients.id', ondelete="CASCADE"), primary_key=True)
 
     type: Mapped[str] = mapped_column(ItemTypeEnum, nullable=False)
+    add_price: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # priced with the line
 
     cart_item: Mapped['CartItem'] = relationship('CartItem', back_populates='selected_ingredients')
     ingredient: Mapped['Ingredients'] = relationship('Ingredients')
 
-    
+
+# ---- Analytics rollups (one row set per service date, see utils/analytics.py) ----
+
+class ServiceDaySales(Base):
+    __tablename__ = 'service_day_sales'
+
+    service_date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    orders: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    revenue: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))  # cents
+    items_sold: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    peak_15m_orders: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    peak_15m_start: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Highest order id folded in; incremental refreshes resume after it
+    last_order_id: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    finalized: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('false'))
+    refreshed_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=text("CURRENT_TIMESTAMP")
+    )
+
+class ServiceDayItems(Base):
+    __tablename__ = 'service_day_items'
+
+    service_date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    # Snapshot name, like order_items: survives the menu item being deleted
+    menu_item_name: Mapped[str] = mapped_column(Text, primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+    revenue: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))  # base price, cents
+
+class ServiceDayIngredients(Base):
+    __tablename__ = 'service_day_ingredients'
+
+    service_date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    ingredient_name: Mapped[str] = mapped_column(Text, primary_key=True)
+    uses: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
+
+class ServiceDayThroughput(Base):
+    __tablename__ = 'service_day_throughput'
+
+    service_date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    bucket_start: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), primary_key=True)  # 15 min
+    orders: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('0'))
@@ -0,0 +1,46 @@
+// Minify, fingerprint and precompress the static assets served in production.
+//
+//   npm run build        (build:css first, then this script)
+//
+// For every entry below: minifies it (JS via esbuild; the CSS already comes out of
+// Tailwind minified), writes static/dist/<dir>/<name>.<hash>.<ext> plus .gz and .br
+// siblings, and records source -> built path in static/dist/manifest.json.
+// utils/assets.py reads the manifest (asset_url in templates) and serves the
+// precompressed variant the client accepts.
+import { createHash } from "node:crypto";
+import { mkdirSync, readFileSync, rmSync, writeFileSync } from "node:fs";
+import { dirname, extname, join } from "node:path";
+import { brotliCompressSync, constants, gzipSync } from "node:zlib";
+import { transform } from "esbuild";
+
+const STATIC = "static";
+const DIST = join(STATIC, "dist");
+const ENTRIES = ["css/output.css", "js/staff.js"];
+
+async function minify(entry, source) {
+  if (extname(entry) !== ".js") return source;
+  const result = await transform(source.toString(), { loader: "js", minify: true, target: "es2018" });
+  return Buffer.from(result.code);
+}
+
+rmSync(DIST, { recursive: true, force: true });
+const manifest = {};
+
+for (const entry of ENTRIES) {
+  const output = await minify(entry, readFileSync(join(STATIC, entry)));
+  const hash = createHash("sha256").update(output).digest("hex").slice(0, 12);
+  const ext = extname(entry);
+  const built = join("dist", `${entry.slice(0, -ext.length)}.${hash}${ext}`);
+  const path = join(STATIC, built);
+
+  mkdirSync(dirname(path), { recursive: true });
+  writeFileSync(path, output);
+  writeFileSync(`${path}.gz`, gzipSync(output, { level: 9 }));
+  writeFileSync(`${path}.br`, brotliCompressSync(output, {
+    params: { [constants.BROTLI_PARAM_QUALITY]: 11, [constants.BROTLI_PARAM_SIZE_HINT]: output.length },
+  }));
+  manifest[entry] = built;
+  console.log(`${entry} -> ${built} (${output.length} bytes)`);
+}
+
+writeFileSync(join(DIST, "manifest.json"), JSON.stringify(manifest, null, 2) + "\n");
@@ -136,6 +136,22 @@ socket.on("order_update", (data) => {
   fetchNewOrdersPost();
 });
 
+socket.on("stock_alert", (data) => {
+  const box = document.getElementById("stock-alerts");
+  if (!box || !data || !data.message) return;
+
+  // One banner per ingredient; a newer level replaces the older one
+  const id = `stock-alert-${data.ingredient_id}`;
+  document.getElementById(id)?.remove();
+
+  const div = document.createElement("div");
+  div.id = id;
+  div.className = `alert ${data.level === "out" ? "alert-danger" : "alert-warning"} text-center`;
+  div.setAttribute("role", "alert");
+  div.textContent = data.message;
+  box.prepend(div);
+});
+
 function formatPrice(cents) {
   if (cents == null || isNaN(cents)) return "";
   if (cents % 100 === 0) {
@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# SQLite keeps no UTC offset and hands timestamps back naive; with the process in UTC
+# they still convert (astimezone) the way Postgres' timestamptz values do
+os.environ["TZ"] = "UTC"
+time.tzset()
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import themybuttsite
+import themybuttsite.extensions as ext
+from models import Base, Settings, Users
+from themybuttsite.config import Config
+
+# App modules bind `db_session` when they are imported (create_app imports them after
+# init_db), so the test database is wired in here, before any test module imports them:
+# one in-memory SQLite database as the "default" engine
+ext.engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+ext.engines.clear()
+ext.engines["default"] = ext.engine
+ext.db_session = scoped_session(sessionmaker(class_=ext.RoutingSession, autoflush=False))
+
+
+@event.listens_for(ext.engine, "connect")
+def _foreign_keys(dbapi_conn, record):
+    # ON DELETE CASCADE / SET NULL only happen with foreign keys switched on
+    dbapi_conn.execute("PRAGMA foreign_keys = ON")
+
+
+@pytest.fixture
+def db():
+    """The app's db_session over a freshly created schema."""
+    Base.metadata.create_all(ext.engine)
+    yield ext.db_session
+    ext.db_session.remove()
+    Base.metadata.drop_all(ext.engine)
+
+
+# ---- the whole app ------------------------------------------------------------
+
+def _service_account():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return json.dumps({
+        "type": "service_account", "project_id": "buttery-test", "private_key_id": "test",
+        "private_key": pem, "client_email": "test@buttery-test.iam.gserviceaccount.com",
+        "client_id": "1", "token_uri": "https://oauth2.googleapis.com/token",
+    })
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """
+    create_app() over the test database. Lazy loads raise (RAISE_ON_LAZY_LOAD), so a
+    route that starts issuing one query per row fails here instead of in production.
+    """
+    tmp = tmp_path_factory.mktemp("app")
+
+    class TestConfig(Config):
+        TESTING = True
+        SECRET_KEY = "test"
+        FIREBASE_SERVICE_ACCOUNT = _service_account()
+        STORAGE_BACKEND = "local"
+        STORAGE_LOCAL_DIR = str(tmp / "storage")
+        SESSION_FILE_DIR = str(tmp / "sessions")
+        SESSION_COOKIE_SECURE = False
+        ORDER_ARCHIVE_DIR = ""
+        BACKGROUND_JOBS_ENABLED = "False"
+        JINJA_BYTECODE_CACHE = "False"
+        RAISE_ON_LAZY_LOAD = "True"
+
+    # The engines and session above stand in for the Postgres ones init_db would build
+    real_init_db = themybuttsite.init_db
+    themybuttsite.init_db = lambda *args, **kwargs: (ext.engine, ext.db_session)
+    try:
+        app = themybuttsite.create_app(TestConfig)
+    finally:
+        themybuttsite.init_db = real_init_db
+    yield app
+
+    from themybuttsite.utils.query_debug import _raise_on_lazy_load
+    event.remove(ext.db_session, "do_orm_execute", _raise_on_lazy_load)
+
+
+@pytest.fixture
+def site(app, db):
+    """The app over a fresh schema holding the settings row, a student and a staff user."""
+    if app.jinja_env.fragment_cache is not None:
+        app.jinja_env.fragment_cache.clear()   # rows cached by id from an earlier test's data
+    db.add(Settings(id=1, buttery_open=True, grill_open=True, announcement=""))
+    db.add(Users(netid="stu", name="Stu Dent", email="stu@yale.edu"))
+    db.add(Users(netid="staff", name="Staff Member", email="staff@yale.edu", role="staff"))
+    db.commit()
+    db.remove()
+    return app
+
+
+@pytest.fixture
+def client_as(site):
+    """client_as(netid, role=None): a test client already logged in as `netid`."""
+    def make(netid, role=None):
+        client = site.test_client()
+        with client.session_transaction() as session:
+            session["netid"] = netid
+            if role:
+                session["role"] = role
+        return client
+    return make
@@ -0,0 +1,67 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import Orders, OrderItems, ServiceDaySales, Users
+from themybuttsite.utils import analytics
+from themybuttsite.utils.analytics import finalize_service_date, refresh_rollups
+from themybuttsite.utils.time import service_date
+
+
+@pytest.fixture
+def night(db):
+    """Five settled orders (old enough for the refresh to take) on one service date."""
+    placed = datetime.now(timezone.utc) - timedelta(minutes=10)
+    db.add(Users(netid="stu", name="Stu Dent", email="stu@yale.edu"))
+    for i in range(5):
+        order = Orders(netid="stu", email="stu@yale.edu", total_price=500,
+                       timestamp=placed + timedelta(seconds=i))
+        order.order_items = [OrderItems(menu_item_name="Quesadilla", menu_item_price=500)]
+        db.add(order)
+    db.commit()
+    db.remove()
+    return service_date(placed)
+
+def summary(db, svc_date):
+    row = db.get(ServiceDaySales, svc_date)
+    result = (row.orders, row.revenue, row.items_sold, row.finalized)
+    db.remove()
+    return result
+
+
+def test_refresh_then_finalize(night, db):
+    assert refresh_rollups() == 5
+    assert refresh_rollups() == 0
+    finalize_service_date(night)
+
+    assert summary(db, night) == (5, 2500, 5, True)
+
+def test_finalize_during_a_refresh_does_not_double_count(night, db, monkeypatch):
+    # Stop the refresh after it has read its watermark and aggregated, then close the
+    # buttery: the rebuild must wait for the refresh instead of running underneath it
+    aggregated, resume = threading.Event(), threading.Event()
+    real_aggregate = analytics._aggregate
+
+    def paused_aggregate(*criteria):
+        days = real_aggregate(*criteria)
+        aggregated.set()
+        resume.wait(5)
+        return days
+
+    monkeypatch.setattr(analytics, "_aggregate", paused_aggregate)
+    refresh = threading.Thread(target=lambda: (refresh_rollups(), db.remove()))
+    refresh.start()
+    assert aggregated.wait(5)
+
+    monkeypatch.setattr(analytics, "_aggregate", real_aggregate)
+    finalize = threading.Thread(target=lambda: (finalize_service_date(night), db.remove()))
+    finalize.start()
+    finalize.join(0.3)
+    assert finalize.is_alive()   # blocked behind the refresh
+
+    resume.set()
+    refresh.join(5)
+    finalize.join(5)
+
+    assert summary(db, night) == (5, 2500, 5, True)
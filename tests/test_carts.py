@@ -0,0 +1,74 @@
+import pytest
+
+from models import CartItem, Ingredients, MenuItemIngredients, MenuItems, Users
+from themybuttsite.extensions import db_session
+
+
+@pytest.fixture
+def menu(site):
+    """Two items sharing a bread (required), a cheese choice and a bacon add-on."""
+    db_session.add_all([
+        Ingredients(id=1, name="Bread"),
+        Ingredients(id=2, name="Cheddar"),
+        Ingredients(id=3, name="Bacon"),
+        MenuItems(id=1, name="Grilled Cheese", price=400, description="d"),
+        MenuItems(id=2, name="Melt", price=550, description="d"),
+    ])
+    for item_id in (1, 2):
+        db_session.add_all([
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=1, type="required"),
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=2, type="choice", add_price=0),
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=3, type="optional", add_price=150),
+        ])
+    db_session.commit()
+    db_session.remove()
+
+
+def badge(netid="stu"):
+    user = db_session.query(Users).filter_by(netid=netid).one()
+    result = (user.cart_count, user.cart_subtotal)
+    db_session.remove()
+    return result
+
+
+def test_deleting_a_menu_item_updates_carts_holding_it(menu, client_as):
+    stu = client_as("stu")
+    stu.post("/add_to_cart", data={"item_id": 1, "ingredients_choice": 2, "ingredient_ids": 3})
+    stu.post("/add_to_cart", data={"item_id": 2, "ingredients_choice": 2})
+    assert badge() == (2, 400 + 150 + 550)
+
+    client_as("staff", "staff").post("/staff/delete_menu_item", data={"id": 1})
+
+    assert db_session.query(CartItem).filter_by(cart_netid="stu").count() == 1
+    db_session.remove()
+    assert badge() == (1, 550)
+
+def test_deleting_the_last_item_in_a_cart_empties_the_badge(menu, client_as):
+    client_as("stu").post("/add_to_cart", data={"item_id": 1, "ingredients_choice": 2})
+
+    client_as("staff", "staff").post("/staff/delete_menu_item", data={"id": 1})
+
+    assert badge() == (0, 0)
+
+def test_deleting_an_ingredient_updates_carts_holding_it(menu, client_as):
+    stu = client_as("stu")
+    stu.post("/add_to_cart", data={"item_id": 1, "ingredients_choice": 2, "ingredient_ids": 3})
+
+    client_as("staff", "staff").post("/staff/delete_ingredient", data={"ingredient_id": 3})
+    # The line lost its bacon; reading the cart re-prices it
+    assert stu.get("/cart").status_code == 200
+
+    assert badge() == (1, 400)
+
+def test_reading_an_emptied_cart_repairs_the_badge(menu, client_as):
+    stu = client_as("stu")
+    stu.post("/add_to_cart", data={"item_id": 1, "ingredients_choice": 2})
+    # As if the line had been removed without the badge being kept in step
+    db_session.query(CartItem).delete()
+    db_session.commit()
+    db_session.remove()
+    assert badge() == (1, 400)
+
+    assert stu.get("/cart").status_code == 200
+
+    assert badge() == (0, 0)
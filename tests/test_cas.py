@@ -0,0 +1,156 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from themybuttsite.auth.cas import CasError, CasValidator
+
+SERVICE_URL = "https://buttery.example/login"
+
+
+class FakeCas(ThreadingHTTPServer):
+    """
+    CAS 1.0 /validate on localhost. Tickets in `tickets` are accepted once (service
+    tickets are single-use), anything else gets "no". `delay` seconds before answering.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _CasHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/cas/validate"
+        self.tickets = {}
+        self.delay = 0.0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class _CasHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        with server.lock:
+            server.requests += 1
+            netid = None
+            if query.get("service") == [SERVICE_URL]:
+                netid = server.tickets.pop(query.get("ticket", [""])[0], None)
+        time.sleep(server.delay)
+        body = f"yes\n{netid}\n" if netid else "no\n\n"
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # the client gave up (read timeout tests)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cas():
+    server = FakeCas()
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def validator_for(cas, **kwargs):
+    return CasValidator(cas.url, SERVICE_URL, **kwargs)
+
+
+def test_valid_ticket_returns_netid(cas):
+    cas.tickets["ST-1"] = "abc123"
+    assert validator_for(cas).validate("ST-1") == "abc123"
+
+def test_rejected_and_missing_tickets_return_none(cas):
+    validator = validator_for(cas)
+    assert validator.validate("ST-unknown") is None
+    assert validator.validate("") is None
+    assert cas.requests == 1
+
+def test_accepted_ticket_is_not_cached(cas):
+    cas.tickets["ST-1"] = "abc123"
+    validator = validator_for(cas)
+    assert validator.validate("ST-1") == "abc123"
+    # A replay (refresh, leaked URL) goes back to CAS, which refuses the used ticket
+    assert validator.validate("ST-1") is None
+    assert cas.requests == 2
+
+def test_rejected_ticket_is_cached_until_ttl(cas):
+    clock = Clock()
+    validator = validator_for(cas, ticket_ttl=30, clock=clock)
+    for _ in range(3):
+        assert validator.validate("ST-bad") is None
+    assert cas.requests == 1
+
+    clock.now += 31
+    assert validator.validate("ST-bad") is None
+    assert cas.requests == 2
+
+def test_rejection_cache_is_bounded(cas):
+    validator = validator_for(cas, max_cached=2)
+    for ticket in ("ST-a", "ST-b", "ST-c"):
+        validator.validate(ticket)
+    validator.validate("ST-a")      # evicted by ST-c, so asked again
+    assert cas.requests == 4
+
+def test_slow_cas_times_out(cas):
+    cas.delay = 1.0
+    validator = validator_for(cas, connect_timeout=0.5, read_timeout=0.2)
+    t0 = time.perf_counter()
+    with pytest.raises(CasError):
+        validator.validate("ST-1")
+    assert time.perf_counter() - t0 < 0.9
+
+def test_unreachable_cas_raises(cas):
+    validator = CasValidator("http://127.0.0.1:9/cas/validate", SERVICE_URL, connect_timeout=0.5)
+    with pytest.raises(CasError):
+        validator.validate("ST-1")
+
+def test_concurrency_cap_fails_fast_when_saturated(cas):
+    cas.delay = 0.5
+    cas.tickets["ST-1"] = "abc123"
+    validator = validator_for(cas, max_concurrency=1, acquire_timeout=0.1)
+
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", validator.validate("ST-1")))
+    first.start()
+    assert _wait_for(lambda: cas.requests == 1)
+
+    with pytest.raises(CasError, match="Too many"):
+        validator.validate("ST-2")
+    first.join()
+    assert results["first"] == "abc123"
+    assert cas.requests == 1      # the refused call never reached CAS
+
+    # The slot is released afterwards
+    cas.delay = 0.0
+    assert validator.validate("ST-3") is None
+
+def test_parse():
+    assert CasValidator.parse("yes\nabc123\n") == "abc123"
+    assert CasValidator.parse("no\n\n") is None
+    assert CasValidator.parse("yes\n\n") is None
+    assert CasValidator.parse("") is None
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,231 @@
+import datetime
+import threading
+import time
+
+import jwt
+import pytest
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from themybuttsite.auth.firebase_tokens import FirebaseTokenError, FirebaseTokenVerifier
+
+PROJECT_ID = "test-project"
+
+
+def make_key_and_cert():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+def sign(key, kid, **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": "uid-123",
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+        "email": "student@yale.edu",
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+class FakeResponse:
+    def __init__(self, body, max_age):
+        self._body = body
+        self.headers = {"Cache-Control": f"public, max-age={max_age}, must-revalidate"}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        if isinstance(self._body, Exception):
+            raise self._body
+        return self._body
+
+
+class FakeCertEndpoint:
+    """
+    Google's cert URL: serves `certs` (kid -> PEM) and counts fetches. `body` replaces
+    the decoded JSON (an exception is raised from json()); `delay` slows each fetch.
+    """
+
+    def __init__(self, certs, max_age=3600):
+        self.certs = dict(certs)
+        self.max_age = max_age
+        self.fetches = 0
+        self.fail = False
+        self.body = None
+        self.delay = 0
+
+    def get(self, url, timeout=None):
+        self.fetches += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise requests.ConnectionError("cert endpoint down")
+        return FakeResponse(self.body if self.body is not None else dict(self.certs), self.max_age)
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def keys():
+    return {"k1": make_key_and_cert(), "k2": make_key_and_cert()}
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def verifier_for(http, clock, **kwargs):
+    return FirebaseTokenVerifier(PROJECT_ID, http=http, clock=clock, **kwargs)
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_verifies_locally_and_caches_certs(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]})
+    verifier = verifier_for(http, clock)
+
+    for _ in range(5):
+        claims = verifier.verify(sign(keys["k1"][0], "k1"))
+    assert claims["uid"] == "uid-123"
+    assert claims["email"] == "student@yale.edu"
+    assert http.fetches == 1
+
+def test_refetches_after_cache_control_expiry(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]}, max_age=600)
+    verifier = verifier_for(http, clock)
+    verifier.verify(sign(keys["k1"][0], "k1"))
+
+    clock.now += 601
+    verifier.verify(sign(keys["k1"][0], "k1"))
+    assert http.fetches == 2
+
+def test_refreshes_in_background_near_expiry(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]}, max_age=600)
+    verifier = verifier_for(http, clock, refresh_margin=300)
+    verifier.verify(sign(keys["k1"][0], "k1"))
+
+    # Inside the refresh margin: served from cache, refreshed off-thread
+    clock.now += 400
+    verifier.verify(sign(keys["k1"][0], "k1"))
+    assert wait_for(lambda: http.fetches == 2)
+    assert wait_for(lambda: not verifier._refreshing)
+
+def test_unknown_kid_refetches_once_to_pick_up_rotated_keys(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]})
+    verifier = verifier_for(http, clock)
+    verifier.verify(sign(keys["k1"][0], "k1"))
+
+    # Google rotates before our copy expires
+    http.certs = {"k2": keys["k2"][1]}
+    assert verifier.verify(sign(keys["k2"][0], "k2"))["uid"] == "uid-123"
+    assert http.fetches == 2
+
+def test_unknown_kid_refetches_are_throttled(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]})
+    verifier = verifier_for(http, clock, unknown_kid_interval=60)
+    verifier.verify(sign(keys["k1"][0], "k1"))
+
+    for i in range(5):
+        with pytest.raises(FirebaseTokenError, match="unknown key"):
+            verifier.verify(sign(keys["k2"][0], f"made-up-{i}"))
+    assert http.fetches == 2      # the first unknown kid only
+
+    clock.now += 61
+    with pytest.raises(FirebaseTokenError, match="unknown key"):
+        verifier.verify(sign(keys["k2"][0], "made-up-again"))
+    assert http.fetches == 3
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"aud": "someone-else"}, "Invalid ID token"),
+    ({"iss": "https://securetoken.google.com/someone-else"}, "Invalid ID token"),
+    ({"exp": int(time.time()) - 3600, "iat": int(time.time()) - 7200}, "Invalid ID token"),
+    ({"sub": ""}, "invalid subject"),
+    ({"auth_time": int(time.time()) + 3600}, "auth_time"),
+])
+def test_rejects_bad_claims(keys, clock, overrides, message):
+    verifier = verifier_for(FakeCertEndpoint({"k1": keys["k1"][1]}), clock)
+    with pytest.raises(FirebaseTokenError, match=message):
+        verifier.verify(sign(keys["k1"][0], "k1", **overrides))
+
+def test_rejects_token_signed_by_another_key(keys, clock):
+    verifier = verifier_for(FakeCertEndpoint({"k1": keys["k1"][1]}), clock)
+    with pytest.raises(FirebaseTokenError, match="Invalid ID token"):
+        verifier.verify(sign(keys["k2"][0], "k1"))
+
+def test_rejects_non_rs256_and_malformed_tokens(keys, clock):
+    verifier = verifier_for(FakeCertEndpoint({"k1": keys["k1"][1]}), clock)
+    hs256 = jwt.encode({"sub": "x"}, "secret", algorithm="HS256", headers={"kid": "k1"})
+    with pytest.raises(FirebaseTokenError, match="algorithm"):
+        verifier.verify(hs256)
+    with pytest.raises(FirebaseTokenError, match="Malformed"):
+        verifier.verify("not-a-jwt")
+    with pytest.raises(FirebaseTokenError, match="Missing"):
+        verifier.verify("")
+
+def test_cert_fetch_failure_is_a_token_error(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]})
+    http.fail = True
+    verifier = verifier_for(http, clock)
+    with pytest.raises(FirebaseTokenError, match="Unable to fetch"):
+        verifier.verify(sign(keys["k1"][0], "k1"))
+
+@pytest.mark.parametrize("body", [
+    requests.JSONDecodeError("Expecting value", "<html>", 0),
+    ValueError("not JSON"),
+    ["not", "a", "mapping"],
+    {"k1": "-----BEGIN CERTIFICATE-----\nnot a cert\n-----END CERTIFICATE-----\n"},
+    {"k1": None},
+])
+def test_malformed_cert_response_is_a_token_error(keys, clock, body):
+    http = FakeCertEndpoint({})
+    http.body = body
+    verifier = verifier_for(http, clock)
+    with pytest.raises(FirebaseTokenError):
+        verifier.verify(sign(keys["k1"][0], "k1"))
+
+def test_cold_cache_is_fetched_once_for_concurrent_logins(keys, clock):
+    http = FakeCertEndpoint({"k1": keys["k1"][1]})
+    http.delay = 0.2
+    verifier = verifier_for(http, clock)
+    token = sign(keys["k1"][0], "k1")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(verifier.verify(token)["uid"]))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert results == ["uid-123"] * 8
+    assert http.fetches == 1
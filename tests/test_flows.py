@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+
+from models import (
+    Cart, CartItem, Ingredients, MenuItemIngredients, MenuItems, Orders, OrderItems, Users,
+)
+from themybuttsite.extensions import db_session
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+@pytest.fixture
+def menu(site, monkeypatch):
+    monkeypatch.setitem(site.config, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    db_session.add_all([
+        Ingredients(id=1, name="Tortilla"),
+        Ingredients(id=2, name="Cheddar"),
+        Ingredients(id=3, name="Pepper Jack"),
+        Ingredients(id=4, name="Salsa", stock_quantity=50),
+        MenuItems(id=1, name="Quesadilla", price=450, description="d"),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=1, type="required"),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=2, type="choice", add_price=0),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=3, type="choice", add_price=50),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=4, type="optional", add_price=100),
+    ])
+    db_session.commit()
+    db_session.remove()
+
+def signed_event(payload):
+    """Body and Stripe-Signature header for `payload`, signed as Stripe signs webhooks."""
+    body = json.dumps(payload)
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+    return body, {"Stripe-Signature": f"t={timestamp},v1={signature}"}
+
+def checkout_completed(session_id, netid, amount):
+    return {
+        "id": "evt_test", "object": "event", "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": session_id, "object": "checkout.session", "amount_total": amount,
+            "metadata": {"netid": netid}, "customer_details": {"email": f"{netid}@yale.edu"},
+        }},
+    }
+
+
+# The app fixture runs with RAISE_ON_LAZY_LOAD: these drive real routes so a
+# relationship they start loading lazily (one query per row) fails here
+
+def test_lazy_loads_raise_in_the_test_app(site):
+    db_session.add(Orders(netid="stu", email="stu@yale.edu", total_price=100))
+    db_session.commit()
+    db_session.remove()
+
+    order = db_session.query(Orders).one()
+    with pytest.raises(InvalidRequestError, match="raise_on_sql"):
+        order.users
+    db_session.remove()
+
+def test_order_flow_without_lazy_loads(menu, client_as):
+    stu = client_as("stu")
+    assert stu.get("/buttery").status_code == 200
+    stu.post("/add_to_cart", data={"item_id": 1, "ingredients_choice": 3, "ingredient_ids": 4})
+    stu.post("/add_to_cart", data={"item_id": 1, "ingredients_choice": 2})
+
+    resp = stu.get("/cart")
+    assert resp.status_code == 200
+    assert "Quesadilla" in resp.get_data(as_text=True)
+
+    # Checkout went to Stripe and came back paid
+    db_session.query(Cart).filter_by(netid="stu").update({"stripe_session_id": "cs_test_1"})
+    db_session.commit()
+    db_session.remove()
+    body, headers = signed_event(checkout_completed("cs_test_1", "stu", 1050))
+    resp = stu.post("/webhook", data=body, headers=headers, content_type="application/json")
+    assert resp.status_code == 200
+
+    order = db_session.query(Orders).filter_by(stripe_session_id="cs_test_1").one()
+    assert order.total_price == 1050
+    assert db_session.query(OrderItems).filter_by(order_id=order.id).count() == 2
+    assert db_session.get(Ingredients, 4).stock_quantity == 49
+    assert db_session.query(Cart).filter_by(netid="stu").count() == 0
+    assert db_session.query(CartItem).count() == 0
+    assert db_session.query(Users).filter_by(netid="stu").one().cart_count == 0
+    db_session.remove()
+
+    assert stu.get("/order_history").status_code == 200
+
+    staff = client_as("staff", "staff")
+    for path in ("/staff", "/staff/orders_json", "/order_history_staff", "/manage_menu"):
+        resp = staff.get(path)
+        assert resp.status_code == 200, path
+        resp.get_data()   # streamed pages render while they are read
+    assert "Quesadilla" in staff.get("/order_history_staff").get_data(as_text=True)
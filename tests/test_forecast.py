@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import (
+    Ingredients, MenuItemIngredients, MenuItems, Orders, OrderItems, OrderItemIngredient,
+    Settings, Users,
+)
+from themybuttsite.utils import forecast
+from themybuttsite.utils.forecast import check_stock, demand_profile, forecast_stock
+from themybuttsite.utils.time import service_date
+
+BUN, CHEDDAR, BACON = 1, 2, 3
+
+
+@pytest.fixture
+def window(db, monkeypatch):
+    """
+    Tonight's service window starts on the next full hour, so the whole of it is still
+    ahead whatever the time the tests run; the cached profile and alerts start empty.
+    """
+    start = (datetime.now(timezone.utc) + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    end = start + timedelta(hours=3)
+    monkeypatch.setattr(forecast, "get_service_window", lambda: (start, end))
+    monkeypatch.setattr(forecast, "_profile", {"date": None, "hours": {}})
+    monkeypatch.setattr(forecast, "_alerted", {})
+
+    db.add_all([
+        Settings(id=1, buttery_open=True, grill_open=True, announcement=""),
+        Users(netid="stu", name="Stu Dent", email="stu@yale.edu"),
+        Ingredients(id=BUN, name="Bun"),
+        Ingredients(id=CHEDDAR, name="Cheddar"),
+        Ingredients(id=BACON, name="Bacon"),
+        MenuItems(id=1, name="Burger", price=600, description="d"),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=BUN, type="required"),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=CHEDDAR, type="choice", add_price=0),
+        MenuItemIngredients(menu_item_id=1, ingredient_id=BACON, type="optional", add_price=150),
+    ])
+    db.commit()
+    return start, end
+
+def place_order(db, at, selected=(CHEDDAR,)):
+    order = Orders(netid="stu", email="stu@yale.edu", total_price=600, timestamp=at)
+    item = OrderItems(menu_item_id=1, menu_item_name="Burger", menu_item_price=600)
+    item.selected_ingredients = [
+        OrderItemIngredient(ingredient_id=i, type="choice", ingredient_name="x") for i in selected
+    ]
+    order.order_items = [item]
+    db.add(order)
+
+def busy_history(db, start, nights=4, per_hour=4):
+    # `per_hour` burgers in each hour of the window on each of the last few nights
+    for night in range(1, nights + 1):
+        for hour in range(3):
+            for n in range(per_hour):
+                place_order(db, start - timedelta(days=night) + timedelta(hours=hour, minutes=10 * n))
+    db.commit()
+
+
+def test_profile_counts_required_ingredients(window, db):
+    start, _ = window
+    busy_history(db, start)
+
+    profile = demand_profile(service_date(start))
+
+    # Every burger uses a bun (required) and cheddar (chosen); nobody took bacon
+    assert sum(profile[BUN].values()) == pytest.approx(12)
+    assert profile[BUN] == profile[CHEDDAR]
+    assert BACON not in profile
+
+def test_required_ingredient_running_low_is_forecast(window, db):
+    start, end = window
+    busy_history(db, start)
+    db.query(Ingredients).filter_by(id=BUN).update({"stock_quantity": 5})
+    db.query(Ingredients).filter_by(id=BACON).update({"stock_quantity": 5})
+    db.commit()
+
+    by_id = {f["id"]: f for f in forecast_stock()}
+
+    assert by_id[BUN]["expected"] == pytest.approx(12, abs=0.5)
+    assert start < by_id[BUN]["runs_out_at"] < end
+    assert by_id[BACON]["expected"] == 0
+    assert by_id[BACON]["runs_out_at"] is None
+
+def test_low_stock_alert_fires_for_a_required_ingredient(app, window, db):
+    # app: check_stock pushes alerts through the Socket.IO server create_app sets up
+    start, _ = window
+    busy_history(db, start)
+    db.query(Ingredients).filter_by(id=BUN).update({"stock_quantity": 5})
+    db.commit()
+
+    alerts = check_stock()
+
+    assert [(a["ingredient_id"], a["level"]) for a in alerts] == [(BUN, "low")]
+    assert check_stock() == []   # once per level per night
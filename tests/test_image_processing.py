@@ -0,0 +1,203 @@
+import os
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from models import MenuItems
+from themybuttsite.utils import image_processing
+from themybuttsite.utils.image_processing import (
+    VARIANT_WIDTHS, build_variants, content_hash, enqueue_image_upload, fail_stale_uploads,
+    release_image, upload_image_variants,
+)
+from themybuttsite.utils.storage import LocalStorage
+
+
+def image_bytes(size=(1600, 900), mode="RGB", fmt="PNG", color=(200, 40, 40), exif=None):
+    img = Image.new(mode, size, color)
+    buf = BytesIO()
+    img.save(buf, format=fmt, **({"exif": exif} if exif is not None else {}))
+    return buf.getvalue()
+
+def decode(data):
+    img = Image.open(BytesIO(data))
+    img.load()
+    return img
+
+
+class RecordingStorage(LocalStorage):
+    """LocalStorage that remembers which keys were uploaded; can be made to fail."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.uploaded = []
+        self.fail = False
+
+    def upload(self, key, data, content_type, max_age):
+        if self.fail:
+            raise RuntimeError("storage down")
+        self.uploaded.append(key)
+        super().upload(key, data, content_type, max_age)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return RecordingStorage(tmp_path / "bucket")
+
+
+# ---- variants -------------------------------------------------------------
+
+def test_build_variants_renders_every_width_and_format():
+    data = image_bytes((1600, 900))
+    digest, variants, files = build_variants(data)
+
+    assert digest == content_hash(data)
+    assert set(variants) == set(VARIANT_WIDTHS)
+    assert len(files) == len(VARIANT_WIDTHS) * 2
+    for name, width in VARIANT_WIDTHS.items():
+        assert variants[name]["width"] == width
+        assert variants[name]["webp"] == f"img/{digest}/{name}.webp"
+        assert variants[name]["jpg"] == f"img/{digest}/{name}.jpg"
+
+    payloads = {key: (payload, mimetype) for key, payload, mimetype in files}
+    card, mimetype = payloads[variants["card"]["jpg"]]
+    assert mimetype == "image/jpeg"
+    assert decode(card).size == (640, 360)    # aspect ratio kept
+    assert decode(payloads[variants["card"]["webp"]][0]).format == "WEBP"
+
+def test_build_variants_never_upscales():
+    _, variants, files = build_variants(image_bytes((400, 300)))
+    assert variants["thumb"]["width"] == 320
+    assert variants["card"]["width"] == 400
+    assert variants["full"]["width"] == 400
+
+def test_build_variants_flattens_alpha_and_strips_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "GPS-Camera"      # Make
+    data = image_bytes((800, 600), mode="RGBA", color=(0, 0, 0, 0), fmt="PNG", exif=exif)
+    _, variants, files = build_variants(data)
+
+    for key, payload, _ in files:
+        img = decode(payload)
+        assert img.mode == "RGB"
+        assert not img.getexif()
+    # Transparent pixels come out white, not black
+    jpg = decode(dict((k, p) for k, p, _ in files)[variants["thumb"]["jpg"]])
+    assert min(jpg.getpixel((10, 10))) > 240
+
+def test_build_variants_rejects_corrupt_images():
+    with pytest.raises(Exception):
+        build_variants(image_bytes()[:200])
+
+
+# ---- uploads ---------------------------------------------------------------
+
+def test_upload_writes_every_variant_to_storage(db, storage):
+    data = image_bytes()
+    object_key, variants = upload_image_variants(data, storage)
+
+    assert object_key == variants["full"]["jpg"]
+    assert len(storage.uploaded) == len(VARIANT_WIDTHS) * 2
+    for key in storage.uploaded:
+        assert os.path.isfile(storage._path(key))
+
+def test_upload_skips_variants_already_in_the_bucket(db, storage):
+    data = image_bytes()
+    upload_image_variants(data, storage)
+    storage.uploaded.clear()
+
+    upload_image_variants(data, storage)
+    assert storage.uploaded == []
+
+def test_upload_reuses_variants_of_an_item_with_the_same_bytes(db, storage):
+    data = image_bytes()
+    object_key, variants = upload_image_variants(data, storage)
+    db.add(MenuItems(name="Burger", price=500, description="", object_key=object_key,
+                     image_variants=variants))
+    db.commit()
+    storage.uploaded.clear()
+
+    assert upload_image_variants(data, storage) == (object_key, variants)
+    assert storage.uploaded == []
+
+def test_release_image_keeps_images_still_in_use(db, storage):
+    object_key, variants = upload_image_variants(image_bytes(), storage)
+    db.add(MenuItems(name="Burger", price=500, description="", object_key=object_key,
+                     image_variants=variants))
+    db.commit()
+    assert release_image(object_key, storage) == 0
+
+    db.query(MenuItems).delete()
+    db.commit()
+    assert release_image(object_key, storage) == len(VARIANT_WIDTHS) * 2
+    assert storage.list("img") == []
+    assert release_image("default.png", storage) == 0
+
+
+# ---- background queue ------------------------------------------------------
+
+# The queue has one process-wide worker, bound to the first app that enqueues;
+# each test swaps in its own storage on that app
+QUEUE_APP = Flask(__name__)
+
+@pytest.fixture
+def queue_app(storage):
+    QUEUE_APP.extensions["image_storage"] = storage
+    return QUEUE_APP
+
+def pending_item(db, name="Burger"):
+    item = MenuItems(name=name, price=500, description="", object_key="default.png",
+                     image_status="pending", image_requested_at=datetime.now(timezone.utc))
+    db.add(item)
+    db.commit()
+    item_id = item.id
+    db.remove()
+    return item_id
+
+def test_queued_upload_marks_item_ready(db, storage, queue_app):
+    item_id = pending_item(db)
+    enqueue_image_upload(queue_app, item_id, image_bytes())
+    image_processing._jobs.join()
+
+    item = db.get(MenuItems, item_id)
+    assert item.image_status == "ready"
+    assert item.object_key == item.image_variants["full"]["jpg"]
+    assert item.object_key in storage.uploaded
+
+def test_failed_upload_marks_item_failed_and_keeps_old_image(db, storage, queue_app):
+    item_id = pending_item(db)
+    storage.fail = True
+    enqueue_image_upload(queue_app, item_id, image_bytes())
+    image_processing._jobs.join()
+
+    item = db.get(MenuItems, item_id)
+    assert item.image_status == "failed"
+    assert item.object_key == "default.png"
+
+def test_replaced_image_is_released(db, storage, queue_app):
+    item_id = pending_item(db)
+    enqueue_image_upload(queue_app, item_id, image_bytes(color=(1, 2, 3)))
+    enqueue_image_upload(queue_app, item_id, image_bytes(color=(4, 5, 6)))
+    image_processing._jobs.join()
+
+    item = db.get(MenuItems, item_id)
+    folders = [name for name, _ in storage.list("img")]
+    assert folders == [item.object_key.split("/")[1]]
+
+def test_stale_pending_uploads_are_marked_failed(db):
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        MenuItems(name="Old", price=1, description="", image_status="pending",
+                  image_requested_at=now - timedelta(hours=1)),
+        MenuItems(name="Legacy", price=1, description="", image_status="pending"),
+        MenuItems(name="Fresh", price=1, description="", image_status="pending",
+                  image_requested_at=now),
+        MenuItems(name="Done", price=1, description="", image_status="ready"),
+    ])
+    db.commit()
+
+    assert fail_stale_uploads(600) == 2
+    statuses = dict(db.query(MenuItems.name, MenuItems.image_status))
+    assert statuses == {"Old": "failed", "Legacy": "failed", "Fresh": "pending", "Done": "ready"}
@@ -0,0 +1,229 @@
+import json
+
+import pytest
+import stripe
+
+from models import (
+    Cart, CartItem, CartItemIngredient, Ingredients, MenuItemIngredients, MenuItems, Settings, Users,
+)
+from themybuttsite.extensions import db_session
+from themybuttsite.utils.calculation import load_cart, price_cart
+from themybuttsite.utils.catalog import bump_catalog_version, bump_menu_version
+
+TORTILLA, CHEDDAR, PEPPER_JACK, SALSA, GUAC = 1, 2, 3, 4, 5
+
+
+def add_menu(db):
+    """A quesadilla (450) and a burrito (600) with paid and free choices and add-ons."""
+    db.add_all([
+        Ingredients(id=TORTILLA, name="Tortilla"),
+        Ingredients(id=CHEDDAR, name="Cheddar"),
+        Ingredients(id=PEPPER_JACK, name="Pepper Jack"),
+        Ingredients(id=SALSA, name="Salsa"),
+        Ingredients(id=GUAC, name="Guac"),
+        MenuItems(id=1, name="Quesadilla", price=450, description="d"),
+        MenuItems(id=2, name="Burrito", price=600, description="d"),
+    ])
+    for item_id in (1, 2):
+        db.add_all([
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=TORTILLA, type="required"),
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=CHEDDAR, type="choice", add_price=0),
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=PEPPER_JACK, type="choice", add_price=50),
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=SALSA, type="optional", add_price=0),
+            MenuItemIngredients(menu_item_id=item_id, ingredient_id=GUAC, type="optional", add_price=125),
+        ])
+    db.commit()
+
+@pytest.fixture
+def menu(db):
+    db.add_all([
+        Settings(id=1, buttery_open=True, grill_open=True, announcement=""),
+        Users(netid="stu", name="Stu Dent", email="stu@yale.edu"),
+    ])
+    add_menu(db)
+    return db
+
+def add_line(db, item_id, choice=None, optional=(), unit_price=None, catalog_version=None, netid="stu"):
+    """A cart line as stored by add_to_cart (prices passed in, not derived)."""
+    if db.get(Cart, netid) is None:
+        db.add(Cart(netid=netid))
+    line = CartItem(cart_netid=netid, menu_item_id=item_id,
+                    unit_price=unit_price, catalog_version=catalog_version)
+    if choice is not None:
+        line.selected_ingredients.append(CartItemIngredient(ingredient_id=choice, type="choice"))
+    for ing in optional:
+        line.selected_ingredients.append(CartItemIngredient(ingredient_id=ing, type="optional"))
+    db.add(line)
+    db.commit()
+    return line.id
+
+
+# ---- price_cart: the catalog's current prices, in one query -----------------------
+
+def test_no_cart(menu):
+    assert price_cart("stu", menu) is None
+
+def test_empty_cart(menu):
+    menu.add(Cart(netid="stu"))
+    menu.commit()
+
+    cart = price_cart("stu", menu)
+
+    assert cart["lines"] == [] and cart["total"] == 0
+    assert cart["user_name"] == "Stu Dent" and cart["user_email"] == "stu@yale.edu"
+
+def test_prices_lines_and_total_from_the_menu(menu):
+    plain = add_line(menu, 1, choice=CHEDDAR)
+    loaded = add_line(menu, 2, choice=PEPPER_JACK, optional=(SALSA, GUAC))
+    bare = add_line(menu, 1)
+
+    cart = price_cart("stu", menu)
+
+    lines = {line["id"]: line for line in cart["lines"]}
+    assert lines[plain]["price"] == 450
+    assert lines[loaded]["base_price"] == 600
+    assert lines[loaded]["price"] == 600 + 50 + 0 + 125
+    assert lines[bare]["price"] == 450 and lines[bare]["ingredients"] == []
+    assert cart["total"] == 450 + 775 + 450
+    assert sorted(i["name"] for i in lines[loaded]["ingredients"]) == ["Guac", "Pepper Jack", "Salsa"]
+    assert {i["ingredient_id"]: i["add_price"] for i in lines[loaded]["ingredients"]} == {
+        PEPPER_JACK: 50, SALSA: 0, GUAC: 125,
+    }
+
+def test_uses_current_prices_not_stored_ones(menu):
+    line = add_line(menu, 2, choice=CHEDDAR, optional=(GUAC,), unit_price=725, catalog_version=1)
+    menu.query(MenuItems).filter_by(id=2).update({"price": 650})
+    menu.query(MenuItemIngredients).filter_by(menu_item_id=2, ingredient_id=GUAC).update({"add_price": 150})
+    menu.commit()
+
+    cart = price_cart("stu", menu)
+
+    assert cart["lines"][0]["id"] == line
+    assert cart["lines"][0]["price"] == 800
+    assert cart["total"] == 800
+
+def test_selection_no_longer_linked_to_the_item_adds_nothing(menu):
+    add_line(menu, 1, choice=CHEDDAR, optional=(GUAC,))
+    menu.query(MenuItemIngredients).filter_by(menu_item_id=1, ingredient_id=GUAC).delete()
+    menu.commit()
+
+    cart = price_cart("stu", menu)
+
+    assert cart["lines"][0]["price"] == 450 and cart["total"] == 450
+
+def test_only_prices_the_users_own_cart(menu):
+    menu.add(Users(netid="other", name="Other", email="other@yale.edu"))
+    menu.commit()
+    add_line(menu, 2, choice=PEPPER_JACK, optional=(GUAC,), netid="other")
+    add_line(menu, 1, choice=CHEDDAR)
+
+    assert price_cart("stu", menu)["total"] == 450
+    assert price_cart("other", menu)["total"] == 775
+
+
+# ---- load_cart: stored line prices, re-priced after a catalog change ----------------
+
+def stored(db, line_id):
+    line = db.get(CartItem, line_id)
+    db.refresh(line)
+    return line.unit_price, line.catalog_version
+
+def test_current_lines_are_read_back_as_stored(menu):
+    line = add_line(menu, 2, choice=CHEDDAR, optional=(GUAC,), unit_price=725, catalog_version=1)
+    # A price edited without a catalog bump isn't looked at: the stored price stands
+    menu.query(MenuItems).filter_by(id=2).update({"price": 999})
+    menu.commit()
+
+    cart, changed = load_cart("stu", menu)
+
+    assert changed == []
+    assert cart["lines"][0]["price"] == 725 and cart["total"] == 725
+    assert not cart["lines"][0]["stale"]
+    assert stored(menu, line) == (725, 1)
+
+def test_menu_version_bump_does_not_reprice(menu):
+    line = add_line(menu, 1, choice=CHEDDAR, unit_price=450, catalog_version=1)
+    bump_menu_version()
+    menu.commit()
+
+    cart, changed = load_cart("stu", menu)
+
+    assert changed == [] and not cart["lines"][0]["stale"]
+    assert stored(menu, line) == (450, 1)
+
+def test_catalog_bump_reprices_stores_and_reports_changes(menu):
+    moved = add_line(menu, 2, choice=CHEDDAR, optional=(GUAC,), unit_price=725, catalog_version=1)
+    same = add_line(menu, 1, choice=CHEDDAR, unit_price=450, catalog_version=1)
+    menu.query(MenuItemIngredients).filter_by(menu_item_id=2, ingredient_id=GUAC).update({"add_price": 200})
+    bump_catalog_version()
+    menu.commit()
+
+    cart, changed = load_cart("stu", menu)
+
+    assert [line["id"] for line in changed] == [moved]
+    assert {line["id"]: line["price"] for line in cart["lines"]} == {moved: 800, same: 450}
+    assert cart["total"] == 1250
+    assert stored(menu, moved) == (800, 2) and stored(menu, same) == (450, 2)
+    assert menu.get(CartItemIngredient, (moved, GUAC)).add_price == 200
+    user = menu.query(Users).filter_by(netid="stu").one()
+    assert (user.cart_count, user.cart_subtotal) == (2, 1250)
+
+    # Priced now: the next read is a plain read again
+    assert load_cart("stu", menu)[1] == []
+
+def test_unpriced_lines_are_priced_but_not_reported_as_changed(menu):
+    line = add_line(menu, 2, choice=PEPPER_JACK, unit_price=None, catalog_version=None)
+
+    cart, changed = load_cart("stu", menu)
+
+    assert changed == []
+    assert cart["lines"][0]["price"] == 650 and cart["total"] == 650
+    assert stored(menu, line) == (650, 1)
+
+
+# ---- through the routes ---------------------------------------------------------
+
+@pytest.fixture
+def shop(site):
+    add_menu(db_session)
+    db_session.remove()
+    return site
+
+def test_add_to_cart_stores_the_line_price(shop, client_as):
+    client_as("stu").post("/add_to_cart", data={"item_id": 2, "ingredients_choice": PEPPER_JACK,
+                                               "ingredient_ids": [SALSA, GUAC]})
+
+    line = db_session.query(CartItem).one()
+    assert (line.unit_price, line.catalog_version) == (600 + 50 + 0 + 125, 1)
+    selections = db_session.query(CartItemIngredient).filter_by(cart_item_id=line.id)
+    assert {s.ingredient_id: s.add_price for s in selections} == {PEPPER_JACK: 50, SALSA: 0, GUAC: 125}
+    db_session.remove()
+
+def test_checkout_refuses_a_cart_whose_prices_changed(shop, client_as, monkeypatch):
+    def no_stripe(**kwargs):
+        raise AssertionError("checkout went to Stripe with prices the user hasn't seen")
+    monkeypatch.setattr(stripe.checkout.Session, "create", no_stripe)
+
+    stu = client_as("stu")
+    stu.post("/add_to_cart", data={"item_id": 1, "ingredients_choice": CHEDDAR})
+    # Staff raise the quesadilla's price (cents; add-on prices in dollars)
+    client_as("staff", "staff").post("/staff/update_menu_item", data={
+        "id": 1, "name": "Quesadilla", "price": "525", "description": "d",
+        "ingredient_data": json.dumps({
+            "required": [TORTILLA],
+            "choice": {CHEDDAR: 0, PEPPER_JACK: 0.5},
+            "optional": {SALSA: 0, GUAC: 1.25},
+        }),
+    })
+    assert db_session.get(MenuItems, 1).price == 525
+    db_session.remove()
+
+    resp = stu.post("/stripe_checkout")
+
+    assert resp.status_code == 302 and resp.location.endswith("/cart")
+    with stu.session_transaction() as session:
+        assert "prices were updated: Quesadilla" in str(session.get("_flashes"))
+    cart = db_session.get(Cart, "stu")
+    assert cart.stripe_session_id is None
+    assert db_session.query(CartItem).one().unit_price == 525
+    db_session.remove()
@@ -0,0 +1,119 @@
+import logging
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import scoped_session, selectinload, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, OrderItems, Orders, Users
+from themybuttsite.utils.query_debug import init_query_debug
+
+# The listeners init_query_debug attaches can't be scoped to one test, so every test
+# gets an engine and session of its own instead of the shared ones from conftest
+
+
+@pytest.fixture
+def session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine, autoflush=False))
+    for i in range(4):
+        session.add(Users(id=i + 1, netid=f"u{i}", name=f"User {i}", email=f"u{i}@yale.edu"))
+        session.add(Orders(id=i + 1, netid=f"u{i}", email=f"u{i}@yale.edu", total_price=500))
+        session.add(OrderItems(order_id=i + 1, menu_item_name="Quesadilla", menu_item_price=500))
+    session.commit()
+    session.remove()
+    yield session
+    session.remove()
+    engine.dispose()
+
+
+def make_app(session, **config):
+    app = Flask(__name__)
+    app.config.update(config)
+    init_query_debug(app, [session.get_bind()], session)
+
+    @app.route("/lazy")
+    def lazy():
+        orders = session.scalars(select(Orders)).all()
+        return ",".join(o.users.name for o in orders)
+
+    @app.route("/eager")
+    def eager():
+        orders = session.scalars(select(Orders).options(selectinload(Orders.users))).all()
+        return ",".join(o.users.name for o in orders)
+
+    @app.teardown_request
+    def _remove(exc=None):
+        session.remove()
+
+    return app
+
+
+# ---- QUERY_DEBUG --------------------------------------------------------------
+
+def test_counts_selects_per_request(session):
+    client = make_app(session, QUERY_DEBUG="True").test_client()
+
+    # One for the orders, one lazy load per distinct user
+    assert client.get("/lazy").headers["X-Query-Count"] == "5"
+    assert client.get("/eager").headers["X-Query-Count"] == "2"
+
+def test_warns_about_a_repeated_select(session, caplog):
+    client = make_app(session, QUERY_DEBUG="True", QUERY_DEBUG_REPEAT=3).test_client()
+
+    with caplog.at_level(logging.WARNING, logger="perf"):
+        client.get("/lazy")
+
+    [record] = [r for r in caplog.records if r.name == "perf"]
+    assert "N+1? GET /lazy ran the same SELECT 4x" in record.getMessage()
+    assert "FROM users" in record.getMessage()
+
+def test_no_warning_below_the_threshold(session, caplog):
+    client = make_app(session, QUERY_DEBUG="True", QUERY_DEBUG_REPEAT=5).test_client()
+
+    with caplog.at_level(logging.WARNING, logger="perf"):
+        client.get("/lazy")
+        client.get("/eager")
+
+    assert not [r for r in caplog.records if r.name == "perf"]
+
+def test_off_by_default(session, caplog):
+    client = make_app(session).test_client()
+
+    with caplog.at_level(logging.WARNING, logger="perf"):
+        resp = client.get("/lazy")
+
+    assert resp.status_code == 200
+    assert "X-Query-Count" not in resp.headers
+    assert not [r for r in caplog.records if r.name == "perf"]
+
+
+# ---- RAISE_ON_LAZY_LOAD -------------------------------------------------------
+
+def test_lazy_load_raises(session):
+    app = make_app(session, RAISE_ON_LAZY_LOAD="True")
+    app.testing = True
+
+    with pytest.raises(InvalidRequestError, match="raise_on_sql"):
+        app.test_client().get("/lazy")
+
+def test_eager_load_still_works(session):
+    resp = make_app(session, RAISE_ON_LAZY_LOAD="True").test_client().get("/eager")
+
+    assert resp.status_code == 200
+    assert resp.text == "User 0,User 1,User 2,User 3"
+
+def test_many_to_one_from_the_identity_map_is_allowed(session):
+    make_app(session, RAISE_ON_LAZY_LOAD="True")
+
+    orders = session.scalars(select(Orders)).all()
+    items = session.scalars(select(OrderItems)).all()
+
+    # item.order points at orders' primary key and every order is already loaded, so
+    # following it needs no SQL (Orders.users joins on netid, which always does)
+    assert [item.order for item in items] == orders
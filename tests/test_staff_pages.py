@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from models import Orders, OrderItems, OrderItemIngredient
+from themybuttsite.extensions import db_session
+from themybuttsite.staff import pages
+
+
+def add_orders(label, n, start, step=timedelta(hours=7)):
+    """`n` one-item orders ("<label> 0" newest), `step` apart going back from `start`."""
+    ids = []
+    for i in range(n):
+        order = Orders(netid="stu", email="stu@yale.edu", total_price=400,
+                       timestamp=start - i * step, status="done", paid=True)
+        item = OrderItems(menu_item_name=f"{label} {i}", menu_item_price=400)
+        item.selected_ingredients = [
+            OrderItemIngredient(ingredient_name="Salsa", type="optional", add_price=0)
+        ]
+        order.order_items = [item]
+        db_session.add(order)
+        db_session.flush()
+        ids.append(order.id)
+    db_session.commit()
+    db_session.remove()
+    return ids
+
+
+# ---- /order_history_staff -----------------------------------------------------
+
+def test_history_pages_through_every_order_newest_first(site, client_as, monkeypatch):
+    monkeypatch.setattr(pages, "HISTORY_BATCH", 3)
+    now = datetime.now(timezone.utc)
+    add_orders("Recent", 8, now)
+    # Several orders in the same instant, across a batch boundary: the (timestamp, id)
+    # key must neither skip nor repeat any of them
+    add_orders("Tied", 4, now - timedelta(days=5), step=timedelta(0))
+
+    html = client_as("staff", "staff").get("/order_history_staff").get_data(as_text=True)
+
+    names = [f"Recent {i}" for i in range(8)] + [f"Tied {i}" for i in range(4)]
+    assert [html.count(name) for name in names] == [1] * len(names)
+    recent = [html.index(f"Recent {i}") for i in range(8)]
+    assert recent == sorted(recent)
+    assert max(recent) < min(html.index(f"Tied {i}") for i in range(4))
+
+def test_history_holds_no_transaction_between_batches(site, monkeypatch):
+    monkeypatch.setattr(pages, "HISTORY_BATCH", 2)
+    ids = add_orders("Order", 5, datetime.now(timezone.utc))
+
+    seen = []
+    with site.test_request_context():
+        for night, orders in pages._history_nights():
+            assert not db_session().in_transaction()
+            # What the batch loaded stays readable after the session let go of it
+            assert all(o.users.name and o.order_items[0].selected_ingredients for o in orders)
+            seen.extend(order.id for order in orders)
+
+    assert seen == ids
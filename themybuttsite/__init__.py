@@ -4,6 +4,10 @@ from flask import Flask
 from themybuttsite.extensions import socketio, cors, session_ext, init_db
 import themybuttsite.extensions as ext 
 from themybuttsite.firebase_admin_ext import init_firebase 
+from themybuttsite.auth.cas import init_cas
+from themybuttsite.utils.storage import init_storage
+from themybuttsite.utils.telemetry import init_telemetry
+from themybuttsite.utils.query_debug import init_query_debug
 
 def create_app(config_class='themybuttsite.config.Config'):
     app = Flask(__name__, template_folder="../templates", static_folder="../static")
@@ -17,8 +21,21 @@ def create_app(config_class='themybuttsite.config.Config'):
     socketio.init_app(app)        # Socket.IO
 
     # DB session (SQLAlchemy core)
-    init_db(app.config['DATABASE_URL'])
+    init_db(
+        app.config['DATABASE_URL'],
+        profile=app.config['DB_POOL_PROFILE'],
+        long_uri=app.config.get('DATABASE_URL_DIRECT'),
+        long_profile=app.config.get('DB_LONG_POOL_PROFILE'),
+        replica_uri=app.config.get('DATABASE_URL_REPLICA'),
+        replica_profile=app.config.get('DB_REPLICA_POOL_PROFILE'),
+        replica_sticky_seconds=app.config.get('DB_REPLICA_STICKY_SECONDS'),
+        pool_size=app.config.get('DB_POOL_SIZE'),
+        max_overflow=app.config.get('DB_MAX_OVERFLOW'),
+        pool_timeout=app.config.get('DB_POOL_TIMEOUT'),
+    )
     init_firebase(app)
+    init_cas(app)
+    init_storage(app)
 
     # Teardown: remove scoped_session at end of request/app context
     @app.teardown_request
@@ -33,36 +50,25 @@ def create_app(config_class='themybuttsite.config.Config'):
                 sess.commit()
         finally:
             sess.remove()
-    # in app factory
-    import time
-    import logging
-    from flask import g, request
-
-    # configure once (e.g., in create_app)
-    log = logging.getLogger("perf")
-    if not log.handlers:
-        h = logging.StreamHandler()
-        h.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-        log.addHandler(h)
-        log.setLevel(logging.INFO)
-        log.propagate = False
-
-    @app.before_request
-    def _start_timer():
-        g._t0 = time.perf_counter()
-
-    @app.after_request
-    def _log_slow(resp):
-        t0 = getattr(g, "_t0", None)
-        if t0 is not None:
-            dt_ms = (time.perf_counter() - t0) * 1000
-            if dt_ms > 250:  # tweak threshold
-                log.warning("SLOW %s %s %.0f ms status=%s",
-                            request.method, request.path, dt_ms, resp.status_code)
-                
-        return resp
-
-    
+
+    # ETags on read-mostly pages, fingerprinted + immutable static files
+    from themybuttsite.utils.http_cache import init_http_cache
+    from themybuttsite.utils.assets import init_assets
+    init_http_cache(app)
+    init_assets(app)      # asset_url() + precompressed built assets (npm run build)
+
+    # gzip/brotli for HTML + JSON (opt-in: COMPRESS_RESPONSES)
+    from themybuttsite.utils.compression import init_compression
+    init_compression(app)
+
+    # Local append-only backup of every finalized order (ORDER_ARCHIVE_DIR)
+    from themybuttsite.utils.archive import init_archive
+    init_archive(app)
+
+    # Per-request latency / query count / DB + external time, exposed on /metrics
+    init_telemetry(app, ext.engines.values())
+    init_query_debug(app, ext.engines.values(), ext.db_session)
+
     # Blueprints
     from themybuttsite.auth.routes import bp_auth
     from themybuttsite.consumer.api import bp_consumer_api
@@ -79,10 +85,17 @@ def create_app(config_class='themybuttsite.config.Config'):
 
     # Jinja filters
     from .jinjafilters.filters import register_filters
+    from .jinjafilters.fragments import init_fragment_cache, init_bytecode_cache
     register_filters(app)
+    init_fragment_cache(app)
+    init_bytecode_cache(app)
 
 
     # Socket.IO event handlers (IMPORT so decorators bind)
     from themybuttsite.staff import events as _
 
+    # Periodic jobs + their CLI entry points
+    from themybuttsite.jobs import init_jobs
+    init_jobs(app)
+
     return app
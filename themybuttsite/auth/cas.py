@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from themybuttsite.utils import metrics
+
+CAS_LATENCY = metrics.histogram(
+    "cas_validate_seconds", "Latency of CAS ticket validation requests"
+)
+CAS_RESULTS = metrics.counter(
+    "cas_validate_total", "CAS ticket validations by outcome"
+)
+
+
+class CasError(Exception):
+    """CAS could not be reached in time (timeout, refused, pool exhausted)."""
+    pass
+
+
+class CasValidator:
+    """
+    Validates CAS service tickets over a pooled keep-alive session.
+
+    - connect/read timeouts are short so a hung CAS never pins a worker for long
+    - at most `max_concurrency` validations are in flight; extra callers wait up to
+      `acquire_timeout` seconds and then fail fast with CasError
+    - rejected tickets are cached for `ticket_ttl` seconds, so a replayed bad ticket
+      (refresh / double redirect) does not go back to CAS. Accepted tickets are never
+      cached: a service ticket is single-use, and a cached "yes" would let anyone
+      holding a leaked ?ticket= URL log in as its owner
+    """
+
+    def __init__(self, validate_url, service_url, *, connect_timeout=2.0, read_timeout=4.0,
+                 max_concurrency=8, acquire_timeout=5.0, ticket_ttl=300, max_cached=1024,
+                 http=None, clock=time.monotonic):
+        self.validate_url = validate_url
+        self.service_url = service_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.acquire_timeout = acquire_timeout
+        self.ticket_ttl = ticket_ttl
+        self.max_cached = max_cached
+        self.clock = clock
+
+        if http is None:
+            http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+            http.mount("https://", adapter)
+            http.mount("http://", adapter)
+        self.http = http
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._cache = OrderedDict()  # rejected ticket -> expires_at
+        self._cache_lock = threading.Lock()
+
+    # ---- ticket cache -----------------------------------------------------
+
+    def _rejected(self, ticket):
+        now = self.clock()
+        with self._cache_lock:
+            expires_at = self._cache.get(ticket)
+            if expires_at is None:
+                return False
+            if now >= expires_at:
+                del self._cache[ticket]
+                return False
+            return True
+
+    def _remember_rejected(self, ticket):
+        with self._cache_lock:
+            self._cache[ticket] = self.clock() + self.ticket_ttl
+            self._cache.move_to_end(ticket)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    # ---- validation -------------------------------------------------------
+
+    @staticmethod
+    def parse(body):
+        """CAS 1.0 answer: 'yes\\n<netid>\\n' or 'no\\n\\n'. Returns netid or None."""
+        lines = (body or "").strip().splitlines()
+        if len(lines) >= 2 and lines[0].strip() == "yes" and lines[1].strip():
+            return lines[1].strip()
+        return None
+
+    def validate(self, ticket):
+        """
+        Return the netid for a valid ticket, None for a rejected one.
+        Raises CasError when CAS is unreachable or too busy.
+        """
+        if not ticket:
+            return None
+
+        if self._rejected(ticket):
+            CAS_RESULTS.inc(outcome="cached")
+            return None
+
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            CAS_RESULTS.inc(outcome="busy")
+            raise CasError("Too many CAS validations in flight")
+
+        t0 = time.perf_counter()
+        try:
+            resp = self.http.get(
+                self.validate_url,
+                params={"service": self.service_url, "ticket": ticket},
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            CAS_RESULTS.inc(outcome="error")
+            raise CasError(f"CAS validation failed: {e}")
+        finally:
+            CAS_LATENCY.observe(time.perf_counter() - t0)
+            self._slots.release()
+
+        netid = self.parse(resp.text)
+        CAS_RESULTS.inc(outcome="yes" if netid else "no")
+        if netid is None:
+            self._remember_rejected(ticket)
+        return netid
+
+
+def init_cas(app):
+    """Build the process-wide CAS validator when CAS login is enabled."""
+    if app.config.get("CAS_ENABLED") != "True":
+        return None
+    validator = CasValidator(
+        app.config.get("CAS_VALIDATE_URL"),
+        app.config.get("SERVICE_URL"),
+        connect_timeout=app.config["CAS_CONNECT_TIMEOUT"],
+        read_timeout=app.config["CAS_READ_TIMEOUT"],
+        max_concurrency=app.config["CAS_MAX_CONCURRENCY"],
+        ticket_ttl=app.config["CAS_TICKET_CACHE_TTL"],
+    )
+    app.extensions["cas_validator"] = validator
+    return validator
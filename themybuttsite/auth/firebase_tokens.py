@@ -0,0 +1,196 @@
+import logging
+import re
+import threading
+import time
+
+import jwt
+import requests
+from cryptography import x509
+
+from themybuttsite.utils.telemetry import external_call
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+ISSUER_PREFIX = "https://securetoken.google.com/"
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+log = logging.getLogger(__name__)
+
+
+class FirebaseTokenError(Exception):
+    pass
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally (RS256) against Google's public certs.
+
+    The certs are cached until their Cache-Control max-age runs out. Once we are
+    inside `refresh_margin` seconds of expiry a background thread refreshes them,
+    so after the first fetch a login never waits on Google.
+
+    A token with a `kid` we don't have may mean Google rotated early, so it triggers
+    a refetch, but at most once every `unknown_kid_interval` seconds: the login
+    endpoint is unauthenticated, and made-up kids must not buy outbound calls.
+
+    Logins that find the cache cold or expired fetch one at a time: the first one
+    fetches and the rest wait for it and reuse its certs.
+    """
+
+    def __init__(self, project_id, certs_url=GOOGLE_CERTS_URL, http=None,
+                 refresh_margin=300, leeway=60, timeout=(3, 5), unknown_kid_interval=60,
+                 clock=time.time):
+        if not project_id:
+            raise FirebaseTokenError("Firebase project id is required")
+        self.project_id = project_id
+        self.issuer = ISSUER_PREFIX + project_id
+        self.certs_url = certs_url
+        self.http = http or requests.Session()
+        self.refresh_margin = refresh_margin
+        self.leeway = leeway
+        self.timeout = timeout
+        self.unknown_kid_interval = unknown_kid_interval
+        self.clock = clock
+
+        self._keys = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()   # held across a synchronous fetch
+        self._refreshing = False
+        self._unknown_kid_refresh_at = None
+
+    # ---- cert cache -------------------------------------------------------
+
+    def refresh(self):
+        """Fetch Google's certs and replace the cache. Returns the new key map."""
+        with external_call("firebase_certs"):
+            resp = self.http.get(self.certs_url, timeout=self.timeout)
+            resp.raise_for_status()
+
+        keys = {}
+        try:
+            for kid, pem in resp.json().items():
+                cert = x509.load_pem_x509_certificate(pem.encode("utf-8"))
+                keys[kid] = cert.public_key()
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # A 200 with a body that isn't {kid: PEM}: bad JSON, wrong shape, bad cert
+            raise FirebaseTokenError(f"Malformed Firebase cert response: {e}")
+        if not keys:
+            raise FirebaseTokenError("Google returned no signing certificates")
+
+        match = _MAX_AGE_RE.search(resp.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else 3600
+
+        with self._lock:
+            self._keys = keys
+            self._expires_at = self.clock() + max_age
+        return keys
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("Background refresh of Firebase certs failed")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _get_keys(self):
+        now = self.clock()
+        with self._lock:
+            keys, expires_at = self._keys, self._expires_at
+
+        # Cold or fully expired cache: we have nothing valid to verify with
+        if not keys or now >= expires_at:
+            return self._refresh_cold()
+
+        # Still valid but close to expiry: keep serving, refresh off-thread
+        if now >= expires_at - self.refresh_margin:
+            self._refresh_in_background()
+        return keys
+
+    def _refresh_cold(self):
+        with self._fetch_lock:
+            # Whoever held the lock before us may have just fetched
+            with self._lock:
+                keys, expires_at = self._keys, self._expires_at
+            if keys and self.clock() < expires_at:
+                return keys
+            return self.refresh()
+
+    def _claim_unknown_kid_refresh(self):
+        """True for the one caller allowed to refetch for an unknown kid this interval."""
+        now = self.clock()
+        with self._lock:
+            last = self._unknown_kid_refresh_at
+            if last is not None and now - last < self.unknown_kid_interval:
+                return False
+            self._unknown_kid_refresh_at = now
+            return True
+
+    # ---- verification -----------------------------------------------------
+
+    def verify(self, id_token):
+        """
+        Return the decoded claims of a valid Firebase ID token.
+        Raises FirebaseTokenError for anything that does not verify.
+        """
+        if not id_token or not isinstance(id_token, str):
+            raise FirebaseTokenError("Missing ID token")
+
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as e:
+            raise FirebaseTokenError(f"Malformed ID token: {e}")
+
+        if header.get("alg") != "RS256":
+            raise FirebaseTokenError("ID token has an unexpected signing algorithm")
+        kid = header.get("kid")
+        if not kid:
+            raise FirebaseTokenError("ID token has no key id")
+
+        try:
+            keys = self._get_keys()
+            key = keys.get(kid)
+            if key is None and self._claim_unknown_kid_refresh():
+                # Google may have rotated keys before our cached copy expired
+                with self._fetch_lock:
+                    key = self.refresh().get(kid)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise FirebaseTokenError(f"Unable to fetch Firebase certs: {e}")
+        if key is None:
+            raise FirebaseTokenError("ID token signed with an unknown key")
+
+        try:
+            claims = jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise FirebaseTokenError(f"Invalid ID token: {e}")
+
+        sub = claims.get("sub")
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise FirebaseTokenError("ID token has an invalid subject")
+        auth_time = claims.get("auth_time")
+        if auth_time is not None and auth_time > self.clock() + self.leeway:
+            raise FirebaseTokenError("ID token auth_time is in the future")
+
+        claims["uid"] = sub
+        return claims
@@ -1,6 +1,4 @@
 from flask import Blueprint, render_template, request, redirect, flash, session, url_for, current_app, jsonify, abort
-import requests
-from firebase_admin import auth as fb_auth
 
 
 
@@ -8,6 +6,8 @@ from models import Users
 from themybuttsite.extensions import db_session
 from themybuttsite.wrappers.wrappers import login_required
 from themybuttsite.yalies_api.yalies_api import fetch_profile, YaliesError
+from themybuttsite.auth.firebase_tokens import FirebaseTokenError
+from themybuttsite.auth.cas import CasError
 
 bp_auth = Blueprint("auth", __name__)
 
@@ -46,17 +46,15 @@ def login():
             service = current_app.config.get("SERVICE_URL")
             return redirect(f"{cas_login}?service={service}")
 
-        # Validate CAS ticket
-        cas_validate = current_app.config.get("CAS_VALIDATE_URL")
-        service = current_app.config.get("SERVICE_URL")
-        validate_url = f"{cas_validate}?service={service}&ticket={ticket}"
-
-        resp = requests.get(validate_url, timeout=10)
-        lines = resp.text.strip().splitlines()
+        # Validate CAS ticket (pooled session, short timeouts, replay cache)
+        try:
+            netid = current_app.extensions["cas_validator"].validate(ticket)
+        except CasError:
+            flash("Yale CAS is slow to respond. Please try again.", "warning")
+            return redirect(url_for('auth.index'))
 
-        if lines and lines[0] == 'yes':
+        if netid:
             # Successful CAS login
-            netid = lines[1]
             session['netid'] = netid
 
             # Look up role in DB
@@ -100,8 +98,13 @@ def firebase_login():
     if not id_token:
         abort(400, "Missing idToken")
 
+    verifier = current_app.extensions["firebase_token_verifier"]
+    try:
+        decoded = verifier.verify(id_token)
+    except FirebaseTokenError:
+        abort(401, "Invalid or expired token")
+
     try:
-        decoded = fb_auth.verify_id_token(id_token)
         print(decoded, flush=True)
         email = decoded.get("email")
         print(email, flush=True)
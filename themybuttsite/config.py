@@ -8,10 +8,20 @@ class Config:
     SQLALCHEMY_DATABASE_URL = os.environ.get("SQLALCHEMY_DATABASE_URL")
     DATABASE_URL = os.environ.get("DATABASE_URL")
     DATABASE_URL_DIRECT = os.environ.get("DATABASE_URL_DIRECT")
+    DB_POOL_PROFILE = os.environ.get("DB_POOL_PROFILE", "pooler")        # "pooler" | "direct" | "pgbouncer"
+    DB_LONG_POOL_PROFILE = os.environ.get("DB_LONG_POOL_PROFILE")        # for DATABASE_URL_DIRECT; defaults to "direct"
+    DB_POOL_SIZE = int(os.environ["DB_POOL_SIZE"]) if os.environ.get("DB_POOL_SIZE") else None
+    DB_MAX_OVERFLOW = int(os.environ["DB_MAX_OVERFLOW"]) if os.environ.get("DB_MAX_OVERFLOW") else None
+    DB_POOL_TIMEOUT = int(os.environ["DB_POOL_TIMEOUT"]) if os.environ.get("DB_POOL_TIMEOUT") else None
+    DATABASE_URL_REPLICA = os.environ.get("DATABASE_URL_REPLICA")      # read replica; unset = primary only
+    DB_REPLICA_POOL_PROFILE = os.environ.get("DB_REPLICA_POOL_PROFILE")  # defaults to DB_POOL_PROFILE
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", "5"))
     SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
     SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY")
     SUPABASE_URL = os.environ.get("SUPABASE_URL")
     SUPABASE_BUCKET = os.environ.get("SUPABASE_BUCKET")
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase")   # "supabase" | "local"
+    STORAGE_LOCAL_DIR = os.environ.get("STORAGE_LOCAL_DIR", "instance/storage")
     SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
     SECRET_KEY = os.environ.get("SECRET_KEY")
     REDIS_URL = os.environ.get("REDIS_URL")
@@ -19,11 +29,47 @@ class Config:
     CAS_VALIDATE_URL= os.environ.get("CAS_VALIDATE_URL")
     SERVICE_URL= os.environ.get("SERVICE_URL")
     CAS_ENABLED = os.environ.get("CAS_ENABLED")
+    CAS_CONNECT_TIMEOUT = float(os.environ.get("CAS_CONNECT_TIMEOUT", "2"))
+    CAS_READ_TIMEOUT = float(os.environ.get("CAS_READ_TIMEOUT", "4"))
+    CAS_MAX_CONCURRENCY = int(os.environ.get("CAS_MAX_CONCURRENCY", "8"))
+    CAS_TICKET_CACHE_TTL = int(os.environ.get("CAS_TICKET_CACHE_TTL", "300"))   # rejected tickets only
     FIREBASE_SERVICE_ACCOUNT = os.environ.get("FIREBASE_SERVICE_ACCOUNT")
+    FIREBASE_PROJECT_ID = os.environ.get("FIREBASE_PROJECT_ID")
     SHEETS_SPREADSHEET_ID = os.environ.get("SHEETS_SPREADSHEET_ID")
     SHEETS_TEMPLATE_TITLE = os.environ.get("SHEETS_TEMPLATE_TITLE")
     GOOGLE_CREDENTIALS_JSON = os.environ.get("GOOGLE_CREDENTIALS_JSON")
 
+    # --- Background jobs (single gunicorn worker, so in-process is fine) ---
+    BACKGROUND_JOBS_ENABLED = os.environ.get("BACKGROUND_JOBS_ENABLED", "True")
+    IMAGE_SWEEP_INTERVAL = int(os.environ.get("IMAGE_SWEEP_INTERVAL", "21600"))   # seconds; 0 disables
+    IMAGE_SWEEP_GRACE = int(os.environ.get("IMAGE_SWEEP_GRACE", "3600"))
+    IMAGE_UPLOAD_TIMEOUT = int(os.environ.get("IMAGE_UPLOAD_TIMEOUT", "600"))     # seconds pending before 'failed'; 0 disables
+    ROLLUP_REFRESH_INTERVAL = int(os.environ.get("ROLLUP_REFRESH_INTERVAL", "120"))  # seconds; 0 disables
+    STOCK_FORECAST_INTERVAL = int(os.environ.get("STOCK_FORECAST_INTERVAL", "120"))  # seconds; 0 disables
+    CART_REAP_INTERVAL = int(os.environ.get("CART_REAP_INTERVAL", "900"))   # seconds; 0 disables
+    CART_IDLE_TIMEOUT = int(os.environ.get("CART_IDLE_TIMEOUT", "7200"))    # carts idle this long are deleted
+
+    # --- Response compression (HTML / JSON; static assets are precompressed) ---
+    COMPRESS_RESPONSES = os.environ.get("COMPRESS_RESPONSES")                  # "True" enables
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))       # bytes; smaller bodies go out as-is
+    COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))  # used when `brotli` is installed
+
+    # --- Order archive (local append-only backup, see utils/archive.py) ---
+    ORDER_ARCHIVE_DIR = os.environ.get("ORDER_ARCHIVE_DIR", "instance/order-archive")   # "" disables
+    ORDER_ARCHIVE_FSYNC_INTERVAL = float(os.environ.get("ORDER_ARCHIVE_FSYNC_INTERVAL", "1"))  # seconds
+    ORDER_ARCHIVE_FSYNC_BATCH = int(os.environ.get("ORDER_ARCHIVE_FSYNC_BATCH", "32"))         # records
+
+    # --- Templates ---
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", "2048"))   # {% cache %} entries; 0 disables
+    JINJA_BYTECODE_CACHE = os.environ.get("JINJA_BYTECODE_CACHE", "True")    # "False" disables
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get("JINJA_BYTECODE_CACHE_DIR")      # unset: Jinja's per-user 0700 temp dir
+
+    # --- Query debugging (dev / test only) ---
+    QUERY_DEBUG = os.environ.get("QUERY_DEBUG")                  # "True": count SELECTs, flag N+1 repeats
+    QUERY_DEBUG_REPEAT = int(os.environ.get("QUERY_DEBUG_REPEAT", "3"))
+    RAISE_ON_LAZY_LOAD = os.environ.get("RAISE_ON_LAZY_LOAD")    # "True": lazy loads raise (raiseload)
+
     # --- Sessions  ---
     SESSION_TYPE = "redis" 
     SESSION_PERMANENT = True
@@ -1,10 +1,11 @@
-from flask import Blueprint, request, session, flash, redirect, url_for
-from sqlalchemy.orm import selectinload
+from flask import Blueprint, request, session, flash, redirect, url_for, jsonify
+from sqlalchemy.orm import selectinload, joinedload
 
-from models import Cart, CartItem, CartItemIngredient
+from models import Cart, CartItem, CartItemIngredient, MenuItems, MenuItemIngredients, Settings, Users
 from themybuttsite.wrappers.wrappers import login_required, cart_unlocked_required
 from themybuttsite.extensions import db_session
 from themybuttsite.utils.validation import validate_item  
+from themybuttsite.utils.carts import sync_cart_summary
 
 
 
@@ -27,11 +28,26 @@ def add_to_cart():
     optional_ids = list(set(int(i) for i in request.form.getlist("ingredient_ids")))
     choice_ids = list(set(int(i) for i in request.form.getlist("ingredients_choice")))
 
-    if not validate_item(item_id, choice_ids, optional_ids):
+    # Settings before the item: if the menu changes in between, the line is stamped with
+    # the older version and gets re-priced on read rather than keeping a stale price
+    settings = db_session.query(Settings).one()
+    item = (
+        db_session.query(MenuItems)
+        .options(selectinload(MenuItems.menu_item_ingredients).selectinload(MenuItemIngredients.ingredient))
+        .filter_by(id=item_id)
+        .first()
+    )
+    if not validate_item(item_id, choice_ids, optional_ids, settings=settings, item=item):
         return redirect(url_for("consumer_pages.buttery"))
 
-    # Create cart item
-    cart_item = CartItem(cart_netid=netid, menu_item_id=item_id)
+    # Price the line now so cart views read it back instead of re-deriving it
+    add_prices = {link.ingredient_id: link.add_price or 0 for link in item.menu_item_ingredients}
+    cart_item = CartItem(
+        cart_netid=netid,
+        menu_item_id=item_id,
+        unit_price=item.price + sum(add_prices[i] for i in choice_ids + optional_ids),
+        catalog_version=settings.catalog_version,
+    )
     db_session.add(cart_item)
     db_session.flush()
 
@@ -40,7 +56,8 @@ def add_to_cart():
         db_session.add(CartItemIngredient(
             cart_item_id=cart_item.id,
             ingredient_id=choice_ids[0],
-            type="choice"
+            type="choice",
+            add_price=add_prices[choice_ids[0]]
         ))
 
     # Optional ingredients
@@ -48,9 +65,11 @@ def add_to_cart():
         db_session.add(CartItemIngredient(
             cart_item_id=cart_item.id,
             ingredient_id=ing_id,
-            type="optional"
+            type="optional",
+            add_price=add_prices[ing_id]
         ))
 
+    sync_cart_summary(netid)
     db_session.commit()
 
     flash("Item added to cart.", "success")
@@ -68,12 +87,18 @@ def remove_from_cart():
         flash("Item ID is missing or invalid.", "danger")
         return redirect("/cart")
 
-    cart_item = db_session.query(CartItem).filter_by(id=item_id, cart_netid=netid).first()
+    cart_item = (
+        db_session.query(CartItem)
+        .options(joinedload(CartItem.menu_item))
+        .filter_by(id=item_id, cart_netid=netid)
+        .first()
+    )
 
     if cart_item:
         # ✅ Grab name before delete
         item_name = cart_item.menu_item.name  
         db_session.delete(cart_item)
+        sync_cart_summary(netid)
         db_session.commit()
         
         flash(f'Removed {item_name} from your cart.', 'success')
@@ -94,13 +119,21 @@ def clear_cart():
         return redirect(url_for('consumer_pages.view_cart'))  # or url_for('consumer_pages.cart')
 
     db_session.delete(cart)
+    sync_cart_summary(netid)
     db_session.commit()
 
     flash('Your cart has been cleared.', 'success')
     return redirect(url_for('consumer_pages.view_cart'))  # or url_for('consumer_pages.cart')
 
-
-
-
-
-
+@bp_consumer_api.route('/cart_summary')
+@login_required
+def cart_summary():
+    """Cart badge for the header: read off the user row, never the cart tables."""
+    summary = (
+        db_session.query(Users.cart_count, Users.cart_subtotal, Users.cart_locked)
+        .filter_by(netid=session.get('netid'))
+        .first()
+    )
+    if not summary:
+        return jsonify(count=0, subtotal=0, locked=False)
+    return jsonify(count=summary.cart_count, subtotal=summary.cart_subtotal, locked=summary.cart_locked)
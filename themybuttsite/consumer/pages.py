@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template, session, flash, redirect, url_for, current_app, request
+from flask import Blueprint, render_template, session, flash, redirect, url_for, current_app, request, make_response
 from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, timezone
 
 from models import (
     Users, MenuItems, MenuItemIngredients,
@@ -8,10 +9,11 @@ from models import (
     Settings
 )
 from themybuttsite.wrappers.wrappers import login_required
-from themybuttsite.extensions import db_session
+from themybuttsite.extensions import db_session, route_to
 from themybuttsite.yalies_api.yalies_api import fetch_profile, YaliesError
 from themybuttsite.utils.time import service_date 
-from themybuttsite.utils.calculation import calculate_cart_total
+from themybuttsite.utils.calculation import load_cart
+from themybuttsite.utils.http_cache import page_etag, not_modified, with_etag
 
 bp_consumer_pages = Blueprint("consumer_pages", __name__)
 
@@ -20,7 +22,8 @@ bp_consumer_pages = Blueprint("consumer_pages", __name__)
 def buttery():
     netid = session.get('netid')
 
-    user = db_session.query(Users).options(selectinload(Users.cart)).filter_by(netid=netid).first()
+    # The cart badge comes from the user row (Users.cart_count), so no cart queries here
+    user = db_session.query(Users).filter_by(netid=netid).first()
 
     if not user:
         try:
@@ -40,20 +43,31 @@ def buttery():
     grill_open = settings.grill_open
     announcement = settings.announcement
 
-
-    # Menu items
-    menu_items = (
-        db_session.query(MenuItems)
-        .options(
-            joinedload(MenuItems.menu_item_ingredients)
-            .joinedload(MenuItemIngredients.ingredient)
-        )
-        .filter(
-            (MenuItems.requires_grill == False) |
-            ((MenuItems.requires_grill == True) & (grill_open == True))
-        )
-        .all()
+    # Everything the page shows is covered by these versions; a refresh with nothing
+    # new costs two small queries and a 304
+    etag = page_etag(
+        "buttery", netid, user.name, user.cart_count, user.order_seq,
+        settings.menu_version, buttery_open, grill_open, announcement,
     )
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Menu items: only loaded when the cached menu block (keyed by menu version +
+    # grill state) has to be rendered again
+    def load_menu():
+        return (
+            db_session.query(MenuItems)
+            .options(
+                joinedload(MenuItems.menu_item_ingredients)
+                .joinedload(MenuItemIngredients.ingredient)
+            )
+            .filter(
+                (MenuItems.requires_grill == False) |
+                ((MenuItems.requires_grill == True) & (grill_open == True))
+            )
+            .all()
+        )
 
     orders = (
         db_session.query(Orders)
@@ -70,20 +84,17 @@ def buttery():
         .all()
     )
 
-
-    # Cart count
-    cart_count = db_session.query(CartItem).filter_by(cart_netid=netid).count()
-
-    return render_template(
+    return with_etag(make_response(render_template(
         'consumer/buttery.html',
-        menu_items=menu_items,
+        load_menu=load_menu,
+        menu_version=settings.menu_version,
         orders=orders,
         buttery_open=buttery_open,
         grill_open=grill_open,
         user=user,
-        cart_count=cart_count,
+        cart_count=user.cart_count,
         announcement=announcement
-    )
+    )), etag)
 
 @bp_consumer_pages.route('/order_history')
 @login_required
@@ -91,20 +102,34 @@ def order_history():
 
     netid = session['netid']
 
-    orders = (
-        db_session.query(Orders)
-        .options(
-            joinedload(Orders.users),
-            selectinload(Orders.order_items)
-                .selectinload(OrderItems.menu_item),
-            selectinload(Orders.order_items)
-                .selectinload(OrderItems.selected_ingredients)
-                .selectinload(OrderItemIngredient.ingredient),
+    # Only changes when one of this user's orders does (Users.order_seq). Read on the
+    # primary: the webhook that just created their order can't pin their session
+    order_seq = db_session.query(Users.order_seq).filter_by(netid=netid).scalar()
+    etag = page_etag("order_history", netid, order_seq)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # The orders themselves come from the replica once it has caught up to order_seq
+    with route_to("replica"):
+        replica_seq = db_session.query(Users.order_seq).filter_by(netid=netid).scalar()
+    route = "replica" if replica_seq == order_seq else "default"
+
+    with route_to(route):
+        orders = (
+            db_session.query(Orders)
+            .options(
+                joinedload(Orders.users),
+                selectinload(Orders.order_items)
+                    .selectinload(OrderItems.menu_item),
+                selectinload(Orders.order_items)
+                    .selectinload(OrderItems.selected_ingredients)
+                    .selectinload(OrderItemIngredient.ingredient),
+            )
+            .filter_by(netid=netid)
+            .order_by(Orders.timestamp.desc())
+            .all()
         )
-        .filter_by(netid=netid)
-        .order_by(Orders.timestamp.desc())
-        .all()
-    )
 
     # compute service_date 
     for order in orders:
@@ -116,62 +141,47 @@ def order_history():
         sorted_orders.setdefault(order.service_date, []).append(order)
     sorted_orders = dict(sorted(sorted_orders.items(), key=lambda x: x[0], reverse=True))
 
-    return render_template('consumer/order_history.html', orders=sorted_orders)
+    return with_etag(make_response(render_template(
+        'consumer/order_history.html', orders=sorted_orders,
+        tonight=service_date(datetime.now(timezone.utc))
+    )), etag)
 
 @bp_consumer_pages.route('/cart') 
 @login_required
 def view_cart():
     netid = session.get('netid')
 
-    cart = (
-        db_session.query(Cart)
-        .options(
-            # Load items, each item's menu_item, and each item's selected_ingredients + ingredient
-            selectinload(Cart.items).selectinload(CartItem.menu_item),
-            selectinload(Cart.items)
-                .selectinload(CartItem.selected_ingredients)
-                .selectinload(CartItemIngredient.ingredient),
-        )
-        .filter_by(netid=netid)
-        .first()
-    )
+    # Lines with the prices stored when they were added; re-priced only after a menu change
+    cart, changed = load_cart(netid, db_session)
 
-    if not cart or not cart.items:
+    if not cart or not cart["lines"]:
         flash("Your cart is empty.", "info")
         return render_template('consumer/cart.html', cart=None, total_price=0)
+    _flash_price_changes(changed)
 
-    total_price, cart = calculate_cart_total(cart, db_session)
-
-    return render_template('consumer/cart.html', cart=cart, total_price=total_price)
+    return render_template('consumer/cart.html', cart=cart, total_price=cart["total"])
 
 @bp_consumer_pages.route('/checkout_summary', methods=['GET', 'POST'])
 @login_required
 def checkout_summary():
     netid = session.get('netid')
 
-    cart = (
-        db_session.query(Cart)
-        .options(
-            selectinload(Cart.items).selectinload(CartItem.menu_item),
-            selectinload(Cart.items)
-                .selectinload(CartItem.selected_ingredients)
-                .selectinload(CartItemIngredient.ingredient),
-                
+    if request.method == "POST":
+        new_spec = (request.form.get('cart_specifications') or '').strip()
+        db_session.query(Cart).filter_by(netid=netid).update(
+            {Cart.specifications: new_spec[:40]},  # enforce 40 chars max
+            synchronize_session=False,
         )
-        .filter_by(netid=netid)
-        .first()
-    )
+        db_session.commit()
+
+    cart, changed = load_cart(netid, db_session)
 
-    if not cart or not cart.items:
+    if not cart or not cart["lines"]:
         flash("Your cart is empty.", "info")
         return redirect(url_for('consumer_pages.view_cart'))
-    
-    if request.method == "POST":
-        new_spec = (request.form.get('cart_specifications') or '').strip()
-        cart.specifications = new_spec[:40]  # enforce 40 chars max
-        db_session.commit()
+    _flash_price_changes(changed)
 
-    total_price, cart = calculate_cart_total(cart, db_session)
+    total_price = cart["total"]
 
 
     return render_template(
@@ -179,3 +189,8 @@ def checkout_summary():
         cart=cart,
         total_price=total_price
     )
+
+def _flash_price_changes(changed):
+    if changed:
+        names = ", ".join(line["name"] for line in changed)
+        flash(f"The menu changed since you added these, and their prices were updated: {names}", "warning")
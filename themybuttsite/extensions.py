@@ -1,38 +1,200 @@
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, session as http_session
 from flask_cors import CORS
 from flask_session import Session
 from flask_socketio import SocketIO
-from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker, Session as OrmSession
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.pool import QueuePool, NullPool
+
+from themybuttsite.utils import metrics
 
 # Flask extensions
 socketio = SocketIO(cors_allowed_origins="*", async_mode="threading")
 cors = CORS()
 session_ext = Session()
 
-# SQLAlchemy 
+# SQLAlchemy
 engine = None
 db_session = None
+engines = {}   # route name -> Engine; "default" is always present
+
+# Where a route goes when its engine isn't configured: replica -> long -> default
+ROUTE_FALLBACKS = {"replica": "long", "long": "default"}
+# After a user writes, their replica reads go to the primary for this long
+REPLICA_STICKY_SECONDS = 5
+
+POOL_WAIT = metrics.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled DB connection"
+)
+POOL_IN_USE = metrics.gauge(
+    "db_pool_connections_in_use", "Connections currently checked out, per pool"
+)
+
+
+class _TimedQueuePool(QueuePool):
+    metrics_name = "default"
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - t0, pool=self.metrics_name)
 
-def init_db(uri):
-    global engine, db_session
-    engine = create_engine(
-    uri,
-    pool_size=10,
-    max_overflow=5,
-    pool_pre_ping=True,        # ping before checkout; auto-dispose dead conns
-    pool_recycle=300,          # recycle connections before Supabase/pgbouncer idles them
-    pool_timeout=30,
-    connect_args={
+def _timed_pool(name):
+    # Class attribute (not an instance one) so it survives pool.recreate() on dispose
+    return type(f"TimedQueuePool_{name}", (_TimedQueuePool,), {"metrics_name": name})
+
+
+# Engine profiles. Explicit pool_* settings from config override these.
+DB_PROFILES = {
+    # Supabase session-mode pooler: idle sockets get cut, so ping + recycle early
+    "pooler": dict(pool_size=10, max_overflow=5, pool_pre_ping=True, pool_recycle=300, pool_timeout=30),
+    # Direct Postgres: TCP keepalives keep sockets healthy, no ping round trip per checkout
+    "direct": dict(pool_size=10, max_overflow=5, pool_pre_ping=False, pool_recycle=1800,
+                   pool_timeout=30, pool_use_lifo=True),
+    # pgbouncer / Supavisor transaction mode: the bouncer pools, we must not hold connections
+    "pgbouncer": dict(poolclass=NullPool),
+}
+
+def make_engine(uri, profile="pooler", *, name="default", statement_timeout_ms=30000,
+                read_only=False, **overrides):
+    if profile not in DB_PROFILES:
+        raise RuntimeError(f"Unknown DB pool profile '{profile}'")
+    settings = dict(DB_PROFILES[profile])
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+
+    connect_args = {
         # SSL + TCP keepalives so intermediaries don’t kill idle sockets
         "sslmode": "require",
         "keepalives": 1,
         "keepalives_idle": 30,
         "keepalives_interval": 10,
         "keepalives_count": 5,
-        # Optional: set a server statement timeout to avoid zombie transactions
-        "options": "-c statement_timeout=30000 -c idle_in_transaction_session_timeout=15000",
-    },)
+    }
+    if "sslmode" in make_url(uri).query:
+        del connect_args["sslmode"]   # an explicit ?sslmode= wins (e.g. a local Postgres without SSL)
+    if profile == "pgbouncer":
+        # Transaction-mode bouncers reject startup `options` and can't keep
+        # server-side prepared statements across transactions
+        if uri.startswith("postgresql+psycopg://"):
+            connect_args["prepare_threshold"] = None
+        settings.pop("pool_size", None)
+        settings.pop("max_overflow", None)
+        settings.pop("pool_timeout", None)
+    else:
+        # Server statement timeout to avoid zombie transactions
+        connect_args["options"] = (
+            f"-c statement_timeout={statement_timeout_ms} -c idle_in_transaction_session_timeout=15000"
+        )
+        if read_only:
+            connect_args["options"] += " -c default_transaction_read_only=on"
+        settings.setdefault("poolclass", _timed_pool(name))
 
-    db_session = scoped_session(sessionmaker(bind=engine, autoflush=False))
-    return engine, db_session
+    eng = create_engine(uri, connect_args=connect_args, **settings)
+
+    @event.listens_for(eng, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        POOL_IN_USE.inc(1, pool=name)
 
+    @event.listens_for(eng, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        POOL_IN_USE.inc(-1, pool=name)
+
+    return eng
+
+
+def _wrote_recently():
+    if not has_request_context():
+        return False
+    wrote_at = http_session.get("_db_wrote_at")
+    return wrote_at is not None and time.time() - wrote_at < REPLICA_STICKY_SECONDS
+
+class RoutingSession(OrmSession):
+    """
+    Picks an engine per statement from session.info["route"] (see `route_to`).
+    Flushes and INSERT / UPDATE / DELETE statements always go to the default
+    engine. "replica" reads fall back to the primary when no replica is configured,
+    or when the logged-in user wrote something in the last REPLICA_STICKY_SECONDS
+    (read-your-writes).
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or getattr(clause, "is_dml", False):
+            return engines["default"]
+        route = self.info.get("route", "default")
+        if route == "replica" and _wrote_recently():
+            route = ROUTE_FALLBACKS["replica"]
+        return engine_for(route)
+
+def engine_for(route):
+    """The engine serving `route`, following ROUTE_FALLBACKS when it isn't configured."""
+    while route not in engines:
+        route = ROUTE_FALLBACKS.get(route, "default")
+    return engines[route]
+
+@event.listens_for(RoutingSession, "after_flush")
+def _remember_write(session, flush_context):
+    # Only logged-in users have follow-up reads worth pinning here. Writes made on
+    # someone else's behalf (the Stripe webhook) can't reach their session; pages
+    # that must show those check Users.order_seq on the primary instead
+    if has_request_context() and "netid" in http_session:
+        http_session["_db_wrote_at"] = time.time()
+
+@contextmanager
+def route_to(route):
+    """
+    Send the current request's queries to `route` ("long", "replica") for the duration.
+    Usable as `with route_to("long"):` or as a view decorator `@route_to("long")`.
+    Unconfigured routes fall back along ROUTE_FALLBACKS.
+    """
+    previous = db_session.info.get("route")
+    db_session.info["route"] = route
+    try:
+        yield
+    finally:
+        if previous is None:
+            db_session.info.pop("route", None)
+        else:
+            db_session.info["route"] = previous
+
+
+def init_db(uri, *, profile="pooler", long_uri=None, long_profile=None,
+            replica_uri=None, replica_profile=None, replica_sticky_seconds=None,
+            pool_size=None, max_overflow=None, pool_timeout=None, long_statement_timeout_ms=120000):
+    """
+    "default" engine: short request transactions (cart, checkout, webhook, staff updates).
+    "long" engine:    long primary reads on their own pool over DATABASE_URL_DIRECT, so
+                      they can't starve order intake. Only when DATABASE_URL_DIRECT is
+                      set: a second pool on the same pooler URI would just take more of
+                      Supabase's connection limit, so "long" then uses "default" (and
+                      its statement timeout).
+    "replica" engine: staleness-tolerant reads (history, menu admin, closing sync).
+                      Only when DATABASE_URL_REPLICA is set; otherwise they use "long".
+    """
+    global engine, db_session, REPLICA_STICKY_SECONDS
+    engines.clear()
+    engine = engines["default"] = make_engine(
+        uri, profile, name="default",
+        pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout,
+    )
+    if long_uri:
+        engines["long"] = make_engine(
+            long_uri, long_profile or "direct", name="long",
+            statement_timeout_ms=long_statement_timeout_ms,
+            pool_size=3, max_overflow=2, pool_timeout=30,
+        )
+    if replica_uri:
+        engines["replica"] = make_engine(
+            replica_uri, replica_profile or profile, name="replica",
+            statement_timeout_ms=long_statement_timeout_ms, read_only=True,
+            pool_size=5, max_overflow=5, pool_timeout=30,
+        )
+    if replica_sticky_seconds is not None:
+        REPLICA_STICKY_SECONDS = replica_sticky_seconds
+
+    db_session = scoped_session(sessionmaker(class_=RoutingSession, autoflush=False))
+    return engine, db_session
@@ -1,19 +1,41 @@
 import json, firebase_admin
+from threading import Thread
 from firebase_admin import credentials
 
-def init_firebase(app):
-    if firebase_admin._apps:
-        return firebase_admin.get_app()
+from themybuttsite.auth.firebase_tokens import FirebaseTokenVerifier
 
+def init_firebase(app):
     sa_json = app.config.get("FIREBASE_SERVICE_ACCOUNT")
     if not sa_json:
         raise RuntimeError("FIREBASE_SERVICE_ACCOUNT not set in config")
 
     info = json.loads(sa_json)
+    init_token_verifier(app, info.get("project_id") or app.config.get("FIREBASE_PROJECT_ID"))
+
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+
     cred = credentials.Certificate(info)
 
     opts = {}
     if info.get("project_id"):
         opts["projectId"] = info["project_id"]
 
-    return firebase_admin.initialize_app(cred, opts or None)
\ No newline at end of file
+    return firebase_admin.initialize_app(cred, opts or None)
+
+def init_token_verifier(app, project_id):
+    """
+    Local ID-token verifier used by auth.firebase_login.
+    Certs are fetched once in the background at startup so the first login is warm.
+    """
+    verifier = FirebaseTokenVerifier(project_id)
+    app.extensions["firebase_token_verifier"] = verifier
+
+    def warm():
+        try:
+            verifier.refresh()
+        except Exception:
+            app.logger.exception("Initial Firebase cert fetch failed")
+
+    Thread(target=warm, daemon=True).start()
+    return verifier
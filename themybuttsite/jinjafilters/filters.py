@@ -1,17 +1,21 @@
-from flask import current_app
-from zoneinfo import ZoneInfo
-from urllib.parse import quote
+from themybuttsite.utils.time import YALE_TZ
+
+# These run inside loops over every order / menu item, so anything that does not
+# depend on the argument is computed once: the zone, the format, the image URL prefix.
+EST_FORMAT = "%Y-%m-%d %I:%M %p"
+IMAGE_PATH = "/storage/v1/object/public/"
 
 
 def format_est(dt):
     """Convert a datetime to EST and format as 'YYYY-MM-DD HH:MM AM/PM'."""
     if not dt:
         return ""
-    yale_tz = ZoneInfo("America/New_York")
-    return dt.astimezone(yale_tz).strftime("%Y-%m-%d %I:%M %p")
+    return dt.astimezone(YALE_TZ).strftime(EST_FORMAT)
 
 def format_price(cents):
     """Convert price in cents to a string like $3.50, or $3 if whole dollars."""
+    if type(cents) is int:   # the usual case: skip the float round-trip
+        return f"${cents // 100}" if cents % 100 == 0 else f"${cents / 100:,.2f}"
     try:
         dollars = cents / 100  # keep float precision
         if float(dollars).is_integer():
@@ -26,13 +30,30 @@ def cents_to_dollars(cents):
     except (TypeError, ValueError):
         return ""
 
-def public_image_url(key):
-    base = current_app.config.get("SUPABASE_URL").rstrip("/")
-    bucket = current_app.config.get("SUPABASE_BUCKET")
-    return f"{base}/storage/v1/object/public/{bucket}/{key}"
+def image_url_prefix(config):
+    base = (config.get("SUPABASE_URL") or "").rstrip("/")
+    return f"{base}{IMAGE_PATH}{config.get('SUPABASE_BUCKET')}/"
+
+def image_filters(prefix):
+    """public_image_url / image_srcset bound to one bucket prefix (see image_url_prefix)."""
+    def public_image_url(key):
+        return prefix + key
+
+    def image_srcset(variants, ext="jpg"):
+        """Build a srcset string ('url 320w, url 640w, ...') from MenuItems.image_variants."""
+        if not variants:
+            return ""
+        entries = sorted(variants.values(), key=lambda v: v.get("width", 0))
+        return ", ".join(
+            f"{prefix}{v[ext]} {v['width']}w" for v in entries if v.get(ext)
+        )
+
+    return public_image_url, image_srcset
 
 def register_filters(app):
+    public_image_url, image_srcset = image_filters(image_url_prefix(app.config))
     app.jinja_env.filters["format_est"] = format_est
     app.jinja_env.filters["format_price"] = format_price
     app.jinja_env.filters["public_image_url"] = public_image_url
     app.jinja_env.filters["cents_to_dollars"] = cents_to_dollars
+    app.jinja_env.filters["image_srcset"] = image_srcset
@@ -0,0 +1,113 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from themybuttsite.utils import metrics
+
+FRAGMENT_CACHE = metrics.counter(
+    "template_fragment_cache_total", "Cached template fragments served (hit) or rendered (miss)"
+)
+
+
+class FragmentCache:
+    """Bounded in-process LRU of rendered fragments (single worker, so one copy is enough)."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache key %} ... {% endcache %}
+
+    Renders the body once per key and reuses the HTML afterwards. The key is any
+    expression: a list/tuple is used as-is, so put everything the body depends on in
+    it (e.g. ["menu", menu_version, grill_open]). A falsy key (`[...] if cond`)
+    renders the body uncached. Bodies must not depend on the current user or request.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [key]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or not key:
+            return caller()
+        key = tuple(key) if isinstance(key, (list, tuple)) else (key,)
+        html = cache.get(key)
+        if html is None:
+            FRAGMENT_CACHE.inc(result="miss")
+            html = caller()
+            cache.set(key, html)
+        else:
+            FRAGMENT_CACHE.inc(result="hit")
+        return html
+
+
+def init_bytecode_cache(app):
+    """
+    Keep compiled templates on disk, so a fresh worker loads bytecode instead of
+    parsing and compiling every template. Entries are keyed by template source
+    checksum, so edited templates recompile.
+
+    Loading bytecode runs it, so the directory must be ours alone: by default Jinja's
+    own per-user directory in the temp dir (created 0700, owner checked); an explicit
+    JINJA_BYTECODE_CACHE_DIR is created 0700 and refused if anyone else owns or can
+    write to it. JINJA_BYTECODE_CACHE != "True" disables.
+    """
+    if app.config.get("JINJA_BYTECODE_CACHE") != "True":
+        return
+    directory = app.config.get("JINJA_BYTECODE_CACHE_DIR")
+    if not directory:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+        return
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        app.logger.warning(
+            "Jinja bytecode cache disabled: %s must be a directory owned by this user "
+            "and not writable by group/others", directory
+        )
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+def init_fragment_cache(app):
+    """Enable {% cache %} in templates; FRAGMENT_CACHE_SIZE = 0 renders everything uncached."""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    size = app.config.get("FRAGMENT_CACHE_SIZE", 0)
+    app.jinja_env.fragment_cache = FragmentCache(size) if size > 0 else None
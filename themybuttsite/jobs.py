@@ -0,0 +1,165 @@
+import time
+from threading import Thread
+
+import click
+from flask import current_app
+
+import themybuttsite.extensions as ext
+
+
+def every(app, seconds, fn, name):
+    """
+    Run `fn` inside an app context every `seconds` on a daemon thread
+    (a green thread under the eventlet worker). Failures are logged, never raised.
+    """
+    def loop():
+        while True:
+            time.sleep(seconds)
+            with app.app_context():
+                try:
+                    fn()
+                except Exception:
+                    app.logger.exception("Background job %s failed", name)
+                    if ext.db_session:
+                        ext.db_session.rollback()
+                finally:
+                    if ext.db_session:
+                        ext.db_session.remove()
+
+    Thread(target=loop, daemon=True, name=f"job:{name}").start()
+
+
+# ---- jobs -----------------------------------------------------------------
+
+def sweep_images():
+    from themybuttsite.utils.image_processing import sweep_orphan_images
+    from themybuttsite.utils.storage import get_storage
+
+    result = sweep_orphan_images(get_storage(), current_app.config["IMAGE_SWEEP_GRACE"])
+    current_app.logger.info("Image sweep removed %(folders)s folders / %(objects)s objects", result)
+    return result
+
+def fail_stale_image_uploads():
+    from themybuttsite.utils.image_processing import fail_stale_uploads
+
+    count = fail_stale_uploads(current_app.config["IMAGE_UPLOAD_TIMEOUT"])
+    if count:
+        current_app.logger.warning("Marked %s stale pending image uploads as failed", count)
+    return count
+
+def refresh_analytics():
+    from themybuttsite.utils.analytics import refresh_rollups, finalize_past_service_dates
+
+    refresh_rollups()
+    finalize_past_service_dates()
+
+def forecast_stock():
+    from themybuttsite.utils.forecast import check_stock
+
+    check_stock()
+
+def reap_carts():
+    from themybuttsite.utils.carts import reap_carts as reap
+
+    result = reap(current_app.config["CART_IDLE_TIMEOUT"])
+    current_app.logger.info(
+        "Cart reaper removed %(carts)s carts / %(items)s items, expired %(sessions_expired)s "
+        "Stripe sessions (%(sessions_kept)s kept)", result
+    )
+    return result
+
+
+# ---- wiring ---------------------------------------------------------------
+
+def init_jobs(app):
+    @app.cli.command("sweep-images")
+    def sweep_images_command():
+        """Delete bucket images no menu item references."""
+        result = sweep_images()
+        click.echo(f"Removed {result['folders']} image folders ({result['objects']} objects).")
+
+    @app.cli.command("rebuild-rollups")
+    @click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+                  help="First service date to rebuild (default: all history).")
+    def rebuild_rollups_command(since):
+        """Recompute the analytics rollups from orders."""
+        from themybuttsite.utils.analytics import rebuild_rollups
+
+        dates = rebuild_rollups(since.date() if since else None)
+        click.echo(f"Rebuilt rollups for {len(dates)} service dates.")
+
+    @app.cli.command("reap-carts")
+    def reap_carts_command():
+        """Delete idle carts and expire their Stripe sessions."""
+        result = reap_carts()
+        click.echo(f"Removed {result['carts']} carts ({result['items']} items); "
+                   f"expired {result['sessions_expired']} Stripe sessions, kept {result['sessions_kept']}.")
+
+    @app.cli.command("export-orders")
+    @click.option("--start", type=click.DateTime(formats=["%Y-%m-%d"]), required=True,
+                  help="First service date to export.")
+    @click.option("--end", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+                  help="Last service date to export (default: --start).")
+    @click.option("--dataset", "datasets", multiple=True, default=("orders", "items", "ingredients"),
+                  help="orders, items or ingredients; repeatable (default: all three).")
+    @click.option("--format", "fmt", default="csv", help="csv or parquet.")
+    @click.option("--out-dir", type=click.Path(file_okay=False), default=".",
+                  help="Directory the files are written to.")
+    def export_orders_command(start, end, datasets, fmt, out_dir):
+        """Write orders / items / ingredients for a range of service dates to files."""
+        import os
+        from themybuttsite.utils.export import export_orders, export_filename, ExportError
+
+        start = start.date()
+        end = end.date() if end else start
+        os.makedirs(out_dir, exist_ok=True)
+        for dataset in datasets:
+            try:
+                chunks = export_orders(dataset, fmt, start, end)
+            except ExportError as e:
+                raise click.UsageError(str(e))
+            path = os.path.join(out_dir, export_filename(dataset, fmt, start, end))
+            size = 0
+            with open(path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            click.echo(f"Wrote {path} ({size / 1024:.0f} KiB).")
+
+    @app.cli.command("replay-archive")
+    @click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+                  help="First archive date to replay (default: all).")
+    @click.option("--until", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+                  help="Last archive date to replay (default: all).")
+    @click.option("--dir", "root", default=None, help="Archive directory (default: ORDER_ARCHIVE_DIR).")
+    @click.option("--dry-run", is_flag=True, help="Only report what would be inserted.")
+    def replay_archive_command(since, until, root, dry_run):
+        """Recreate orders that are in the order archive but missing from the database."""
+        from themybuttsite.utils.archive import replay_archive
+
+        root = root or app.config.get("ORDER_ARCHIVE_DIR")
+        if not root:
+            raise click.UsageError("No archive directory: pass --dir or set ORDER_ARCHIVE_DIR.")
+        result = replay_archive(
+            root, since.date() if since else None, until.date() if until else None, dry_run=dry_run
+        )
+        verb = "Would insert" if dry_run else "Inserted"
+        click.echo(f"{verb} {result['orders']} orders ({result['items']} items, "
+                   f"{result['ingredients']} ingredients, {result['users']} users); "
+                   f"skipped {result['damaged']} damaged lines.")
+        if result["orders"] and not dry_run:
+            click.echo("Run `flask rebuild-rollups` to bring analytics up to date.")
+
+    if app.config.get("BACKGROUND_JOBS_ENABLED") != "True":
+        return
+
+    if app.config["IMAGE_SWEEP_INTERVAL"] > 0:
+        every(app, app.config["IMAGE_SWEEP_INTERVAL"], sweep_images, "sweep-images")
+    if app.config["IMAGE_UPLOAD_TIMEOUT"] > 0:
+        every(app, app.config["IMAGE_UPLOAD_TIMEOUT"], fail_stale_image_uploads, "fail-stale-uploads")
+    if app.config["ROLLUP_REFRESH_INTERVAL"] > 0:
+        every(app, app.config["ROLLUP_REFRESH_INTERVAL"], refresh_analytics, "refresh-analytics")
+    if app.config["STOCK_FORECAST_INTERVAL"] > 0:
+        every(app, app.config["STOCK_FORECAST_INTERVAL"], forecast_stock, "forecast-stock")
+    if app.config["CART_REAP_INTERVAL"] > 0:
+        every(app, app.config["CART_REAP_INTERVAL"], reap_carts, "reap-carts")
@@ -1,20 +1,28 @@
-from flask import Blueprint, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, request, flash, redirect, url_for, jsonify, current_app
 from sqlalchemy.orm import selectinload
 from sqlalchemy import func, true as sa_true
 import json
 from threading import Thread
+from datetime import datetime, timezone
 
 
 from models import (
     Ingredients, MenuItems, Settings,
-    Orders, OrderItems, OrderItemIngredient
+    Orders, OrderItems, OrderItemIngredient, CartItem, CartItemIngredient
 )
 from themybuttsite.utils.sheets import update_to_stock, update_menu_sheets, update_to_announcements, copy_snippet, closing_buttery_effects
 from themybuttsite.extensions import db_session
 from themybuttsite.jinjafilters.filters import format_est
 from themybuttsite.wrappers.wrappers import login_required, role_required  
 from themybuttsite.utils.validation import handle_menu_item_submission
-from themybuttsite.utils.time import get_service_window
+from themybuttsite.utils.image_processing import release_image_async
+from themybuttsite.utils.time import get_service_window, service_date
+from themybuttsite.utils.analytics import finalize_service_date
+from themybuttsite.utils.forecast import reset_alerts
+from themybuttsite.utils.catalog import bump_catalog_version, bump_menu_version
+from themybuttsite.utils.http_cache import bump_order_seq
+from themybuttsite.utils.archive import archive_update
+from themybuttsite.utils.carts import sync_cart_summary
 
 bp_staff_api = Blueprint('staff_api', __name__, url_prefix="/staff")
 
@@ -43,7 +51,10 @@ def update_order():
             return redirect(url_for('staff_pages.staff'))
 
         order.status = new_status
+        placed_at = order.timestamp
+        bump_order_seq(order.netid)
         db_session.commit()
+        archive_update(oid, placed_at, status=new_status)
         new_status = new_status == 'done'
         flash('Order status updated successfully!', 'success')
     except Exception:
@@ -84,7 +95,10 @@ def update_payment():
             return redirect(url_for('staff_pages.staff'))
 
         order.paid = bool(paid)
+        placed_at = order.timestamp
+        bump_order_seq(order.netid)
         db_session.commit()
+        archive_update(oid, placed_at, paid=bool(paid))
         flash('Order status updated successfully!', 'success')
     except Exception:
         db_session.rollback()
@@ -98,19 +112,32 @@ def update_payment():
 def update_stock():
     try:
         changes_json = request.form.get('changes')
-        if not changes_json:
+        changes = json.loads(changes_json) if changes_json else {}  # {id: new_status}
+        counts = _parse_stock_counts(request.form)                   # {id: quantity or None}
+        if not changes and not counts:
             flash("No changes submitted.", "info")
             return redirect(url_for('staff_pages.staff'))
 
-        changes = json.loads(changes_json)  # {id: new_status}
-
         for ingredient_id, new_status in changes.items():
             ingredient = db_session.query(Ingredients).filter_by(id=int(ingredient_id)).first()
             if ingredient:
                 ingredient.in_stock = bool(new_status)
 
+        recounted = []
+        if counts:
+            now = datetime.now(timezone.utc)
+            for ingredient in db_session.query(Ingredients).filter(Ingredients.id.in_(list(counts))).all():
+                quantity = counts[ingredient.id]
+                ingredient.stock_quantity = quantity
+                ingredient.stock_counted_at = now if quantity is not None else None
+                recounted.append(ingredient.id)
+
+        if changes:
+            bump_menu_version()   # out-of-stock labels on the menu
         db_session.commit()
-        Thread(target=update_to_stock, daemon=True).start()
+        reset_alerts(recounted)
+        if changes:
+            Thread(target=update_to_stock, daemon=True).start()
         flash("Ingredient stock statuses updated successfully!", "success")
 
     except Exception as e:
@@ -120,6 +147,23 @@ def update_stock():
 
     return redirect(url_for('staff_pages.staff'))
 
+def _parse_stock_counts(form):
+    # count_<id> inputs: blank = stop tracking that ingredient's quantity. Only fields
+    # staff actually edited (differ from count_was_<id>) count: orders keep decrementing
+    # the live value while the dashboard is open, and a stale echo must not undo that.
+    counts = {}
+    for key, value in form.items():
+        if not key.startswith("count_") or key.startswith("count_was_"):
+            continue
+        value = value.strip()
+        if value == form.get(f"count_was_{key[len('count_'):]}", "").strip():
+            continue
+        quantity = int(value) if value else None
+        if quantity is not None and quantity < 0:
+            raise ValueError("Stock counts cannot be negative")
+        counts[int(key[len("count_"):])] = quantity
+    return counts
+
 @bp_staff_api.route('/add_menu_item', methods=['POST'])
 @login_required
 @role_required('staff')
@@ -157,9 +201,16 @@ def delete_menu_item():
             flash('Menu item not found.', 'danger')
             return redirect(url_for('staff_pages.manage_menu'))
 
+        object_key = menu_item.object_key
+        # Cart lines go with the item (ON DELETE CASCADE); their owners' badges must too
+        holders = [netid for (netid,) in db_session.query(CartItem.cart_netid)
+                   .filter_by(menu_item_id=item_id_int).distinct()]
         db_session.delete(menu_item)  
+        sync_cart_summary(*holders)
+        bump_catalog_version()
         db_session.commit()        
         Thread(target=update_menu_sheets, daemon=True).start()
+        release_image_async(current_app._get_current_object(), object_key)
 
         flash('Menu item deleted successfully!', 'success')
 
@@ -219,7 +270,12 @@ def delete_ingredient():
         flash('Ingredient not found or cannot be deleted.', 'danger')
         return redirect(url_for('staff_pages.manage_menu'))
 
+    holders = [netid for (netid,) in db_session.query(CartItem.cart_netid)
+               .join(CartItemIngredient, CartItemIngredient.cart_item_id == CartItem.id)
+               .filter(CartItemIngredient.ingredient_id == ing_id).distinct()]
     db_session.delete(ingredient)  # DB cascades link rows automatically
+    sync_cart_summary(*holders)
+    bump_catalog_version()          # carts holding it lose its add-on price
     db_session.commit()
     flash('Ingredient deleted successfully.', 'success')
 
@@ -270,6 +326,11 @@ def toggle_buttery():
         db_session.commit()
         if not settings.buttery_open:
             closing_buttery_effects()
+            try:
+                finalize_service_date(service_date(datetime.now(timezone.utc)))
+            except Exception:
+                db_session.rollback()
+                current_app.logger.exception("Failed to finalize analytics rollups at close")
         flash(f'Buttery is now {"Open" if settings.buttery_open else "Closed"}.', 'success')
     else:
         flash("Settings record not found. Cannot toggle buttery.", "danger")
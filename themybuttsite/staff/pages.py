@@ -1,16 +1,20 @@
 # staff.py
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, stream_template, Response, request, abort, get_flashed_messages
+from datetime import date, datetime, timedelta, timezone
 from sqlalchemy.orm import selectinload, joinedload
-from sqlalchemy import desc, func, cast, text, event
+from sqlalchemy import desc, func, cast, text, event, or_
 from sqlalchemy.dialects.postgresql import JSON
 
 from models import (
     MenuItems, MenuItemIngredients, Ingredients,
     Orders, OrderItems, Settings
 )
-from themybuttsite.extensions import db_session
+from themybuttsite.extensions import db_session, route_to
 from themybuttsite.wrappers.wrappers import login_required, role_required
 from themybuttsite.utils.time import service_date, get_service_window
+from themybuttsite.utils.analytics import sales_report
+from themybuttsite.utils.metrics import render_prometheus
+from themybuttsite.utils.export import export_orders, export_filename, ExportError, MIMETYPES
 
 
 
@@ -52,44 +56,80 @@ def staff():
         settings=settings
     )
 
+# Orders per history query (and per selectinload batch)
+HISTORY_BATCH = 500
+
+
+def _history_batches():
+    """
+    Every order, newest first, HISTORY_BATCH at a time. Each batch is its own short query
+    keyed on the last (timestamp, id) seen, and the session is closed before the batch is
+    handed on: nothing holds a transaction open while a slow client reads the page (the
+    engines' idle_in_transaction_session_timeout would cut it off mid-stream).
+    """
+    after = None
+    while True:
+        # Runs while the response streams, after the view (and any @route_to) has returned
+        with route_to("replica"):
+            query = (
+                db_session.query(Orders)
+                .options(
+                    selectinload(Orders.users),
+                    selectinload(Orders.order_items)
+                        .selectinload(OrderItems.selected_ingredients)
+                )
+                .order_by(Orders.timestamp.desc(), Orders.id.desc())
+            )
+            if after is not None:
+                # The first condition is the one orders_timestamp_idx can use
+                query = query.filter(
+                    Orders.timestamp <= after[0],
+                    or_(Orders.timestamp < after[0], Orders.id < after[1]),
+                )
+            batch = query.limit(HISTORY_BATCH).all()
+            # Detached, the loaded orders (and their eager-loaded rows) stay readable
+            db_session.close()
+        if not batch:
+            return
+        yield batch
+        if len(batch) < HISTORY_BATCH:
+            return
+        after = (batch[-1].timestamp, batch[-1].id)
+
+def _history_nights():
+    """
+    (service date, orders) for every night, newest first. Only the batch being read and
+    the night being rendered are held, so memory doesn't grow with the length of the history.
+    """
+    night, night_orders = None, []
+    for batch in _history_batches():
+        for order in batch:
+            date = service_date(order.timestamp)
+            if night_orders and date != night:
+                yield night, night_orders
+                night_orders = []
+            night = date
+            night_orders.append(order)
+    if night_orders:
+        yield night, night_orders
+
 @bp_staff_pages.route('/order_history_staff', methods=['GET', 'POST'])
 @login_required
 @role_required('staff')
 def order_history_staff():
-    orders = (
-            db_session.query(Orders)
-            .options(
-                joinedload(Orders.users), 
-                selectinload(Orders.order_items)
-                    .selectinload(OrderItems.selected_ingredients) 
-            )
-            .order_by(Orders.timestamp.desc())
-            .all()
-    )
-        
-
-    for order in orders:
-        order.service_date = service_date(order.timestamp)
-                
-    sorted_orders = {}
-    for order in orders:
-        if order.service_date in sorted_orders:
-            sorted_orders[order.service_date].append(order)
-        else:
-            sorted_orders[order.service_date] = [order]
-
-    sorted_orders = dict(sorted(sorted_orders.items(), key=lambda x: x[0], reverse=True))
-    print(sorted_orders)
-
-
-    return render_template(
+    # Streamed: the newest night reaches the browser while older ones are still loading.
+    # Flashes are popped now, while the session can still be saved
+    return stream_template(
         'staff/order_history_staff.html',
-        orders=sorted_orders
-    )   
+        flashed_messages=get_flashed_messages(with_categories=True),
+        nights=_history_nights(),
+        tonight=service_date(datetime.now(timezone.utc))
+    )
 
 @bp_staff_pages.route('/manage_menu')
 @login_required
 @role_required('staff')
+@route_to("replica")
 def manage_menu():
     special_items = ( 
             db_session.query(MenuItems) 
@@ -120,5 +160,51 @@ def manage_menu():
         ingredients=ingredients
     )
 
-    
+@bp_staff_pages.route('/analytics')
+@login_required
+@role_required('staff')
+@route_to("replica")
+def analytics():
+    # Reads only the per-night rollup tables, never orders/order_items
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    start_utc, _ = get_service_window()
+    since = service_date(start_utc) - timedelta(days=days - 1)
+
+    return render_template(
+        'staff/analytics.html',
+        days=days,
+        since=since,
+        **sales_report(since)
+    )
 
+@bp_staff_pages.route('/export_orders')
+@login_required
+@role_required('staff')
+def export_orders_file():
+    # Streamed straight from a COPY / server-side cursor: constant memory for any range
+    tonight = service_date(datetime.now(timezone.utc))
+    try:
+        end = date.fromisoformat(request.args.get('end') or tonight.isoformat())
+        start = date.fromisoformat(request.args.get('start') or end.isoformat())
+    except ValueError:
+        abort(400, "Dates must be YYYY-MM-DD")
+    dataset = request.args.get('dataset', 'orders')
+    fmt = request.args.get('format', 'csv')
+    try:
+        chunks = export_orders(dataset, fmt, start, end)
+    except ExportError as e:
+        abort(400, str(e))
+
+    filename = export_filename(dataset, fmt, start, end)
+    return Response(
+        chunks,
+        mimetype=MIMETYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@bp_staff_pages.route('/metrics')
+@login_required
+@role_required('staff')
+def metrics():
+    # Prometheus text format; latency histograms, queries/DB time per endpoint, external calls
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8")
@@ -7,13 +7,18 @@ from threading import Thread
 from models import (
     Cart, CartItem, CartItemIngredient,
     Orders, OrderItems, OrderItemIngredient,
-    MenuItems, Users, MenuItemIngredients, Ingredients
+    MenuItems, Users, MenuItemIngredients, Ingredients, Settings
 )
 from themybuttsite.extensions import db_session, socketio
 from themybuttsite.wrappers.wrappers import login_required
-from themybuttsite.utils.calculation import calculate_cart_total
+from themybuttsite.utils.calculation import load_cart
 from themybuttsite.utils.validation import validate_item  
 from themybuttsite.jinjafilters.filters import format_price
+from themybuttsite.utils.telemetry import external_call
+from themybuttsite.utils.inventory import order_consumption, consume_stock, announce_sold_out
+from themybuttsite.utils.carts import sync_cart_summary
+from themybuttsite.utils.http_cache import bump_order_seq
+from themybuttsite.utils.archive import archive_order
 
 
 bp_stripe = Blueprint("stripe", __name__)
@@ -30,85 +35,103 @@ FAILED_EVENTS = {
 @login_required
 def stripe_checkout():
     netid = session.get("netid")
-    cart = (
-        db_session.query(Cart)
-        .options(
-            selectinload(Cart.user),
-            selectinload(Cart.items).selectinload(CartItem.menu_item),
-            selectinload(Cart.items)
-                .selectinload(CartItem.selected_ingredients)
-                .selectinload(CartItemIngredient.ingredient),
-        )
-        .filter_by(netid=netid)
-        .first()
-    )
+    # Cart lines, selections, stored prices and the user's name/email in one query
+    cart, changed = load_cart(netid, db_session)
 
-    if not cart or not cart.items:
+    if not cart or not cart["lines"]:
         flash("Your cart is empty.", "info")
         return redirect(url_for("consumer_pages.view_cart"))
 
+    # Never charge a price the user hasn't seen
+    if changed:
+        _set_cart_session(netid, None)
+        db_session.commit()
+        names = ", ".join(line["name"] for line in changed)
+        flash(f"The menu changed since you added these, and their prices were updated: {names}", "warning")
+        return redirect(url_for("consumer_pages.view_cart"))
+
     # If a Stripe session already exists, reuse it
-    if cart.stripe_session_id:
+    if cart["stripe_session_id"]:
         try:
-            sess = stripe.checkout.Session.retrieve(cart.stripe_session_id)
+            with external_call("stripe"):
+                sess = stripe.checkout.Session.retrieve(cart["stripe_session_id"])
             if sess.status == 'open':
                 return redirect(sess.url, code=303)   
         except Exception:
-            cart.stripe_session_id = None
+            _set_cart_session(netid, None)
             db_session.commit()
 
-    # Validate each item quietly
-    invalid_items = []
-    for cart_item in list(cart.items):
-        item_id = cart_item.menu_item_id
-        choice_ids = [ci.ingredient_id for ci in cart_item.selected_ingredients if ci.type == "choice"]
-        optional_ids = [ci.ingredient_id for ci in cart_item.selected_ingredients if ci.type == "optional"]
-
-        if not validate_item(item_id, choice_ids, optional_ids, flash_errors=False):
-            invalid_items.append(cart_item.menu_item.name)
-            db_session.delete(cart_item)
-
-    if invalid_items:
-        cart.stripe_session_id = None
+    # Validate each item quietly, against one load of settings + the items' catalog rows
+    settings = db_session.query(Settings).one()
+    menu_items = {
+        item.id: item
+        for item in db_session.query(MenuItems)
+        .options(selectinload(MenuItems.menu_item_ingredients).selectinload(MenuItemIngredients.ingredient))
+        .filter(MenuItems.id.in_({line["menu_item_id"] for line in cart["lines"]}))
+        .all()
+    }
+    invalid_lines = []
+    for line in cart["lines"]:
+        choice_ids = [ing["ingredient_id"] for ing in line["ingredients"] if ing["type"] == "choice"]
+        optional_ids = [ing["ingredient_id"] for ing in line["ingredients"] if ing["type"] == "optional"]
+
+        if not validate_item(line["menu_item_id"], choice_ids, optional_ids, flash_errors=False,
+                             settings=settings, item=menu_items.get(line["menu_item_id"])):
+            invalid_lines.append(line)
+
+    if invalid_lines:
+        invalid_ids = [line["id"] for line in invalid_lines]
+        db_session.query(CartItemIngredient).filter(
+            CartItemIngredient.cart_item_id.in_(invalid_ids)
+        ).delete(synchronize_session=False)
+        db_session.query(CartItem).filter(CartItem.id.in_(invalid_ids)).delete(synchronize_session=False)
+        _set_cart_session(netid, None)
         db_session.commit()
-        flash(f"The following items were removed due to not being available: {', '.join(invalid_items)}", "warning")
+        names = ", ".join(line["name"] for line in invalid_lines)
+        flash(f"The following items were removed due to not being available: {names}", "warning")
         return redirect(url_for("consumer_pages.view_cart"))
 
-    # Calculate total
-    total_price, cart = calculate_cart_total(cart, db_session)
+    total_price = cart["total"]
 
-    idempotency_key = f"checkout:{netid}:{cart.updated_at.isoformat()}:{total_price}:{len(cart.items)}"
+    idempotency_key = f"checkout:{netid}:{cart['updated_at'].isoformat()}:{total_price}:{len(cart['lines'])}"
 
     # Stripe
     stripe.api_key = current_app.config["STRIPE_SECRET_KEY"]
 
-    checkout_session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[{
-            "price_data": {
-                "currency": "usd",
-                "product_data": {"name": f"Buttery Order for {cart.user.name}"},
-                "unit_amount": int(total_price),
+    with external_call("stripe"):
+        checkout_session = stripe.checkout.Session.create(
+            payment_method_types=["card"],
+            line_items=[{
+                "price_data": {
+                    "currency": "usd",
+                    "product_data": {"name": f"Buttery Order for {cart['user_name']}"},
+                    "unit_amount": int(total_price),
+                },
+                "quantity": 1,
+            }],
+            mode="payment",
+            customer_email=cart["user_email"],
+            client_reference_id=netid,
+            metadata={
+                "netid": netid,
+                "total_price": int(total_price),
             },
-            "quantity": 1,
-        }],
-        mode="payment",
-        customer_email=cart.user.email,
-        client_reference_id=netid,
-        metadata={
-            "netid": netid,
-            "total_price": int(total_price),
-        },
-        success_url=url_for("stripe.payment_success", _external=True),
-        cancel_url=url_for("stripe.payment_failure", _external=True),
-        idempotency_key=idempotency_key
-    )
+            success_url=url_for("stripe.payment_success", _external=True),
+            cancel_url=url_for("stripe.payment_failure", _external=True),
+            idempotency_key=idempotency_key
+        )
 
     # Lock cart
-    cart.stripe_session_id = checkout_session.id
+    _set_cart_session(netid, checkout_session.id)
     db_session.commit()
     return redirect(checkout_session.url, code=303)
 
+def _set_cart_session(netid, stripe_session_id):
+    db_session.query(Cart).filter_by(netid=netid).update(
+        {Cart.stripe_session_id: stripe_session_id}, synchronize_session=False
+    )
+    sync_cart_summary(netid)
+
 @bp_stripe.route("/webhook", methods=["POST"])
 def stripe_webhook():
     # Verify Stripe signature
@@ -135,6 +158,7 @@ def stripe_webhook():
                 cart = db_session.query(Cart).filter_by(netid=netid).first()
                 if cart:
                     cart.stripe_session_id = None
+                    sync_cart_summary(netid)
             db_session.commit()
         except Exception:
             db_session.rollback()
@@ -206,6 +230,10 @@ def stripe_webhook():
                     )
                     db_session.add(order_item_ingredient)
 
+            # Counted ingredients come off in this same transaction
+            sold_out = consume_stock(order_consumption(cart.items))
+            bump_order_seq(netid)
+
             db_session.commit()
             socketio.emit(
             "order_update",
@@ -213,6 +241,8 @@ def stripe_webhook():
             namespace="/staff",
             to="staff_updates",
             )
+            archive_order(order.id)
+            announce_sold_out(sold_out)
             app = current_app._get_current_object()  
             if (order.id % 5) == 0:
                 _post_order_side_effects(order.id, app)
@@ -220,6 +250,7 @@ def stripe_webhook():
                 cart = db_session.query(Cart).filter_by(netid=netid).first()
                 if cart:
                     db_session.delete(cart)
+                    sync_cart_summary(netid)
                     db_session.commit()
             except Exception:
                 db_session.rollback()
@@ -0,0 +1,261 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, text
+
+from models import (
+    Orders, OrderItems, OrderItemIngredient,
+    ServiceDaySales, ServiceDayItems, ServiceDayIngredients, ServiceDayThroughput,
+)
+from themybuttsite.extensions import db_session
+from themybuttsite.utils.time import service_date, service_date_bounds
+
+BUCKET_MINUTES = 15
+# Orders younger than this may still have uncommitted neighbours with lower ids
+SETTLE_SECONDS = 60
+
+DETAIL_MODELS = (ServiceDayItems, ServiceDayIngredients, ServiceDayThroughput)
+
+# pg_advisory_xact_lock key held by whoever is writing the rollups
+ROLLUP_LOCK_KEY = 0x6275_7474   # "butt"
+_write_lock = threading.Lock()
+
+
+def _bucket_start(ts):
+    ts = ts.astimezone(timezone.utc)
+    return ts.replace(minute=ts.minute - ts.minute % BUCKET_MINUTES, second=0, microsecond=0)
+
+def _new_day():
+    return {
+        "orders": 0, "revenue": 0, "last_order_id": 0,
+        "items": defaultdict(lambda: [0, 0]),   # name -> [quantity, revenue]
+        "ingredients": Counter(),
+        "buckets": Counter(),
+    }
+
+
+def _aggregate(*criteria):
+    """
+    Roll up the orders matching `criteria` per service date.
+    Three grouped queries however many orders match.
+    """
+    days = defaultdict(_new_day)
+    date_of = {}
+
+    order_rows = (
+        db_session.query(Orders.id, Orders.timestamp, Orders.total_price)
+        .filter(*criteria)
+        .all()
+    )
+    for order_id, ts, total_price in order_rows:
+        date_of[order_id] = svc_date = service_date(ts)
+        day = days[svc_date]
+        day["orders"] += 1
+        day["revenue"] += total_price
+        day["last_order_id"] = max(day["last_order_id"], order_id)
+        day["buckets"][_bucket_start(ts)] += 1
+    if not date_of:
+        return days
+
+    item_rows = (
+        db_session.query(
+            OrderItems.order_id, OrderItems.menu_item_name,
+            func.count(OrderItems.id), func.sum(OrderItems.menu_item_price),
+        )
+        .join(Orders, Orders.id == OrderItems.order_id)
+        .filter(*criteria)
+        .group_by(OrderItems.order_id, OrderItems.menu_item_name)
+        .all()
+    )
+    for order_id, name, quantity, revenue in item_rows:
+        totals = days[date_of[order_id]]["items"][name]
+        totals[0] += quantity
+        totals[1] += revenue or 0
+
+    ingredient_rows = (
+        db_session.query(
+            OrderItems.order_id, OrderItemIngredient.ingredient_name, func.count(OrderItemIngredient.id)
+        )
+        .join(OrderItems, OrderItems.id == OrderItemIngredient.order_item_id)
+        .join(Orders, Orders.id == OrderItems.order_id)
+        .filter(*criteria)
+        .group_by(OrderItems.order_id, OrderItemIngredient.ingredient_name)
+        .all()
+    )
+    for order_id, name, uses in ingredient_rows:
+        days[date_of[order_id]]["ingredients"][name] += uses
+
+    return days
+
+
+def _add(model, amounts, **key):
+    row = db_session.get(model, key)
+    if row is None:
+        row = model(**key, **{col: 0 for col in amounts})
+        db_session.add(row)
+    for col, amount in amounts.items():
+        setattr(row, col, getattr(row, col) + amount)
+    return row
+
+
+def _merge(days):
+    """Add aggregated deltas onto the rollup rows (creating them as needed)."""
+    now = datetime.now(timezone.utc)
+    for svc_date, day in days.items():
+        for name, (quantity, revenue) in day["items"].items():
+            _add(ServiceDayItems, {"quantity": quantity, "revenue": revenue},
+                 service_date=svc_date, menu_item_name=name)
+        for name, uses in day["ingredients"].items():
+            _add(ServiceDayIngredients, {"uses": uses}, service_date=svc_date, ingredient_name=name)
+        for bucket, orders in day["buckets"].items():
+            _add(ServiceDayThroughput, {"orders": orders}, service_date=svc_date, bucket_start=bucket)
+
+        summary = _add(
+            ServiceDaySales,
+            {
+                "orders": day["orders"],
+                "revenue": day["revenue"],
+                "items_sold": sum(q for q, _ in day["items"].values()),
+            },
+            service_date=svc_date,
+        )
+        summary.last_order_id = max(summary.last_order_id or 0, day["last_order_id"])
+        summary.refreshed_at = now
+
+        db_session.flush()
+        peak = (
+            db_session.query(ServiceDayThroughput)
+            .filter_by(service_date=svc_date)
+            .order_by(ServiceDayThroughput.orders.desc(), ServiceDayThroughput.bucket_start.asc())
+            .first()
+        )
+        if peak is not None:
+            summary.peak_15m_orders = peak.orders
+            summary.peak_15m_start = peak.bucket_start
+
+
+@contextmanager
+def _rollups_locked():
+    """
+    One rollup writer at a time. Without it a refresh could read its watermark, have
+    finalize_service_date rebuild the night underneath it, then add its delta on top.
+    The thread lock covers this process (the refresh job vs. the toggle_buttery request);
+    on Postgres a transaction-scoped advisory lock also covers other processes (the CLI),
+    held until the caller's commit.
+    """
+    with _write_lock:
+        if db_session.get_bind().dialect.name == "postgresql":
+            db_session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+        yield
+
+
+def refresh_rollups():
+    """
+    Fold orders placed since the last refresh into the rollups. Returns how many.
+
+    Only settled orders are taken, and never past a younger visible one, so the
+    id watermark doesn't jump over a webhook transaction that hasn't committed yet.
+    finalize_service_date() rebuilds a night from scratch to correct any drift.
+    """
+    with _rollups_locked():
+        watermark = db_session.query(func.max(ServiceDaySales.last_order_id)).scalar() or 0
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+
+        criteria = [Orders.id > watermark]
+        unsettled = (
+            db_session.query(func.min(Orders.id))
+            .filter(Orders.id > watermark, Orders.timestamp >= cutoff)
+            .scalar()
+        )
+        if unsettled is not None:
+            criteria.append(Orders.id < unsettled)
+
+        days = _aggregate(*criteria)
+        _merge(days)
+        db_session.commit()
+    return sum(day["orders"] for day in days.values())
+
+
+def finalize_service_date(svc_date):
+    """Rebuild `svc_date`'s rollups from its orders and mark the night final."""
+    start_utc, end_utc = service_date_bounds(svc_date)
+    with _rollups_locked():
+        for model in (ServiceDaySales, *DETAIL_MODELS):
+            db_session.query(model).filter_by(service_date=svc_date).delete()
+
+        days = _aggregate(Orders.timestamp >= start_utc, Orders.timestamp < end_utc)
+        days[svc_date]   # a night with no orders still gets a (zero) summary row
+        _merge(days)
+        db_session.get(ServiceDaySales, svc_date).finalized = True
+        db_session.commit()
+
+
+def finalize_past_service_dates():
+    """Finalize nights that ended without the buttery being closed from the dashboard."""
+    today = service_date(datetime.now(timezone.utc))
+    stale = [
+        d for (d,) in db_session.query(ServiceDaySales.service_date)
+        .filter(ServiceDaySales.finalized == False, ServiceDaySales.service_date < today)
+        .all()
+    ]
+    for svc_date in stale:
+        finalize_service_date(svc_date)
+    return stale
+
+
+def rebuild_rollups(since=None):
+    """Recompute and finalize every night with orders (from `since` on). Returns the dates."""
+    query = db_session.query(Orders.timestamp)
+    if since is not None:
+        query = query.filter(Orders.timestamp >= service_date_bounds(since)[0])
+    dates = sorted({service_date(ts) for (ts,) in query.all()})
+    today = service_date(datetime.now(timezone.utc))
+    for svc_date in dates:
+        finalize_service_date(svc_date)
+        if svc_date == today:
+            # Tonight is still open; keep refreshing it incrementally
+            db_session.get(ServiceDaySales, svc_date).finalized = False
+            db_session.commit()
+    return dates
+
+
+# ---- reads (rollup tables only) -------------------------------------------
+
+def sales_report(since):
+    nights = (
+        db_session.query(ServiceDaySales)
+        .filter(ServiceDaySales.service_date >= since)
+        .order_by(ServiceDaySales.service_date.desc())
+        .all()
+    )
+    top_items = (
+        db_session.query(
+            ServiceDayItems.menu_item_name,
+            func.sum(ServiceDayItems.quantity).label("quantity"),
+            func.sum(ServiceDayItems.revenue).label("revenue"),
+        )
+        .filter(ServiceDayItems.service_date >= since)
+        .group_by(ServiceDayItems.menu_item_name)
+        .order_by(func.sum(ServiceDayItems.quantity).desc())
+        .limit(15)
+        .all()
+    )
+    top_ingredients = (
+        db_session.query(
+            ServiceDayIngredients.ingredient_name,
+            func.sum(ServiceDayIngredients.uses).label("uses"),
+        )
+        .filter(ServiceDayIngredients.service_date >= since)
+        .group_by(ServiceDayIngredients.ingredient_name)
+        .order_by(func.sum(ServiceDayIngredients.uses).desc())
+        .limit(20)
+        .all()
+    )
+    totals = {
+        "orders": sum(n.orders for n in nights),
+        "revenue": sum(n.revenue for n in nights),
+        "items_sold": sum(n.items_sold for n in nights),
+    }
+    return {"nights": nights, "top_items": top_items, "top_ingredients": top_ingredients, "totals": totals}
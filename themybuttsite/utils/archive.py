@@ -0,0 +1,345 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import date, datetime, timezone
+
+from flask import current_app
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import selectinload
+
+from models import Orders, OrderItems, OrderItemIngredient, Users
+from themybuttsite.extensions import db_session
+from themybuttsite.utils import metrics
+from themybuttsite.utils.time import service_date
+
+# Bump when the record layout changes; replay refuses versions it doesn't know
+RECORD_VERSION = 1
+REPLAY_BATCH = 500
+
+ARCHIVE_WRITES = metrics.counter(
+    "order_archive_writes_total", "Order archive records written, by kind and result"
+)
+
+
+# ---- records ------------------------------------------------------------------
+
+def encode_record(record):
+    """
+    One JSON line: {"crc": <crc32 of the canonical record JSON>, "r": record}.
+    The crc lets replay drop a line torn by a crash or damaged on disk.
+    """
+    body = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return f'{{"crc":"{zlib.crc32(body.encode()):08x}","r":{body}}}\n'.encode()
+
+def decode_record(line):
+    """The record on `line`, or None when it is truncated or fails its checksum."""
+    try:
+        wrapper = json.loads(line)
+        record = wrapper["r"]
+        body = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    except (ValueError, KeyError, TypeError):
+        return None
+    if f"{zlib.crc32(body.encode()):08x}" != wrapper.get("crc"):
+        return None
+    return record
+
+def order_record(order):
+    """Everything needed to recreate `order` and its rows (order, items, ingredients, user)."""
+    return {
+        "v": RECORD_VERSION,
+        "kind": "order",
+        "at": datetime.now(timezone.utc).isoformat(),
+        "user": {"netid": order.users.netid, "name": order.users.name, "email": order.users.email},
+        "order": {
+            "id": order.id,
+            "netid": order.netid,
+            "email": order.email,
+            "total_price": order.total_price,
+            "specifications": order.specifications,
+            "status": order.status,
+            "stripe_session_id": order.stripe_session_id,
+            "timestamp": order.timestamp.isoformat(),
+            "paid": order.paid,
+        },
+        "items": [
+            {
+                "id": item.id,
+                "menu_item_id": item.menu_item_id,
+                "menu_item_name": item.menu_item_name,
+                "menu_item_price": item.menu_item_price,
+                "ingredients": [
+                    {
+                        "id": ing.id,
+                        "ingredient_id": ing.ingredient_id,
+                        "type": ing.type,
+                        "ingredient_name": ing.ingredient_name,
+                        "add_price": ing.add_price,
+                    }
+                    for ing in item.selected_ingredients
+                ],
+            }
+            for item in order.order_items
+        ],
+    }
+
+def update_record(order_id, **changes):
+    return {
+        "v": RECORD_VERSION,
+        "kind": "update",
+        "at": datetime.now(timezone.utc).isoformat(),
+        "order_id": order_id,
+        "changes": changes,
+    }
+
+
+# ---- writer -------------------------------------------------------------------
+
+class OrderArchive:
+    """
+    Append-only log of finalized orders and later status / payment changes, one file per
+    service date (<root>/<YYYY>/<YYYY-MM-DD>.jsonl). Records are filed under the order's
+    service date, so a change made on a later night sits next to the order it changes
+    and a date-range replay sees both.
+
+    Each record is a single write() to an O_APPEND descriptor, so lines from several
+    processes never interleave. Writes reach the OS immediately; fsync is batched: after
+    `fsync_batch` records or `fsync_interval` seconds, whichever comes first. The newest
+    date's file stays open; the odd write to an older night's file is synced at once.
+    """
+
+    def __init__(self, root, fsync_interval=1.0, fsync_batch=32):
+        self.root = root
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self._lock = threading.Lock()
+        self._fd = None
+        self._date = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._timer = None
+
+    def path_for(self, svc_date):
+        return os.path.join(self.root, f"{svc_date:%Y}", f"{svc_date.isoformat()}.jsonl")
+
+    def append(self, record, svc_date):
+        line = encode_record(record)
+        with self._lock:
+            if self._date is not None and svc_date < self._date:
+                self._write_once(svc_date, line)
+                return
+            if svc_date != self._date:
+                self._open(svc_date)
+            os.write(self._fd, line)
+            self._pending += 1
+            if (self._pending >= self.fsync_batch
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            elif self._timer is None:
+                # Nothing else may arrive for a while; don't leave the tail unsynced
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = self._date = None
+
+    def _sync(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._fd is not None and self._pending:
+            os.fsync(self._fd)
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _open(self, svc_date):
+        self._sync()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = self._open_file(svc_date)
+        self._date = svc_date
+
+    def _write_once(self, svc_date, line):
+        fd = self._open_file(svc_date)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open_file(self, svc_date):
+        path = self.path_for(svc_date)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        created = not os.path.exists(path)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        if created:
+            # The new file's directory entry has to survive a crash too
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return fd
+
+
+# The archive is written after the order is committed: a failure here is logged and
+# counted, never raised into the request that already succeeded
+
+def archive_order(order_id):
+    """Archive a just-committed order (primary-key reads for it, its items and user)."""
+    archive = current_app.extensions.get("order_archive")
+    if archive is None:
+        return
+    try:
+        order = (
+            db_session.query(Orders)
+            .options(
+                selectinload(Orders.users),
+                selectinload(Orders.order_items).selectinload(OrderItems.selected_ingredients),
+            )
+            .filter_by(id=order_id)
+            .one()
+        )
+        archive.append(order_record(order), service_date(order.timestamp))
+        ARCHIVE_WRITES.inc(kind="order", result="ok")
+    except Exception:
+        ARCHIVE_WRITES.inc(kind="order", result="error")
+        current_app.logger.exception("Failed to archive order %s", order_id)
+
+def archive_update(order_id, placed_at, **changes):
+    """
+    Archive a committed change to an order's status / paid flag. `placed_at` is the
+    order's timestamp: the change is filed with the order, not under tonight's date.
+    """
+    archive = current_app.extensions.get("order_archive")
+    if archive is None:
+        return
+    try:
+        archive.append(update_record(order_id, **changes), service_date(placed_at))
+        ARCHIVE_WRITES.inc(kind="update", result="ok")
+    except Exception:
+        ARCHIVE_WRITES.inc(kind="update", result="error")
+        current_app.logger.exception("Failed to archive update to order %s", order_id)
+
+
+def init_archive(app):
+    """ORDER_ARCHIVE_DIR = "" turns the archive off."""
+    root = app.config.get("ORDER_ARCHIVE_DIR")
+    if not root:
+        return
+    archive = OrderArchive(
+        root,
+        fsync_interval=app.config["ORDER_ARCHIVE_FSYNC_INTERVAL"],
+        fsync_batch=app.config["ORDER_ARCHIVE_FSYNC_BATCH"],
+    )
+    app.extensions["order_archive"] = archive
+    atexit.register(archive.close)
+
+
+# ---- replay -------------------------------------------------------------------
+
+def archive_files(root, since=None, until=None):
+    """(service date, path) of every archive file in [since, until], oldest first."""
+    files = []
+    for path in glob.glob(os.path.join(root, "*", "*.jsonl")):
+        try:
+            svc_date = date.fromisoformat(os.path.basename(path)[:-len(".jsonl")])
+        except ValueError:
+            continue
+        if (since and svc_date < since) or (until and svc_date > until):
+            continue
+        files.append((svc_date, path))
+    return sorted(files)
+
+def read_archive(root, since=None, until=None):
+    """
+    Fold the archive into {order_id: order record with later updates applied}.
+    Returns (orders, updates for orders not in the range, number of damaged lines).
+    """
+    orders, orphan_updates, damaged = {}, {}, 0
+    for _, path in archive_files(root, since, until):
+        with open(path, "rb") as f:
+            for line in f:
+                record = decode_record(line)
+                if record is None or record.get("v") != RECORD_VERSION:
+                    damaged += 1
+                    continue
+                if record["kind"] == "order":
+                    orders[record["order"]["id"]] = record
+                elif record["kind"] == "update":
+                    target = orders.get(record["order_id"])
+                    if target is not None:
+                        target["order"].update(record["changes"])
+                    else:
+                        orphan_updates.setdefault(record["order_id"], {}).update(record["changes"])
+    return orders, orphan_updates, damaged
+
+def replay_archive(root, since=None, until=None, dry_run=False):
+    """
+    Recreate orders (with their items, ingredients and, if missing, their user) that are
+    in the archive but not in the database. Orders already present are left alone, so
+    running it twice is harmless. Returns counts of what was (or would be) inserted.
+    """
+    orders, _, damaged = read_archive(root, since, until)
+    result = {"orders": 0, "items": 0, "ingredients": 0, "users": 0, "damaged": damaged}
+    if not orders:
+        return result
+
+    existing = set()
+    ids = sorted(orders)
+    for i in range(0, len(ids), REPLAY_BATCH):
+        chunk = ids[i:i + REPLAY_BATCH]
+        existing.update(db_session.scalars(select(Orders.id).where(Orders.id.in_(chunk))))
+    missing = [orders[oid] for oid in ids if oid not in existing]
+    if not missing:
+        return result
+
+    users = {r["user"]["netid"]: r["user"] for r in missing}
+    known = set(db_session.scalars(select(Users.netid).where(Users.netid.in_(list(users)))))
+    user_rows = [u for netid, u in users.items() if netid not in known]
+
+    order_rows, item_rows, ingredient_rows = [], [], []
+    for r in missing:
+        order = dict(r["order"], timestamp=datetime.fromisoformat(r["order"]["timestamp"]))
+        order_rows.append(order)
+        for item in r["items"]:
+            item_rows.append({
+                "id": item["id"], "order_id": order["id"], "menu_item_id": item["menu_item_id"],
+                "menu_item_name": item["menu_item_name"], "menu_item_price": item["menu_item_price"],
+            })
+            ingredient_rows.extend(dict(ing, order_item_id=item["id"]) for ing in item["ingredients"])
+
+    result.update(orders=len(order_rows), items=len(item_rows),
+                  ingredients=len(ingredient_rows), users=len(user_rows))
+    if dry_run:
+        return result
+
+    try:
+        for model, rows in ((Users, user_rows), (Orders, order_rows),
+                            (OrderItems, item_rows), (OrderItemIngredient, ingredient_rows)):
+            for i in range(0, len(rows), REPLAY_BATCH):
+                db_session.execute(insert(model), rows[i:i + REPLAY_BATCH])
+        if db_session.get_bind().dialect.name == "postgresql":
+            # Rows went in with their original ids; move the sequences past them
+            for table in ("orders", "order_items", "order_item_ingredients"):
+                db_session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return result
@@ -0,0 +1,60 @@
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+
+MANIFEST = os.path.join("dist", "manifest.json")
+# Preferred first; files are written by src/build-assets.mjs next to each built asset
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def load_manifest(app):
+    """source path -> built path (relative to static/), or {} when `npm run build` hasn't run."""
+    try:
+        with open(os.path.join(app.static_folder, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def asset_url(filename):
+    """
+    URL of the built, content-hashed copy of a static file when there is one,
+    otherwise of the file itself (fingerprinted with ?v= either way, see utils.http_cache).
+    """
+    app = current_app
+    manifest = app.extensions["asset_manifest"]
+    if app.debug:
+        manifest = load_manifest(app)   # pick up rebuilds without a restart
+    return url_for("static", filename=manifest.get(filename, filename))
+
+
+def serve_static(filename):
+    """
+    Flask's static view, but built assets are answered with their precompressed
+    .br / .gz sibling when the client accepts that encoding.
+    """
+    app = current_app
+    if filename.startswith("dist/"):
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if accepted.quality(encoding) > 0 and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                mimetype, _ = mimetypes.guess_type(filename)
+                response = send_from_directory(
+                    app.static_folder, filename + suffix,
+                    mimetype=mimetype, max_age=app.get_send_file_max_age(filename),
+                )
+                response.headers["Content-Encoding"] = encoding
+                response.vary.add("Accept-Encoding")
+                return response
+    response = app.send_static_file(filename)
+    if filename.startswith("dist/"):
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_assets(app):
+    app.extensions["asset_manifest"] = load_manifest(app)
+    app.jinja_env.globals["asset_url"] = asset_url
+    if app.static_folder:
+        app.view_functions["static"] = serve_static
@@ -1,36 +1,216 @@
-from models import MenuItemIngredients
-
-def calculate_cart_total(cart, db_session):
-    if not cart or not cart.items:
-        return 0, cart
-
-    # Build add_price map
-    menu_item_ids = {item.menu_item_id for item in cart.items}
-    add_price_map = {}
-    if menu_item_ids:
-        results = (
-            db_session.query(
-                MenuItemIngredients.menu_item_id,
-                MenuItemIngredients.ingredient_id,
-                MenuItemIngredients.add_price
-            )
-            .filter(MenuItemIngredients.menu_item_id.in_(menu_item_ids))
-            .all()
+from sqlalchemy import and_, func, select, update
+
+from models import (
+    Cart, CartItem, CartItemIngredient,
+    MenuItems, MenuItemIngredients, Ingredients, Users, Settings
+)
+from themybuttsite.utils.carts import sync_cart_summary
+
+
+def load_cart(netid, db_session):
+    """
+    The user's cart as priced when its lines were added (see cart_lines). Lines priced
+    under an older catalog version are re-priced from the menu first and the new prices
+    stored, so a menu edit is picked up on the next read.
+
+    Returns (cart, changed): cart as from price_cart (None when there is no cart), and the
+    lines whose price moved since they were added.
+    """
+    cart = cart_lines(netid, db_session)
+    if cart is None:
+        return cart, []
+    if not any(line["stale"] for line in cart["lines"]):
+        if (cart["summary_count"], cart["summary_subtotal"]) != (len(cart["lines"]), cart["total"]):
+            # Lines vanished under the badge (a menu delete cascading, a cart emptied
+            # elsewhere); there may be none left to be stale, so check the counts too
+            sync_cart_summary(netid)
+            db_session.commit()
+        return cart, []
+
+    stored = {line["id"]: line["price"] for line in cart["lines"]}
+    cart = price_cart(netid, db_session)
+    store_line_prices(cart["lines"], cart["catalog_version"], db_session)
+    sync_cart_summary(netid)
+    db_session.commit()
+    changed = [
+        line for line in cart["lines"]
+        if stored.get(line["id"]) is not None and stored[line["id"]] != line["price"]
+    ]
+    return cart, changed
+
+
+def cart_lines(netid, db_session):
+    """
+    Read a cart with the prices stored on its lines: one flat query, no catalog pricing.
+    Same shape as price_cart, plus "stale" on each line when it was priced under an
+    older catalog version (or never priced), and the user's stored badge values as
+    "summary_count" / "summary_subtotal".
+    """
+    current_version = select(Settings.catalog_version).limit(1).scalar_subquery()
+    rows = (
+        db_session.query(
+            Cart.specifications, Cart.stripe_session_id, Cart.updated_at,
+            Users.name.label("user_name"), Users.email.label("user_email"),
+            Users.cart_count, Users.cart_subtotal,
+            CartItem.id.label("line_id"), CartItem.menu_item_id, CartItem.unit_price,
+            (func.coalesce(CartItem.catalog_version, 0) != current_version).label("stale"),
+            MenuItems.name.label("item_name"),
+            CartItemIngredient.ingredient_id, CartItemIngredient.type, CartItemIngredient.add_price,
+            Ingredients.name.label("ingredient_name"),
+        )
+        .select_from(Cart)
+        .join(Users, Users.netid == Cart.netid)
+        .outerjoin(CartItem, CartItem.cart_netid == Cart.netid)
+        .outerjoin(MenuItems, MenuItems.id == CartItem.menu_item_id)
+        .outerjoin(CartItemIngredient, CartItemIngredient.cart_item_id == CartItem.id)
+        .outerjoin(Ingredients, Ingredients.id == CartItemIngredient.ingredient_id)
+        .filter(Cart.netid == netid)
+        .order_by(CartItem.id, CartItemIngredient.type, Ingredients.name)
+        .all()
+    )
+    if not rows:
+        return None
+
+    first = rows[0]
+    cart = {
+        "specifications": first.specifications,
+        "stripe_session_id": first.stripe_session_id,
+        "updated_at": first.updated_at,
+        "user_name": first.user_name,
+        "user_email": first.user_email,
+        "summary_count": first.cart_count,
+        "summary_subtotal": first.cart_subtotal,
+        "total": 0,
+        "lines": [],
+    }
+    lines = {}
+    for row in rows:
+        if row.line_id is None:   # cart row with no items
+            continue
+        line = lines.get(row.line_id)
+        if line is None:
+            line = lines[row.line_id] = {
+                "id": row.line_id,
+                "menu_item_id": row.menu_item_id,
+                "name": row.item_name,
+                "base_price": row.unit_price,
+                "price": row.unit_price,
+                "stale": bool(row.stale) or row.unit_price is None,
+                "ingredients": [],
+            }
+            cart["lines"].append(line)
+        if row.ingredient_id is not None:
+            line["ingredients"].append({
+                "ingredient_id": row.ingredient_id,
+                "name": row.ingredient_name,
+                "type": row.type,
+                "add_price": row.add_price or 0,
+            })
+            if line["base_price"] is not None:
+                line["base_price"] -= row.add_price or 0
+    cart["total"] = sum(line["price"] or 0 for line in cart["lines"])
+    return cart
+
+
+def store_line_prices(lines, catalog_version, db_session):
+    """Write priced lines (price_cart / line_price shape) back onto their cart rows."""
+    if not lines:
+        return
+    db_session.execute(update(CartItem), [
+        {"id": line["id"], "unit_price": line["price"], "catalog_version": catalog_version}
+        for line in lines
+    ])
+    selections = [
+        {"cart_item_id": line["id"], "ingredient_id": ing["ingredient_id"], "add_price": ing["add_price"]}
+        for line in lines for ing in line["ingredients"]
+    ]
+    if selections:
+        db_session.execute(update(CartItemIngredient), selections)
+
+
+def price_cart(netid, db_session):
+    """
+    Price a user's cart in a single query: one row per (cart line, selected ingredient),
+    with the line price and the cart total computed by the database.
+
+    Returns None when the user has no cart, otherwise
+        {"specifications", "stripe_session_id", "updated_at", "user_name", "user_email",
+         "catalog_version", "total", "lines": [{"id", "menu_item_id", "name", "base_price", "price",
+                             "ingredients": [{"ingredient_id", "name", "type", "add_price"}]}]}
+    All prices are cents.
+    """
+    add_price = func.coalesce(MenuItemIngredients.add_price, 0)
+    # Each selected ingredient appears in exactly one row, so summing add-ons over the
+    # whole result is exact; base prices come from a subquery (one per line)
+    base_total = (
+        select(func.coalesce(func.sum(MenuItems.price), 0))
+        .join(CartItem, CartItem.menu_item_id == MenuItems.id)
+        .where(CartItem.cart_netid == netid)
+        .scalar_subquery()
+    )
+    current_version = select(Settings.catalog_version).limit(1).scalar_subquery()
+
+    rows = (
+        db_session.query(
+            Cart.specifications, Cart.stripe_session_id, Cart.updated_at,
+            Users.name.label("user_name"), Users.email.label("user_email"),
+            current_version.label("catalog_version"),
+            CartItem.id.label("line_id"), CartItem.menu_item_id,
+            MenuItems.name.label("item_name"), MenuItems.price.label("base_price"),
+            (MenuItems.price + func.coalesce(func.sum(add_price).over(partition_by=CartItem.id), 0))
+                .label("line_price"),
+            (base_total + func.coalesce(func.sum(add_price).over(), 0)).label("total"),
+            CartItemIngredient.ingredient_id, CartItemIngredient.type,
+            Ingredients.name.label("ingredient_name"), add_price.label("add_price"),
         )
-        add_price_map = {
-            (food_id, ingredient_id): price
-            for food_id, ingredient_id, price in results
-        }
-
-    # Calculate total price
-    total_price = 0
-    for cart_item in cart.items:
-        cart_item.effective_price = cart_item.menu_item.price
-        for cart_item_ingredient in cart_item.selected_ingredients:
-            key = (cart_item.menu_item_id, cart_item_ingredient.ingredient_id)
-            addon_price = add_price_map.get(key, 0)
-            cart_item_ingredient.addon_price = addon_price
-            cart_item.effective_price += addon_price
-        total_price += cart_item.effective_price
-
-    return total_price, cart
+        .select_from(Cart)
+        .join(Users, Users.netid == Cart.netid)
+        .outerjoin(CartItem, CartItem.cart_netid == Cart.netid)
+        .outerjoin(MenuItems, MenuItems.id == CartItem.menu_item_id)
+        .outerjoin(CartItemIngredient, CartItemIngredient.cart_item_id == CartItem.id)
+        .outerjoin(Ingredients, Ingredients.id == CartItemIngredient.ingredient_id)
+        .outerjoin(MenuItemIngredients, and_(
+            MenuItemIngredients.menu_item_id == CartItem.menu_item_id,
+            MenuItemIngredients.ingredient_id == CartItemIngredient.ingredient_id,
+        ))
+        .filter(Cart.netid == netid)
+        .order_by(CartItem.id, CartItemIngredient.type, Ingredients.name)
+        .all()
+    )
+    if not rows:
+        return None
+
+    first = rows[0]
+    cart = {
+        "specifications": first.specifications,
+        "stripe_session_id": first.stripe_session_id,
+        "updated_at": first.updated_at,
+        "user_name": first.user_name,
+        "user_email": first.user_email,
+        "catalog_version": first.catalog_version,
+        "total": first.total or 0,
+        "lines": [],
+    }
+    lines = {}
+    for row in rows:
+        if row.line_id is None:   # cart row with no items
+            continue
+        line = lines.get(row.line_id)
+        if line is None:
+            line = lines[row.line_id] = {
+                "id": row.line_id,
+                "menu_item_id": row.menu_item_id,
+                "name": row.item_name,
+                "base_price": row.base_price,
+                "price": row.line_price,
+                "ingredients": [],
+            }
+            cart["lines"].append(line)
+        if row.ingredient_id is not None:
+            line["ingredients"].append({
+                "ingredient_id": row.ingredient_id,
+                "name": row.ingredient_name,
+                "type": row.type,
+                "add_price": row.add_price,
+            })
+    return cart
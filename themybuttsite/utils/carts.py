@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import stripe
+from flask import current_app
+from sqlalchemy import exists, func, select, update
+
+from models import Cart, CartItem, CartItemIngredient, Users
+from themybuttsite.extensions import db_session
+from themybuttsite.utils.telemetry import external_call
+from themybuttsite.utils.time import service_date, service_date_bounds
+
+REAP_BATCH = 500
+STRIPE_CONCURRENCY = 8
+
+
+def sync_cart_summary(*netids):
+    """
+    Recompute the cart badge columns on Users (count, subtotal of the stored line prices,
+    locked while a Stripe session is attached) from the carts themselves, in the caller's
+    transaction. Call it before committing any change to a cart, its lines or its session.
+    """
+    if not netids:
+        return
+    db_session.flush()   # pending ORM deletes/adds must be visible to the subqueries
+    db_session.execute(
+        update(Users)
+        .where(Users.netid.in_(netids))
+        .values(
+            cart_count=select(func.count(CartItem.id))
+                .where(CartItem.cart_netid == Users.netid).scalar_subquery(),
+            cart_subtotal=select(func.coalesce(func.sum(CartItem.unit_price), 0))
+                .where(CartItem.cart_netid == Users.netid).scalar_subquery(),
+            cart_locked=exists().where(Cart.netid == Users.netid, Cart.stripe_session_id.isnot(None)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reap_carts(idle_seconds, batch_size=REAP_BATCH):
+    """
+    Delete carts untouched for `idle_seconds` or since before the current service date,
+    `batch_size` carts (with their items) per transaction so no single statement holds
+    locks on a large slice of the cart tables.
+
+    A stale cart still holding a Stripe session has the session expired first; carts whose
+    session completed (paid, webhook pending) or could not be checked are left alone and
+    retried on the next run.
+
+    Returns {"carts", "items", "sessions_expired", "sessions_kept"}.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = max(now - timedelta(seconds=idle_seconds), service_date_bounds(service_date(now))[0])
+    result = {"carts": 0, "items": 0, "sessions_expired": 0, "sessions_kept": 0}
+
+    held = (
+        db_session.query(Cart.netid, Cart.stripe_session_id)
+        .filter(Cart.updated_at < cutoff, Cart.stripe_session_id.isnot(None))
+        .all()
+    )
+    db_session.rollback()   # don't sit in a transaction while Stripe answers
+    if held:
+        released = _release_sessions([sid for _, sid in held])
+        result["sessions_expired"] = len(released)
+        result["sessions_kept"] = len(held) - len(released)
+        if released:
+            db_session.query(Cart).filter(Cart.stripe_session_id.in_(released)).update(
+                {Cart.stripe_session_id: None}, synchronize_session=False
+            )
+            sync_cart_summary(*[netid for netid, sid in held if sid in released])
+            db_session.commit()
+
+    while True:
+        # Re-checked inside every DELETE, so a cart touched mid-run survives
+        stale = select(Cart.netid).where(
+            Cart.updated_at < cutoff, Cart.stripe_session_id.is_(None)
+        )
+        netids = db_session.execute(stale.limit(batch_size)).scalars().all()
+        if not netids:
+            break
+        batch = stale.where(Cart.netid.in_(netids))
+        lines = select(CartItem.id).where(CartItem.cart_netid.in_(batch))
+
+        db_session.query(CartItemIngredient).filter(
+            CartItemIngredient.cart_item_id.in_(lines)
+        ).delete(synchronize_session=False)
+        result["items"] += db_session.query(CartItem).filter(
+            CartItem.cart_netid.in_(batch)
+        ).delete(synchronize_session=False)
+        result["carts"] += db_session.query(Cart).filter(
+            Cart.netid.in_(netids), Cart.updated_at < cutoff, Cart.stripe_session_id.is_(None)
+        ).delete(synchronize_session=False)
+        sync_cart_summary(*netids)
+        db_session.commit()
+
+    return result
+
+
+def _release_sessions(session_ids):
+    """
+    Expire the open ones among `session_ids`, a few Stripe calls at a time (Stripe has
+    no batch endpoint). Returns the ids that are now expired, i.e. safe to drop.
+    """
+    stripe.api_key = current_app.config["STRIPE_SECRET_KEY"]
+    with ThreadPoolExecutor(max_workers=STRIPE_CONCURRENCY) as pool:
+        states = list(pool.map(_expire_session, session_ids))
+    return [sid for sid, state in zip(session_ids, states) if state == "expired"]
+
+def _expire_session(session_id):
+    try:
+        with external_call("stripe"):
+            sess = stripe.checkout.Session.retrieve(session_id)
+        if sess.status != "open":
+            return sess.status   # "expired", or "complete" -> the webhook owns the cart
+        with external_call("stripe"):
+            stripe.checkout.Session.expire(session_id)
+        return "expired"
+    except Exception:
+        return None
@@ -0,0 +1,27 @@
+from models import Settings
+from themybuttsite.extensions import db_session
+
+
+def bump_menu_version():
+    """
+    Mark what the menu page shows as changed (stock labels, images, a new item), in the
+    caller's transaction. The cached menu block is keyed by this version; carts are
+    left alone.
+    """
+    db_session.query(Settings).update(
+        {Settings.menu_version: Settings.menu_version + 1}, synchronize_session=False
+    )
+
+def bump_catalog_version():
+    """
+    Mark prices as changed (item prices, add-on prices, ingredient links, deleted items),
+    in the caller's transaction: carts priced earlier get re-priced (see
+    utils/calculation.py). The menu shows prices, so the menu version moves too.
+    """
+    db_session.query(Settings).update(
+        {
+            Settings.catalog_version: Settings.catalog_version + 1,
+            Settings.menu_version: Settings.menu_version + 1,
+        },
+        synchronize_session=False,
+    )
@@ -0,0 +1,118 @@
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:     # optional: gzip only without it
+    brotli = None
+
+COMPRESSIBLE = {"text/html", "application/json"}
+# Streamed templates yield many tiny strings; compressing and flushing each one would
+# wreck both the ratio and the CPU cost, so they are batched up to this much input
+STREAM_FLUSH_BYTES = 16 * 1024
+
+
+class _Gzip:
+    encoding = "gzip"
+
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)   # 31 = gzip container
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def flush(self):
+        # Sync flush: the client can decode what we have so far (streamed pages)
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush()
+
+
+class _Brotli:
+    encoding = "br"
+
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+def choose_encoder(accept_encodings, config):
+    """
+    Brotli when the client takes it (q > 0) and the module is installed, else gzip,
+    else None. `in` on an Accept header ignores q, so "br;q=0" would still match.
+    """
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return _Brotli(config["COMPRESS_BROTLI_QUALITY"])
+    if accept_encodings.quality("gzip") > 0:
+        return _Gzip(config["COMPRESS_GZIP_LEVEL"])
+    return None
+
+def _stream(chunks, encoder):
+    try:
+        batch, pending = [], 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            batch.append(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_BYTES:
+                yield encoder.compress(b"".join(batch)) + encoder.flush()
+                batch, pending = [], 0
+        yield encoder.compress(b"".join(batch)) + encoder.finish()
+    finally:
+        close = getattr(chunks, "close", None)   # e.g. stream_with_context's cleanup
+        if close:
+            close()
+
+
+def init_compression(app):
+    """
+    Opt-in (COMPRESS_RESPONSES = "True") gzip/brotli for HTML and JSON responses.
+    Buffered bodies under COMPRESS_MIN_SIZE bytes go out as-is; streamed bodies are
+    compressed and flushed every STREAM_FLUSH_BYTES of input, so the page still renders
+    progressively.
+    Static files are left alone (built assets are precompressed, see utils.assets).
+    """
+    if app.config.get("COMPRESS_RESPONSES") != "True":
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE
+            or request.method == "HEAD"
+        ):
+            return response
+
+        streamed = response.is_streamed
+        if not streamed and (response.content_length or 0) < app.config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        encoder = choose_encoder(request.accept_encodings, app.config)
+        response.vary.add("Accept-Encoding")
+        if encoder is None:
+            return response
+
+        if streamed:
+            response.response = _stream(response.response, encoder)
+            response.headers.pop("Content-Length", None)
+        else:
+            response.set_data(encoder.compress(response.get_data()) + encoder.finish())
+        response.headers["Content-Encoding"] = encoder.encoding
+        # A strong ETag names the uncompressed bytes; the encoded body is only equivalent
+        if response.headers.get("ETag", "").startswith('"'):
+            response.headers["ETag"] = "W/" + response.headers["ETag"]
+        return response
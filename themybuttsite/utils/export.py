@@ -0,0 +1,274 @@
+import io
+import queue
+import threading
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # optional: CSV only without it
+    pa = pq = None
+
+from themybuttsite.extensions import engine_for
+from themybuttsite.utils.time import service_date_bounds
+
+FORMATS = ("csv", "parquet")
+MIMETYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Rows per server-side cursor fetch, and per Parquet row group
+EXPORT_BATCH = 10_000
+# COPY output is handed to the response in pieces of about this size...
+CHUNK_BYTES = 64 * 1024
+# ...with at most this many waiting, so a slow client stalls the COPY instead of filling memory
+QUEUE_CHUNKS = 16
+# A slow download holds the statement (or the cursor's transaction) open that long;
+# the engines' own timeouts are sized for page queries
+EXPORT_TIMEOUT_MS = 10 * 60 * 1000
+
+# Same rule as utils.time.service_date: before 1 AM local belongs to the previous night
+SERVICE_DATE_SQL = "((o.timestamp AT TIME ZONE 'America/New_York') - interval '1 hour')::date"
+
+# name -> FROM clause, ORDER BY, and (column, SQL expression, kind) per output column
+DATASETS = {
+    "orders": {
+        "from": "orders o",
+        "order_by": "o.id",
+        "columns": (
+            ("order_id", "o.id", "int"),
+            ("service_date", SERVICE_DATE_SQL, "date"),
+            ("timestamp", "o.timestamp", "timestamptz"),
+            ("netid", "o.netid", "text"),
+            ("email", "o.email", "text"),
+            ("total_price", "o.total_price", "int"),
+            ("status", "o.status", "text"),
+            ("paid", "o.paid", "bool"),
+            ("specifications", "o.specifications", "text"),
+            ("stripe_session_id", "o.stripe_session_id", "text"),
+        ),
+    },
+    "items": {
+        "from": "order_items oi JOIN orders o ON o.id = oi.order_id",
+        "order_by": "oi.order_id, oi.id",
+        "columns": (
+            ("order_item_id", "oi.id", "int"),
+            ("order_id", "oi.order_id", "int"),
+            ("service_date", SERVICE_DATE_SQL, "date"),
+            ("menu_item_id", "oi.menu_item_id", "int"),
+            ("menu_item_name", "oi.menu_item_name", "text"),
+            ("menu_item_price", "oi.menu_item_price", "int"),
+        ),
+    },
+    "ingredients": {
+        "from": (
+            "order_item_ingredients oii"
+            " JOIN order_items oi ON oi.id = oii.order_item_id"
+            " JOIN orders o ON o.id = oi.order_id"
+        ),
+        "order_by": "oi.order_id, oii.order_item_id, oii.id",
+        "columns": (
+            ("order_item_ingredient_id", "oii.id", "int"),
+            ("order_item_id", "oii.order_item_id", "int"),
+            ("order_id", "oi.order_id", "int"),
+            ("service_date", SERVICE_DATE_SQL, "date"),
+            ("ingredient_id", "oii.ingredient_id", "int"),
+            ("type", "oii.type::text", "text"),
+            ("ingredient_name", "oii.ingredient_name", "text"),
+            ("add_price", "oii.add_price", "int"),
+        ),
+    },
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _select(dataset):
+    spec = DATASETS[dataset]
+    columns = ", ".join(f'{expr} AS "{name}"' for name, expr, _ in spec["columns"])
+    return (
+        f"SELECT {columns} FROM {spec['from']}"
+        f" WHERE o.timestamp >= %(start)s AND o.timestamp < %(end)s"
+        f" ORDER BY {spec['order_by']}"
+    )
+
+def _params(start_date, end_date):
+    # Inclusive service dates -> the UTC range service_date() maps onto them
+    return {"start": service_date_bounds(start_date)[0], "end": service_date_bounds(end_date)[1]}
+
+def _prepare(cursor):
+    cursor.execute(
+        f"SET LOCAL statement_timeout = {EXPORT_TIMEOUT_MS};"
+        f" SET LOCAL idle_in_transaction_session_timeout = {EXPORT_TIMEOUT_MS};"
+        " SET LOCAL TimeZone = 'UTC'"     # CSV timestamps come out the same on any server
+    )
+
+
+# ---- CSV: COPY ... TO STDOUT --------------------------------------------------
+
+_DONE = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _Pipe:
+    """
+    The file copy_expert writes into. Gathers its many small writes into CHUNK_BYTES
+    pieces for the reading side; blocks while QUEUE_CHUNKS are waiting to be read.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        self.cancelled = threading.Event()
+        self._buffer, self._pending = [], 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._pending += len(data)
+        if self._pending >= CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.put(b"".join(self._buffer))
+            self._buffer, self._pending = [], 0
+
+    def put(self, item):
+        while True:
+            if self.cancelled.is_set():
+                raise _Cancelled()     # aborts the COPY from inside copy_expert
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def _copy_worker(sql, params, pipe):
+    conn = engine_for("replica").raw_connection()
+    broken = False
+    try:
+        with conn.cursor() as cursor:
+            _prepare(cursor)
+            copy = cursor.mogrify(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", params)
+            cursor.copy_expert(copy.decode(), pipe, size=CHUNK_BYTES)
+        conn.rollback()
+        pipe.flush()
+        pipe.put(_DONE)
+    except _Cancelled:
+        broken = True          # the server may still be mid-COPY; don't pool this connection
+    except Exception as e:
+        broken = True
+        try:
+            pipe.put(e)
+        except _Cancelled:
+            pass
+    finally:
+        if broken:
+            conn.invalidate()
+        conn.close()
+
+def _csv_chunks(dataset, params):
+    pipe = _Pipe()
+    worker = threading.Thread(
+        target=_copy_worker, args=(_select(dataset), params, pipe), name=f"export-{dataset}", daemon=True
+    )
+    worker.start()
+    try:
+        while True:
+            item = pipe.queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        pipe.cancelled.set()   # no-op when finished; stops the COPY if the client went away
+
+
+# ---- Parquet: server-side cursor -> row groups ----------------------------------
+
+class _Drain(io.RawIOBase):
+    """Write-only sink for ParquetWriter; what it's been given is taken out with take()."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks, self._position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet records byte offsets in its footer, so this counts everything ever written
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(dataset):
+    kinds = {
+        "int": pa.int64(), "text": pa.string(), "bool": pa.bool_(),
+        "date": pa.date32(), "timestamptz": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(name, kinds[kind]) for name, _, kind in DATASETS[dataset]["columns"]])
+
+def _parquet_chunks(dataset, params):
+    schema = _arrow_schema(dataset)
+    sink = _Drain()
+    conn = engine_for("replica").raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            _prepare(cursor)
+        # Named cursor = server-side: rows arrive EXPORT_BATCH at a time
+        with conn.cursor(name=f"export_{dataset}") as cursor:
+            cursor.itersize = EXPORT_BATCH
+            cursor.execute(_select(dataset), params)
+            with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+                while rows := cursor.fetchmany(EXPORT_BATCH):
+                    columns = zip(*rows)
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                        schema=schema,
+                    ))
+                    yield sink.take()
+        yield sink.take()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+# ---- entry point ----------------------------------------------------------------
+
+def export_orders(dataset, fmt, start_date, end_date):
+    """
+    Bytes of a `fmt` ("csv" / "parquet") file holding `dataset` ("orders", "items",
+    "ingredients") for service dates start_date..end_date inclusive, as an iterator of
+    chunks. Reads from the replica (or its fallback) on a connection of its own, and
+    memory stays flat however many rows match. Raises ExportError for bad arguments.
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset '{dataset}' (expected one of {', '.join(DATASETS)})")
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    if start_date > end_date:
+        raise ExportError("Start date is after end date")
+    if fmt == "parquet" and pa is None:
+        raise ExportError("Parquet export needs pyarrow installed")
+
+    params = _params(start_date, end_date)
+    if fmt == "csv":
+        return _csv_chunks(dataset, params)
+    return _parquet_chunks(dataset, params)
+
+def export_filename(dataset, fmt, start_date, end_date):
+    return f"buttery-{dataset}-{start_date.isoformat()}-to-{end_date.isoformat()}.{fmt}"
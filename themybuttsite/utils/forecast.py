@@ -0,0 +1,182 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+from models import Ingredients, Settings
+from themybuttsite.extensions import db_session, socketio
+from themybuttsite.utils.inventory import order_ingredient_uses
+from themybuttsite.utils.time import YALE_TZ, get_service_window, service_date, service_date_bounds
+
+HISTORY_NIGHTS = 28
+# Tonight's pace vs. history, smoothed with a few pseudo-uses so one early order
+# doesn't triple the projection, then clamped
+PACE_PRIOR = 5
+PACE_LIMITS = (0.5, 3.0)
+
+_lock = threading.Lock()
+_profile = {"date": None, "hours": {}}
+_alerted = {}   # (service_date, ingredient_id) -> level already pushed to staff
+
+
+def demand_profile(svc_date, nights=HISTORY_NIGHTS):
+    """
+    {ingredient_id: {local hour: average uses per night}} over the `nights` service
+    dates before `svc_date`, required ingredients included (see order_ingredient_uses).
+    Nights without orders (buttery closed) don't count.
+    """
+    start_utc = service_date_bounds(svc_date - timedelta(days=nights))[0]
+    end_utc = service_date_bounds(svc_date)[0]
+    uses = order_ingredient_uses()
+    rows = (
+        db_session.query(uses.c.ingredient_id, uses.c.timestamp)
+        .filter(uses.c.timestamp >= start_utc, uses.c.timestamp < end_utc)
+        .all()
+    )
+    uses = defaultdict(lambda: defaultdict(int))
+    open_nights = set()
+    for ingredient_id, ts in rows:
+        uses[ingredient_id][ts.astimezone(YALE_TZ).hour] += 1
+        open_nights.add(service_date(ts))
+
+    n = len(open_nights) or 1
+    return {ing: {hour: count / n for hour, count in hours.items()} for ing, hours in uses.items()}
+
+def _profile_for(svc_date):
+    # History doesn't change during the night; compute it once per service date
+    with _lock:
+        if _profile["date"] != svc_date:
+            _profile["hours"] = demand_profile(svc_date)
+            _profile["date"] = svc_date
+        return _profile["hours"]
+
+
+def _hour_segments(start, end):
+    """Split [start, end) at local hour boundaries -> (local hour, seg_start, seg_end)."""
+    t = start
+    while t < end:
+        local = t.astimezone(YALE_TZ)
+        seg_end = min(end, local.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
+        yield local.hour, t, seg_end
+        t = seg_end
+
+def _expected(hours, start, end, pace=1.0):
+    return sum(
+        hours.get(h, 0.0) * pace * (b - a).total_seconds() / 3600
+        for h, a, b in _hour_segments(start, end)
+    )
+
+def _runs_out_at(hours, pace, remaining, start, end):
+    """When cumulative expected demand from `start` reaches `remaining`, or None if not before `end`."""
+    used = 0.0
+    for h, a, b in _hour_segments(start, end):
+        rate = hours.get(h, 0.0) * pace / 3600   # uses per second
+        seg = rate * (b - a).total_seconds()
+        if rate and used + seg >= remaining:
+            return (a + timedelta(seconds=(remaining - used) / rate)).astimezone(timezone.utc)
+        used += seg
+    return None
+
+
+def forecast_stock():
+    """
+    Projection for every in-stock, quantity-tracked ingredient:
+      remaining   the live count (orders decrement it, see utils/inventory.py)
+      expected    projected further uses until the service window closes
+      runs_out_at when remaining is projected to hit zero tonight (None = it lasts)
+    """
+    tracked = (
+        db_session.query(Ingredients.id, Ingredients.name, Ingredients.stock_quantity)
+        .filter(Ingredients.stock_quantity.isnot(None), Ingredients.in_stock.is_(True))
+        .all()
+    )
+    if not tracked:
+        return []
+
+    window_start, window_end = get_service_window()
+    now = datetime.now(timezone.utc)
+
+    # Uses tonight, to compare tonight's pace against history
+    uses = order_ingredient_uses()
+    tonight_uses = dict(
+        db_session.query(uses.c.ingredient_id, func.count())
+        .filter(uses.c.ingredient_id.in_([t.id for t in tracked]),
+                uses.c.timestamp >= window_start)
+        .group_by(uses.c.ingredient_id)
+        .all()
+    )
+
+    profile = _profile_for(service_date(window_start))
+    elapsed_end = min(max(now, window_start), window_end)
+    rest_start = max(now, window_start)
+
+    out = []
+    for t in tracked:
+        hours = profile.get(t.id, {})
+        expected_so_far = _expected(hours, window_start, elapsed_end)
+        pace = (tonight_uses.get(t.id, 0) + PACE_PRIOR) / (expected_so_far + PACE_PRIOR)
+        pace = min(max(pace, PACE_LIMITS[0]), PACE_LIMITS[1])
+        remaining = t.stock_quantity
+
+        out.append({
+            "id": t.id,
+            "name": t.name,
+            "remaining": remaining,
+            "expected": round(_expected(hours, rest_start, window_end, pace), 1),
+            "runs_out_at": (None if remaining <= 0
+                            else _runs_out_at(hours, pace, remaining, rest_start, window_end)),
+        })
+    return out
+
+
+def check_stock():
+    """
+    Push a `stock_alert` to staff_updates for each ingredient that is out or projected
+    to run out tonight (once per level per night). Orders mark an ingredient out of
+    stock themselves when its count reaches zero; "out" here means staff marked it
+    back in stock without recounting.
+    """
+    settings = db_session.query(Settings).first()
+    if not settings or not settings.buttery_open:
+        return []
+
+    svc_date = service_date(get_service_window()[0])
+    alerts = []
+    for f in forecast_stock():
+        if f["remaining"] <= 0:
+            level = "out"
+            message = f"{f['name']} is marked in stock but its count is {f['remaining']}."
+        elif f["runs_out_at"] is not None:
+            level = "low"
+            at = f["runs_out_at"].astimezone(YALE_TZ).strftime("%I:%M %p").lstrip("0")
+            message = f"{f['name']}: {f['remaining']} left, projected to run out around {at}."
+        else:
+            continue
+
+        with _lock:
+            for key in [k for k in _alerted if k[0] != svc_date]:
+                del _alerted[key]
+            if _alerted.get((svc_date, f["id"])) == level:
+                continue
+            _alerted[(svc_date, f["id"])] = level
+
+        alerts.append({
+            "ingredient_id": f["id"],
+            "name": f["name"],
+            "level": level,
+            "remaining": f["remaining"],
+            "runs_out_at": f["runs_out_at"].isoformat() if f["runs_out_at"] else None,
+            "message": message,
+        })
+
+    for alert in alerts:
+        socketio.emit("stock_alert", alert, namespace="/staff", to="staff_updates")
+    return alerts
+
+def reset_alerts(ingredient_ids):
+    """Staff recounted these; let them alert again."""
+    ids = set(ingredient_ids)
+    with _lock:
+        for key in [k for k in _alerted if k[1] in ids]:
+            del _alerted[key]
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import threading
+import time
+
+from flask import current_app, request, session
+
+from models import Users
+from themybuttsite.extensions import db_session
+
+# Fingerprinted static URLs (?v=<content hash>) never change content
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Per-user pages: the browser may keep a copy but must revalidate it every time
+REVALIDATE = "private, no-cache"
+
+_fingerprints = {}   # path -> (mtime, digest)
+_fingerprint_lock = threading.Lock()
+
+
+# ---- data versions ----------------------------------------------------------
+
+def bump_order_seq(netid):
+    """Mark a user's orders as changed (new order, status, payment), in the caller's transaction."""
+    db_session.query(Users).filter_by(netid=netid).update(
+        {Users.order_seq: Users.order_seq + 1}, synchronize_session=False
+    )
+
+
+# ---- conditional GET ----------------------------------------------------------
+
+def page_etag(*versions):
+    """
+    Weak validator for a rendered page built from `versions` (the data versions it
+    depends on). Salted per process so a deploy with new templates invalidates it.
+    """
+    raw = repr((current_app.extensions["etag_salt"],) + versions).encode()
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+def not_modified(etag):
+    """
+    A 304 when the client already has `etag`, else None (render the page). Pages with
+    flashed messages waiting always render, or the message would be swallowed.
+    """
+    if "_flashes" in session or not request.if_none_match.contains_weak(etag):
+        return None
+    response = current_app.response_class(status=304)
+    return with_etag(response, etag)
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = REVALIDATE
+    return response
+
+
+# ---- static fingerprints ------------------------------------------------------
+
+def static_fingerprint(app, filename):
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    with _fingerprint_lock:
+        cached = _fingerprints.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _fingerprint_lock:
+        _fingerprints[path] = (mtime, digest)
+    return digest
+
+
+def init_http_cache(app):
+    """
+    url_for('static', ...) gets ?v=<content hash>, and static responses requested with
+    it are cached for a year (a changed file gets a new URL). Pages opt in to ETags via
+    page_etag / not_modified / with_etag.
+    """
+    app.extensions["etag_salt"] = f"{os.getpid()}:{time.time_ns()}"
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            digest = static_fingerprint(app, values["filename"])
+            if digest:
+                values["v"] = digest
+
+    @app.after_request
+    def immutable_static(response):
+        if request.endpoint == "static" and request.args.get("v") and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
@@ -1,55 +1,283 @@
-from flask import flash, current_app
-from PIL import Image, UnidentifiedImageError
-from werkzeug.utils import secure_filename
-from supabase import create_client
+from flask import flash
+from PIL import Image, ImageOps, UnidentifiedImageError
 from io import BytesIO
+import threading
+import hashlib
+import queue
+import time
+from datetime import datetime, timedelta, timezone
 
-def process_image_upload(image, name, default=None):
-    if not image or not image.filename:
-        return default
+from models import MenuItems
+from themybuttsite.extensions import db_session
+from themybuttsite.utils.storage import get_storage
+from themybuttsite.utils.catalog import bump_menu_version
+
+# Width buckets served through srcset; images are never upscaled
+VARIANT_WIDTHS = {"thumb": 320, "card": 640, "full": 1280}
+
+# ext -> (PIL format, mimetype, save options)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Keys are content-hashed, so a year is safe (Supabase emits max-age=<n>)
+IMMUTABLE_MAX_AGE = "31536000"
+KEY_PREFIX = "img"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:20]
+
+def variant_key(digest, variant, ext):
+    return f"{KEY_PREFIX}/{digest}/{variant}.{ext}"
+
+def _flatten(img):
+    """Apply EXIF orientation, then drop alpha/palette onto white for JPEG/WebP output."""
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+def build_variants(data):
+    """
+    Decode `data` once and render every width/format variant.
+    Returns (digest, variants, files) where
+      variants = {"thumb": {"width": 320, "webp": key, "jpg": key}, ...}
+      files    = [(key, bytes, mimetype), ...]
+    Output is re-encoded from pixels only, so EXIF/GPS metadata is stripped.
+    """
+    img = Image.open(BytesIO(data))
+    img.load()  # full decode; raises on truncated/corrupt files
+    img = _flatten(img)
+
+    digest = content_hash(data)
+    variants = {}
+    files = []
+    for variant, width in VARIANT_WIDTHS.items():
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.LANCZOS)
+        else:
+            resized = img
+
+        variants[variant] = {"width": resized.width}
+        for ext, (fmt, mimetype, options) in VARIANT_FORMATS.items():
+            buf = BytesIO()
+            resized.save(buf, format=fmt, **options)
+            key = variant_key(digest, variant, ext)
+            variants[variant][ext] = key
+            files.append((key, buf.getvalue(), mimetype))
+
+    return digest, variants, files
+
+def read_image_upload(image):
+    """
+    Read an uploaded file and sniff its header (no full decode, so this is cheap).
+    Returns the raw bytes, or None after flashing why the file was rejected.
+    """
     try:
-        img = Image.open(image)
-        img.verify()
         image.seek(0)
+        data = image.read()
+        Image.open(BytesIO(data))
     except UnidentifiedImageError:
         flash("Uploaded file is not a valid image.", "danger")
         return None
     except Exception as e:
         flash(f"Error verifying image: {str(e)}", "danger")
         return None
+    return data
+
+def digest_of_key(object_key):
+    """'img/<digest>/full.jpg' -> '<digest>'; None for legacy/default keys."""
+    parts = (object_key or "").split("/")
+    if len(parts) == 3 and parts[0] == KEY_PREFIX:
+        return parts[1]
+    return None
+
+def _variants_in_use(digest):
+    """Variant map of any menu item already pointing at these bytes."""
+    row = (
+        db_session.query(MenuItems.image_variants)
+        .filter(MenuItems.object_key.like(f"{KEY_PREFIX}/{digest}/%"),
+                MenuItems.image_variants.isnot(None))
+        .first()
+    )
+    return row[0] if row else None
+
+def upload_image_variants(data, storage):
+    """
+    Render and upload every variant. Returns (object_key, image_variants); raises on failure.
+    Identical bytes already referenced by a menu item are reused without rendering,
+    and variants already present in the bucket are not re-sent.
+    """
+    digest = content_hash(data)
+    variants = _variants_in_use(digest)
+    if variants:
+        return variants["full"]["jpg"], variants
+
+    present = {name for name, _ in storage.list(f"{KEY_PREFIX}/{digest}")}
+    digest, variants, files = _run_cpu_bound(build_variants, data)
+    for object_key, payload, mimetype in files:
+        if object_key.rsplit("/", 1)[-1] in present:
+            continue
+        storage.upload(object_key, payload, mimetype, IMMUTABLE_MAX_AGE)
+
+    # Single-image consumers (manage_menu, legacy rows) keep using object_key
+    return variants["full"]["jpg"], variants
+
+def release_image(object_key, storage):
+    """
+    Delete a content-addressed image once no menu item references it.
+    Legacy and default keys are never touched. Returns the number of objects removed.
+    """
+    digest = digest_of_key(object_key)
+    if not digest:
+        return 0
+    prefix = f"{KEY_PREFIX}/{digest}"
+    still_used = (
+        db_session.query(MenuItems.id)
+        .filter(MenuItems.object_key.like(prefix + "/%"))
+        .first()
+    )
+    if still_used:
+        return 0
+    keys = [f"{prefix}/{name}" for name, _ in storage.list(prefix)]
+    storage.remove(keys)
+    return len(keys)
 
-    # 2) Build key
-    extension = (image.mimetype.split("/")[-1] or "").lower()
-    if extension == "jpeg":
-        extension = "jpg"
-    filename = secure_filename((name or "image").replace(" ", "_").lower()) or "image"
-    object_key = f"{filename}.{extension or 'jpg'}"
+def release_image_async(app, object_key):
+    """Fire-and-forget release_image after a delete/replace has committed."""
+    if not digest_of_key(object_key):
+        return
 
-    # 3) Create client
-    url = current_app.config["SUPABASE_URL"]
-    key = current_app.config["SUPABASE_SERVICE_ROLE_KEY"]
-    bucket = current_app.config.get("SUPABASE_BUCKET")
-    supabase = create_client(url, key)
+    def run():
+        try:
+            release_image(object_key, get_storage(app))
+        except Exception:
+            app.logger.exception("Failed to release image %s", object_key)
+        finally:
+            db_session.remove()
 
-    # 4) Upload (file-like with a name; correct headers)
+    threading.Thread(target=run, daemon=True).start()
+
+def sweep_orphan_images(storage, grace_seconds=3600):
+    """
+    Remove content-addressed image folders that no menu item references.
+    Folders whose newest object is younger than `grace_seconds` are kept, so an
+    upload whose DB update has not landed yet is never swept.
+    Returns {"folders": n, "objects": n} removed.
+    """
+    referenced = {
+        digest_of_key(key)
+        for (key,) in db_session.query(MenuItems.object_key)
+        .filter(MenuItems.object_key.like(f"{KEY_PREFIX}/%"))
+    }
+    cutoff = time.time() - grace_seconds
+    removed = {"folders": 0, "objects": 0}
+
+    for digest, stamp in storage.list(KEY_PREFIX):
+        if stamp is not None or digest in referenced:
+            continue  # stray file at the top level, or in use
+        prefix = f"{KEY_PREFIX}/{digest}"
+        objects = storage.list(prefix)
+        if any(ts is None or ts > cutoff for _, ts in objects):
+            continue
+        storage.remove(f"{prefix}/{name}" for name, _ in objects)
+        removed["folders"] += 1
+        removed["objects"] += len(objects)
+    return removed
+
+
+# ---- background upload queue ---------------------------------------------
+
+def _run_cpu_bound(fn, *args):
+    """
+    Under the eventlet worker a green thread running PIL would stall the hub,
+    so resize/encode goes to eventlet's native thread pool when it is active.
+    """
     try:
-        image.seek(0)  # IMPORTANT: ensure we read real bytes
-        data=image.read()
-        res = supabase.storage.from_(bucket).upload(
-            path=object_key,
-            file=data,  # file-like, not raw bytes
-            file_options={
-                "content-type": image.mimetype,       # e.g. "image/jpeg"
-                "cache-control": "max-age=86400",     # string, not bare number
-                "upsert": "true",                    # string avoids header-type bug
-            },
+        from eventlet import patcher, tpool
+    except ImportError:
+        return fn(*args)
+    if patcher.is_monkey_patched("thread"):
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+# In memory only: a restart drops whatever is queued (see fail_stale_uploads)
+_jobs = queue.Queue()
+_worker_lock = threading.Lock()
+_worker_started = False
+
+def enqueue_image_upload(app, menu_item_id, data):
+    """
+    Queue an upload for a menu item already saved with image_status='pending'.
+    A single worker drains the queue in order, so the latest upload for an item wins.
+    """
+    global _worker_started
+    with _worker_lock:
+        if not _worker_started:
+            threading.Thread(target=_image_worker, args=(app,), daemon=True).start()
+            _worker_started = True
+    _jobs.put((menu_item_id, data))
+
+def _image_worker(app):
+    while True:
+        menu_item_id, data = _jobs.get()
+        try:
+            _process_image_job(app, menu_item_id, data)
+        finally:
+            _jobs.task_done()
+
+def fail_stale_uploads(max_age_seconds):
+    """
+    Mark uploads still 'pending' after `max_age_seconds` as 'failed' (manage_menu then
+    asks staff to upload again). The queue lives in memory, so a restart or crash loses
+    its jobs and their rows would otherwise stay pending forever. Returns the row count.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+    count = (
+        db_session.query(MenuItems)
+        .filter(
+            MenuItems.image_status == "pending",
+            (MenuItems.image_requested_at == None) | (MenuItems.image_requested_at < cutoff),
         )
-        # v2 client typically returns dict-like; guard both patterns
-        if isinstance(res, dict) and res.get("error"):
-            flash(f"Upload error: {res['error'].get('message')}", "danger")
-            return None
-    except Exception as e:
-        flash(f"Error uploading to Supabase: {str(e)}", "danger")
-        return None
+        .update({MenuItems.image_status: "failed"}, synchronize_session=False)
+    )
+    db_session.commit()
+    return count
+
+def _process_image_job(app, menu_item_id, data):
+    try:
+        object_key, variants = upload_image_variants(data, get_storage(app))
+        status = "ready"
+    except Exception:
+        app.logger.exception("Image upload failed for menu item %s", menu_item_id)
+        object_key, variants, status = None, None, "failed"
 
-    return object_key
+    try:
+        previous_key = (
+            db_session.query(MenuItems.object_key).filter_by(id=menu_item_id).scalar()
+        )
+        values = {"image_status": status}
+        if status == "ready":
+            values.update(object_key=object_key, image_variants=variants)
+        db_session.query(MenuItems).filter_by(id=menu_item_id).update(values)
+        bump_menu_version()   # the cached menu block still has the old image
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        db_session.remove()
+        app.logger.exception("Could not record image for menu item %s", menu_item_id)
+        return
+
+    try:
+        if status == "ready" and previous_key != object_key:
+            release_image(previous_key, get_storage(app))
+    except Exception:
+        app.logger.exception("Failed to release replaced image %s", previous_key)
+    finally:
+        db_session.remove()
@@ -0,0 +1,112 @@
+from collections import Counter
+from threading import Thread
+
+from flask import current_app
+from sqlalchemy import and_, case, select, union_all, update
+
+from models import Ingredients, MenuItemIngredients, Orders, OrderItems, OrderItemIngredient
+from themybuttsite.extensions import db_session, socketio
+from themybuttsite.utils.sheets import update_to_stock
+from themybuttsite.utils.catalog import bump_menu_version
+
+
+def order_consumption(cart_items):
+    """
+    {ingredient_id: portions} a cart uses: each item's required ingredients
+    (never stored on the cart) plus its selected choice/optional ones.
+    Needs CartItem.menu_item.menu_item_ingredients and selected_ingredients loaded.
+    """
+    counts = Counter()
+    for cart_item in cart_items:
+        counts.update(
+            link.ingredient_id for link in cart_item.menu_item.menu_item_ingredients
+            if link.type == "required"
+        )
+        counts.update(sel.ingredient_id for sel in cart_item.selected_ingredients)
+    return counts
+
+
+def order_ingredient_uses():
+    """
+    Subquery with one row (ingredient_id, timestamp) per portion a placed order used,
+    counted as order_consumption counts a cart: the selected ingredients stored with the
+    order plus each item's required ones, which orders don't store and are read from the
+    menu's current links. Filter and aggregate on its columns.
+    """
+    selected = (
+        select(OrderItemIngredient.ingredient_id, Orders.timestamp)
+        .join(OrderItems, OrderItems.id == OrderItemIngredient.order_item_id)
+        .join(Orders, Orders.id == OrderItems.order_id)
+        .where(OrderItemIngredient.ingredient_id.isnot(None))
+    )
+    required = (
+        select(MenuItemIngredients.ingredient_id, Orders.timestamp)
+        .select_from(OrderItems)
+        .join(MenuItemIngredients, and_(
+            MenuItemIngredients.menu_item_id == OrderItems.menu_item_id,
+            MenuItemIngredients.type == "required",
+        ))
+        .join(Orders, Orders.id == OrderItems.order_id)
+    )
+    return union_all(selected, required).subquery("ingredient_uses")
+
+
+def consume_stock(counts):
+    """
+    Take `counts` off every quantity-tracked ingredient in the caller's transaction,
+    with a single UPDATE ... RETURNING. Row locks serialize concurrent orders, and each
+    decrement applies to the latest committed count, so nothing is lost or double-counted.
+    Ingredients that reach zero are marked out of stock in the same statement.
+
+    Returns the (id, name, stock_quantity) rows this call took to zero or below, for
+    announce_sold_out once the order is committed.
+    """
+    counts = {i: n for i, n in counts.items() if i is not None and n > 0}
+    if not counts:
+        return []
+
+    new_quantity = Ingredients.stock_quantity - case(counts, value=Ingredients.id, else_=0)
+    stmt = (
+        update(Ingredients)
+        .where(Ingredients.id.in_(sorted(counts)), Ingredients.stock_quantity.isnot(None))
+        .values(
+            stock_quantity=new_quantity,
+            in_stock=case((new_quantity <= 0, False), else_=Ingredients.in_stock),
+        )
+        .returning(Ingredients.id, Ingredients.name, Ingredients.stock_quantity)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db_session.execute(stmt).all()
+    # Only the order that crossed zero reports it, so staff get one notice
+    return [r for r in rows if r.stock_quantity <= 0 < r.stock_quantity + counts[r.id]]
+
+
+def announce_sold_out(rows):
+    """
+    After commit: show the menu's out-of-stock labels, tell the staff dashboard and
+    refresh the Sheets stock line. The menu version moves in its own short transaction
+    so the order's doesn't hold the settings row lock.
+    """
+    if not rows:
+        return
+    try:
+        bump_menu_version()
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        current_app.logger.exception("Could not bump the menu version after a sell-out")
+    for row in rows:
+        socketio.emit(
+            "stock_alert",
+            {
+                "ingredient_id": row.id,
+                "name": row.name,
+                "level": "out",
+                "remaining": row.stock_quantity,
+                "runs_out_at": None,
+                "message": f"{row.name} sold out (count reached 0) and was marked out of stock.",
+            },
+            namespace="/staff",
+            to="staff_updates",
+        )
+    Thread(target=update_to_stock, daemon=True).start()
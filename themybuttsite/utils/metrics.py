@@ -0,0 +1,124 @@
+import threading
+
+# Seconds; tuned for web requests and outbound API calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry = {}
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+def _format_value(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with _lock:
+            items = list(self._values.items())
+        return [(self.name, key, [], v) for key, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for one label set."""
+        series = self._series.get(_label_key(labels))
+        return (series[-1], series[-2]) if series else (0, 0.0)
+
+    def samples(self):
+        with _lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        out = []
+        for key, series in items:
+            for bound, n in zip(self.buckets, series):
+                out.append((self.name + "_bucket", key, [("le", repr(bound))], n))
+            out.append((self.name + "_bucket", key, [("le", "+Inf")], series[-1]))
+            out.append((self.name + "_sum", key, [], series[-2]))
+            out.append((self.name + "_count", key, [], series[-1]))
+        return out
+
+
+def _register(cls, name, *args, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+    return metric
+
+def counter(name, help_text):
+    return _register(Counter, name, help_text)
+
+def gauge(name, help_text):
+    return _register(Gauge, name, help_text)
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help_text, buckets=buckets)
+
+
+def render_prometheus():
+    """Render every registered metric in Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, extra, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key, extra)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
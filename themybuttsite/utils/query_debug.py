@@ -0,0 +1,59 @@
+import logging
+from collections import Counter
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import raiseload
+
+log = logging.getLogger("perf")
+
+
+def _count_select(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    selects = g.get("_select_counts")
+    if selects is not None and statement.lstrip()[:6].upper() == "SELECT":
+        # Bound parameters are not part of `statement`, so an N+1 loop shows
+        # up as the same text executed over and over
+        selects[statement] += 1
+
+def _raise_on_lazy_load(state):
+    if state.is_select and not state.is_column_load and not state.is_relationship_load:
+        # sql_only: many-to-one hits already in the identity map are still allowed
+        state.statement = state.statement.options(raiseload("*", sql_only=True))
+
+
+def init_query_debug(app, engines, session):
+    """
+    Development/test aids, both off by default:
+      QUERY_DEBUG=True        count SELECTs per request (X-Query-Count header) and
+                              warn when one statement repeats QUERY_DEBUG_REPEAT+ times
+      RAISE_ON_LAZY_LOAD=True any relationship that was not eager-loaded raises
+                              instead of silently issuing a query
+    """
+    if app.config.get("RAISE_ON_LAZY_LOAD") == "True":
+        event.listen(session, "do_orm_execute", _raise_on_lazy_load)
+
+    if app.config.get("QUERY_DEBUG") != "True":
+        return
+
+    threshold = app.config.get("QUERY_DEBUG_REPEAT", 3)
+    for engine in engines:
+        event.listen(engine, "after_cursor_execute", _count_select)
+
+    @app.before_request
+    def _start_select_count():
+        g._select_counts = Counter()
+
+    @app.after_request
+    def _report_selects(resp):
+        selects = g.get("_select_counts")
+        if selects is None:
+            return resp
+        resp.headers["X-Query-Count"] = str(sum(selects.values()))
+        for statement, n in selects.most_common():
+            if n < threshold:
+                break
+            log.warning("N+1? %s %s ran the same SELECT %dx: %s",
+                        request.method, request.path, n, " ".join(statement.split())[:300])
+        return resp
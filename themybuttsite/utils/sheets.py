@@ -13,8 +13,9 @@ from sqlalchemy.orm import joinedload, selectinload
 from models import Ingredients, MenuItems, Settings, Orders, OrderItems, Users
 from themybuttsite.jinjafilters.filters import format_price
 from themybuttsite.utils.time import service_date
-from themybuttsite.extensions import db_session
+from themybuttsite.extensions import db_session, route_to
 from functools import lru_cache
+from themybuttsite.utils.telemetry import track_external
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
@@ -131,6 +132,7 @@ def ensure_date_tab():
 
     return title
 
+@track_external("sheets")
 def append_order_rows(rows):
     """
     Append a row to the first empty row at the bottom of today's tab.
@@ -232,6 +234,7 @@ def _format_order_text(order):
 
     return "\n".join(lines)
 
+@track_external("sheets")
 def update_to_stock():
     svc = _svc()
     tab = ensure_date_tab()
@@ -247,6 +250,7 @@ def update_to_stock():
     ).execute()
 
 
+@track_external("sheets")
 def update_menu_sheets():
     svc = _svc()
     tab = ensure_date_tab()
@@ -262,6 +266,7 @@ def update_menu_sheets():
     ).execute()
 
 
+@track_external("sheets")
 def update_to_announcements():
     svc = _svc()
     tab = ensure_date_tab()
@@ -275,6 +280,7 @@ def update_to_announcements():
         body={"values": [[announcements]]},
     ).execute()
 
+@track_external("sheets")
 def copy_snippet(buttery=False):
     svc = _svc()
     spreadsheet_id = os.environ["SHEETS_SPREADSHEET_ID"]
@@ -349,6 +355,7 @@ def copy_snippet(buttery=False):
     return tab
 
 
+@route_to("replica")
 def closing_buttery_effects():
     YALE_TZ = ZoneInfo("America/New_York")
     UTC_TZ  = ZoneInfo("UTC")
@@ -422,6 +429,7 @@ def closing_buttery_effects():
    
 
 
+@track_external("sheets")
 def mirror_statuses(order_statuses):
     """
     order_statuses: iterable of objects with .id, .done, .paid
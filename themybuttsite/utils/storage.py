@@ -0,0 +1,136 @@
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app
+
+from themybuttsite.utils.telemetry import track_external
+
+
+class SupabaseStorage:
+    """
+    One Supabase client per process, bound to the menu image bucket.
+    The client is built on first use so importing/booting never needs the network.
+    """
+
+    def __init__(self, url, key, bucket):
+        self.url = url
+        self.key = key
+        self.bucket = bucket
+        self._bucket_api = None
+        self._lock = threading.Lock()
+
+    def _api(self):
+        if self._bucket_api is None:
+            with self._lock:
+                if self._bucket_api is None:
+                    from supabase import create_client
+                    client = create_client(self.url, self.key)
+                    self._bucket_api = client.storage.from_(self.bucket)
+        return self._bucket_api
+
+    @track_external("supabase")
+    def upload(self, key, data, content_type, max_age):
+        res = self._api().upload(
+            path=key,
+            file=data,
+            file_options={
+                "content-type": content_type,
+                "cache-control": str(max_age),   # Supabase emits max-age=<n>
+                "upsert": "true",                # string avoids header-type bug
+            },
+        )
+        # v2 client typically returns dict-like; guard both patterns
+        if isinstance(res, dict) and res.get("error"):
+            raise RuntimeError(res["error"].get("message") or "upload failed")
+
+    @track_external("supabase")
+    def list(self, prefix):
+        """
+        Entries directly under `prefix` as (name, updated_at) pairs.
+        Folders come back with updated_at=None.
+        """
+        out, offset, page = [], 0, 1000
+        while True:
+            rows = self._api().list(prefix, {"limit": page, "offset": offset}) or []
+            for row in rows:
+                stamp = row.get("updated_at") or row.get("created_at")
+                out.append((row["name"], _parse_ts(stamp) if row.get("id") else None))
+            if len(rows) < page:
+                return out
+            offset += page
+
+    @track_external("supabase")
+    def remove(self, keys):
+        keys = list(keys)
+        if keys:
+            self._api().remove(keys)
+
+
+class LocalStorage:
+    """Filesystem stand-in for the bucket (local dev / tests): keys map to paths under `root`."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key!r}")
+        return path
+
+    def upload(self, key, data, content_type, max_age):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".part"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def list(self, prefix):
+        base = self._path(prefix) if prefix else self.root
+        if not os.path.isdir(base):
+            return []
+        out = []
+        for entry in os.scandir(base):
+            if entry.is_dir():
+                out.append((entry.name, None))
+            elif not entry.name.endswith(".part"):
+                out.append((entry.name, entry.stat().st_mtime))
+        return out
+
+    def remove(self, keys):
+        for key in keys:
+            path = self._path(key)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            parent = os.path.dirname(path)
+            if parent != self.root and not os.listdir(parent):
+                os.rmdir(parent)
+
+
+def _parse_ts(value):
+    """Supabase ISO timestamp -> epoch seconds."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+def init_storage(app):
+    backend = app.config.get("STORAGE_BACKEND") or "supabase"
+    if backend == "local":
+        storage = LocalStorage(app.config.get("STORAGE_LOCAL_DIR") or "instance/storage")
+    elif backend == "supabase":
+        storage = SupabaseStorage(
+            app.config.get("SUPABASE_URL"),
+            app.config.get("SUPABASE_SERVICE_ROLE_KEY"),
+            app.config.get("SUPABASE_BUCKET"),
+        )
+    else:
+        raise RuntimeError(f"Unknown STORAGE_BACKEND '{backend}'")
+    app.extensions["image_storage"] = storage
+    return storage
+
+def get_storage(app=None):
+    return (app or current_app).extensions["image_storage"]
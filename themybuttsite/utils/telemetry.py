@@ -0,0 +1,129 @@
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+from themybuttsite.utils import metrics
+
+SLOW_REQUEST_MS = 250
+
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_seconds", "Request latency by endpoint"
+)
+REQUEST_QUERIES = metrics.histogram(
+    "http_request_db_queries", "SQL statements executed per request",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_TIME = metrics.histogram(
+    "http_request_db_seconds", "Time spent in SQL per request"
+)
+DB_QUERY_LATENCY = metrics.histogram(
+    "db_query_seconds", "Latency of individual SQL statements"
+)
+EXTERNAL_LATENCY = metrics.histogram(
+    "external_call_seconds", "Latency of calls to Stripe, Sheets, Yalies, Supabase, ..."
+)
+EXTERNAL_ERRORS = metrics.counter(
+    "external_call_errors_total", "Failed calls to external services"
+)
+
+log = logging.getLogger("perf")
+
+
+def _request_stats():
+    """Per-request accumulator on flask.g, or None outside a request (background threads)."""
+    if not has_request_context():
+        return None
+    return g.get("_perf")
+
+
+# ---- SQL ------------------------------------------------------------------
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_perf_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        dt = time.perf_counter() - conn.info["_perf_t0"].pop()
+        DB_QUERY_LATENCY.observe(dt)
+        stats = _request_stats()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["db"] += dt
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("_perf_t0"):
+            conn.info["_perf_t0"].pop()
+
+
+# ---- external services ----------------------------------------------------
+
+@contextmanager
+def external_call(service):
+    """Time a block that talks to `service` (stripe, sheets, yalies, supabase, ...)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_ERRORS.inc(service=service)
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        EXTERNAL_LATENCY.observe(dt, service=service)
+        stats = _request_stats()
+        if stats is not None:
+            stats["external"] += dt
+
+def track_external(service):
+    """Decorator form of external_call."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with external_call(service):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---- request hooks --------------------------------------------------------
+
+def init_telemetry(app, engines):
+    if not log.handlers:
+        h = logging.StreamHandler()
+        h.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        log.addHandler(h)
+        log.setLevel(logging.INFO)
+        log.propagate = False
+
+    for engine in engines:
+        instrument_engine(engine)
+
+    @app.before_request
+    def _start_timer():
+        g._perf = {"t0": time.perf_counter(), "queries": 0, "db": 0.0, "external": 0.0}
+
+    @app.after_request
+    def _record(resp):
+        stats = g.get("_perf")
+        if stats is None:
+            return resp
+
+        dt = time.perf_counter() - stats["t0"]
+        # Label by endpoint, not path, so ids and 404 probes don't explode cardinality
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_LATENCY.observe(dt, endpoint=endpoint, method=request.method)
+        REQUEST_QUERIES.observe(stats["queries"], endpoint=endpoint)
+        REQUEST_DB_TIME.observe(stats["db"], endpoint=endpoint)
+
+        if dt * 1000 > SLOW_REQUEST_MS:
+            log.warning("SLOW %s %s %.0f ms status=%s queries=%d db=%.0f ms external=%.0f ms",
+                        request.method, request.path, dt * 1000, resp.status_code,
+                        stats["queries"], stats["db"] * 1000, stats["external"] * 1000)
+        return resp
@@ -26,3 +26,14 @@ def service_date(ts):
     """
     local_dt = ts.astimezone(YALE_TZ)
     return (local_dt - timedelta(days=1)).date() if local_dt.time() < dtime(1, 0) else local_dt.date()
+
+
+def service_date_bounds(svc_date):
+    """
+    (start_utc, end_utc) of every timestamp that service_date() maps to `svc_date`:
+    1:00 AM local on that day up to 1:00 AM the next day.
+    """
+    tz_utc = ZoneInfo("UTC")
+    start_local = datetime.combine(svc_date, dtime(1, 0), tzinfo=YALE_TZ)
+    end_local = datetime.combine(svc_date + timedelta(days=1), dtime(1, 0), tzinfo=YALE_TZ)
+    return start_local.astimezone(tz_utc), end_local.astimezone(tz_utc)
@@ -1,16 +1,18 @@
-from flask import flash, redirect, url_for
+from flask import flash, redirect, url_for, current_app
 from sqlalchemy.orm import joinedload
 from decimal import Decimal, ROUND_HALF_UP
 from sqlalchemy import and_, func
 from threading import Thread
 import json
+from datetime import datetime, timezone
 
 from models import MenuItems, MenuItemIngredients, Ingredients, Settings
 from themybuttsite.extensions import db_session
-from themybuttsite.utils.image_processing import process_image_upload
+from themybuttsite.utils.image_processing import read_image_upload, enqueue_image_upload
 from themybuttsite.utils.sheets import update_menu_sheets
+from themybuttsite.utils.catalog import bump_catalog_version, bump_menu_version
 
-def validate_item(item_id, choice_ids, optional_ids, *, flash_errors=True):
+def validate_item(item_id, choice_ids, optional_ids, *, flash_errors=True, settings=None, item=None):
     """
     Validate that:
       - inputs are ints
@@ -19,6 +21,8 @@ def validate_item(item_id, choice_ids, optional_ids, *, flash_errors=True):
       - choice/optional selections match item rules
       - required/selected ingredients are in stock
       - grill-required item allowed only if grill is open
+    Callers checking many items can pass the Settings row and the MenuItems row
+    (with menu_item_ingredients + ingredient loaded) to skip the per-item queries.
     Returns True/False.
     """
     # 1) Coerce input safely
@@ -31,21 +35,23 @@ def validate_item(item_id, choice_ids, optional_ids, *, flash_errors=True):
         return False
 
     # 2) Status: buttery must be open
-    settings = db_session.query(Settings).one()
+    if settings is None:
+        settings = db_session.query(Settings).one()
     if not settings.buttery_open:
         flash("The buttery is currently closed. You cannot add items to the cart.", "danger")
         return False
 
     # 3) Load menu item + its ingredient links + ingredient rows
-    item = (
-        db_session.query(MenuItems)
-        .options(
-            joinedload(MenuItems.menu_item_ingredients)
-            .joinedload(MenuItemIngredients.ingredient)
+    if item is None:
+        item = (
+            db_session.query(MenuItems)
+            .options(
+                joinedload(MenuItems.menu_item_ingredients)
+                .joinedload(MenuItemIngredients.ingredient)
+            )
+            .filter_by(id=item_id)
+            .first()
         )
-        .filter_by(id=item_id)
-        .first()
-    )
     if not item:
         if flash_errors: flash("Item not found.", "danger")
         return False
@@ -83,17 +89,11 @@ def validate_item(item_id, choice_ids, optional_ids, *, flash_errors=True):
         if flash_errors: flash("One or more required ingredients are out of stock.", "danger")
         return False
 
-    # 8) Stock for selected (optional + choice)
-    selected_ids = list({*optional_ids, *choice_ids})
-    if selected_ids:
-        out_of_stock = (
-            db_session.query(Ingredients)
-            .filter(and_(Ingredients.id.in_(selected_ids), Ingredients.in_stock.is_(False)))
-            .all()
-        )
-        if out_of_stock:
-            if flash_errors: flash("One or more selected ingredients are out of stock.", "danger")
-            return False
+    # 8) Stock for selected (optional + choice); 5) and 6) guarantee they are links of this item
+    linked = {mi.ingredient_id: mi.ingredient for mi in links}
+    if any((linked[i] is None) or (linked[i].in_stock is False) for i in {*optional_ids, *choice_ids}):
+        if flash_errors: flash("One or more selected ingredients are out of stock.", "danger")
+        return False
 
     # 9) Grill rule
     if item.requires_grill and not settings.grill_open:
@@ -102,6 +102,18 @@ def validate_item(item_id, choice_ids, optional_ids, *, flash_errors=True):
 
     return True
 
+def _price_signature(menu_item_id):
+    """The item's price and its (ingredient, type, add-on price) links, as stored."""
+    price = db_session.query(MenuItems.price).filter_by(id=menu_item_id).scalar()
+    links = (
+        db_session.query(
+            MenuItemIngredients.ingredient_id, MenuItemIngredients.type, MenuItemIngredients.add_price
+        )
+        .filter_by(menu_item_id=menu_item_id)
+        .all()
+    )
+    return price, frozenset(tuple(link) for link in links)
+
 def handle_menu_item_submission(request, update = False):
     name = request.form.get('name')
     price = request.form.get('price', type=float)
@@ -135,6 +147,13 @@ def handle_menu_item_submission(request, update = False):
             return redirect(url_for('staff_pages.manage_menu'))
         seen.add(ing_id)
 
+    # Only sniff the image here; resizing/uploading happens after the commit
+    image_data = None
+    if image and image.filename:
+        image_data = read_image_upload(image)
+        if image_data is None:
+            return redirect(url_for('staff_pages.manage_menu'))
+
     # ---- DB work with global db_session (no SessionLocal) ----
     # Check for duplicate names only if we're adding
     existing = db_session.query(MenuItems).filter(func.lower(MenuItems.name) == name.lower()).first()
@@ -155,33 +174,31 @@ def handle_menu_item_submission(request, update = False):
             flash('Menu item not found.', 'danger')
             return redirect(url_for('staff_pages.manage_menu'))
 
+        old_prices = _price_signature(menu_item.id)
+
         # Update fields
         menu_item.name = name
         menu_item.price = price
         menu_item.description = description
         menu_item.requires_grill = requires_grill
 
-        # Update image only if a new one was uploaded
-        if image and image.filename:
-            object_key = process_image_upload(image, name)
-            if not object_key:
-                return redirect(url_for('staff_pages.manage_menu'))
-            menu_item.object_key = object_key
+        # Keep serving the current image until the new upload lands
+        if image_data:
+            menu_item.image_status = "pending"
+            menu_item.image_requested_at = datetime.now(timezone.utc)
 
         # Clear and replace ingredient links
         db_session.query(MenuItemIngredients).filter_by(menu_item_id=menu_item.id).delete()
     else:
-        # Process image for new item
-        object_key = process_image_upload(image, name, default="default.png")
-        if object_key is None:
-            return redirect(url_for('staff_pages.manage_menu'))
-
+        # New items show the default image until their upload lands
         menu_item = MenuItems(
             name=name,
             price=price,
             description=description,
             requires_grill=requires_grill,
-            object_key=object_key,
+            object_key="default.png",
+            image_status="pending" if image_data else "ready",
+            image_requested_at=datetime.now(timezone.utc) if image_data else None,
             is_default=False
         )
         db_session.add(menu_item)
@@ -210,7 +227,16 @@ def handle_menu_item_submission(request, update = False):
             add_price=int((Decimal(str(price)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
         ))
 
+    # Carts only re-price when something they're priced from changed; a new item or a
+    # name / description / grill edit just re-renders the menu
+    db_session.flush()
+    if update and _price_signature(menu_item.id) != old_prices:
+        bump_catalog_version()
+    else:
+        bump_menu_version()
     db_session.commit()
+    if image_data:
+        enqueue_image_upload(current_app._get_current_object(), menu_item.id, image_data)
     Thread(target=update_menu_sheets, daemon=True).start()
     flash("Menu item updated successfully!" if update else "Menu item added successfully!", "success")
     return redirect(url_for('staff_pages.manage_menu'))
@@ -6,6 +6,8 @@ import stripe
 
 from models import Cart
 from themybuttsite.extensions import db_session
+from themybuttsite.utils.telemetry import external_call
+from themybuttsite.utils.carts import sync_cart_summary
 
  
                 
@@ -50,10 +52,11 @@ def cart_unlocked_required(func):
         stripe.api_key = current_app.config["STRIPE_SECRET_KEY"]
 
         try:
-            checkout_session = stripe.checkout.Session.retrieve(
-                cart.stripe_session_id,
-                expand=["payment_intent"]
-            )
+            with external_call("stripe"):
+                checkout_session = stripe.checkout.Session.retrieve(
+                    cart.stripe_session_id,
+                    expand=["payment_intent"]
+                )
         except Exception:
             flash("We’re verifying your checkout status. Please wait a moment.", "warning")
             return redirect(url_for('consumer_pages.buttery'))
@@ -67,12 +70,14 @@ def cart_unlocked_required(func):
 
         if session_status == "open" and payment_status in {"unpaid", "no_payment_required"}:
             try:
-                stripe.checkout.Session.expire(cart.stripe_session_id)
+                with external_call("stripe"):
+                    stripe.checkout.Session.expire(cart.stripe_session_id)
             except Exception:
                 flash("We’re verifying your checkout status. Please wait a moment.", "warning")
                 return redirect(url_for('consumer_pages.buttery'))
             cart.stripe_session_id = None
             cart.updated_at = sql_func.now()
+            sync_cart_summary(netid)
             db_session.commit()
             return func(*args, **kwargs)
 
@@ -80,6 +85,7 @@ def cart_unlocked_required(func):
         if session_status == "expired":
             cart.stripe_session_id = None
             cart.updated_at = sql_func.now()
+            sync_cart_summary(netid)
             db_session.commit()
             return func(*args, **kwargs)
         
@@ -1,8 +1,13 @@
 import requests
 
+from themybuttsite.utils.telemetry import track_external
+
+PEOPLE_URL = "https://api.yalies.io/v2/people"
+
 class YaliesError(Exception):
     pass
 
+@track_external("yalies")
 def fetch_profile(api_key, timeout=(5, 5), CAS_ENABLED = True, netid = None, email = None):
     
     headers = {"Authorization": f"Bearer {api_key}"}
@@ -13,7 +18,7 @@ def fetch_profile(api_key, timeout=(5, 5), CAS_ENABLED = True, netid = None, ema
 
     try:
         r = requests.post(
-            "https://api.yalies.io/v2/people",
+            PEOPLE_URL,
             json=payload,
             headers=headers,
             timeout=timeout